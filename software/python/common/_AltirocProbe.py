@@ -12,7 +12,7 @@
 import pyrogue as pr
 import common 
         
-class AltirocProbe(pr.Device):
+class AltirocProbe(common.ShiftRegisterDevice):
     def __init__(   
         self,       
         name        = "AltirocProbe",
@@ -23,21 +23,14 @@ class AltirocProbe(pr.Device):
         
         def addProbeReg(name,description,bitSize,bitOffset):
 
-            downToBitOrdering = pr.UIntReversed 
-            upToBitOrdering   = pr.UInt        
-
-            remap = divmod((bitOffset-1),32)
-            
-            self.add(pr.RemoteVariable(  
+            self.addField(
                 name        = name, 
                 description = description,
-                base        = upToBitOrdering,
-                offset      = (remap[0]<<2),
-                mode        = 'RW', 
+                base        = pr.UInt,
                 bitSize     = bitSize, 
-                bitOffset   = remap[1],
+                bitOffset   = bitOffset,
                 # value     = 0, # PROBES: Default value= all OFF (0)
-            ))         
+            )         
         
         addProbeReg(
             name        = 'en_probe_pa', 
@@ -72,24 +65,17 @@ class AltirocProbe(pr.Device):
 
         def addPixReg(name,description,bitSize,bitOffset,device,index):
 
-            downToBitOrdering = pr.UIntReversed 
-            upToBitOrdering   = pr.UInt        
-
-            remap = divmod((bitOffset-1),32)
-            
             rawName = (f'pix{index}_'+name)
             
-            self.add(pr.RemoteVariable(  
+            self.addField(
                 name        = rawName, 
                 description = description,
-                base        = upToBitOrdering,
-                offset      = (remap[0]<<2),
-                mode        = 'RW', 
+                base        = pr.UInt,
                 bitSize     = bitSize, 
-                bitOffset   = remap[1],
+                bitOffset   = bitOffset,
                 hidden      = True,
                 # value     = 0, # PROBES: Default value= all OFF (0)
-            ))        
+            )        
             
             rawVar = self.variables[rawName]
             
@@ -98,7 +84,7 @@ class AltirocProbe(pr.Device):
                 description  = description,
                 mode         = 'RW', 
                 linkedGet    = lambda: rawVar.value(),
-                linkedSet    = lambda value, write: rawVar.set(value),
+                linkedSet    = lambda value, write: rawVar.set(value, write=write),
                 dependencies = [rawVar],
                 disp         = '0x{:x}',
             ))            
@@ -218,4 +204,12 @@ class AltirocProbe(pr.Device):
                 bitOffset   = (44+(29*i)),
                 device      = pixDev,
                 index       = i,
-            )            
+            )
+
+        # Per-pixel array variables (e.g. probe_paArray), written/read as a few block transactions
+        for name in ['probe_pa','probe_vthc','probe_dig_out_disc','probe_toa','probe_tot','totf','tot_overflow','toa_busy','Hit','tot_busy','tot_ready','en_read']:
+            self.addArrayVariable(
+                name        = f'{name}Array',
+                fields      = [f'pix{i}_{name}' for i in range(25)],
+                description = f'pix[0:25].{name} as an array',
+            )
@@ -338,3 +338,14 @@ class AltirocReadout(pr.Device):
             click.secho(f'{self.path}.SeqCntRst()', bg='cyan')
             self.SeqCntReset()
         
+
+    # Read out the given pixels, in this order, through the readout index lookup table
+    def setReadoutPixels(self, pixels):
+        pixels = list(pixels)
+        if not (1 <= len(pixels) <= 25):
+            errMsg = f'{self.path}.setReadoutPixels(): {len(pixels)} pixels (must be 1 to 25)'
+            click.secho(errMsg, bg='red')
+            raise ValueError(errMsg)
+        for i, pixel in enumerate(pixels):
+            self.RdIndexLut[i].set(pixel)
+        self.ReadoutSize.set(len(pixels)-1)
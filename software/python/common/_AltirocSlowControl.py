@@ -12,7 +12,7 @@
 import pyrogue as pr
 import common 
 
-class AltirocSlowControl(pr.Device):
+class AltirocSlowControl(common.ShiftRegisterDevice):
     def __init__(   
         self,       
         name        = "AltirocSlowControl",
@@ -26,18 +26,14 @@ class AltirocSlowControl(pr.Device):
         
         def addReg(name,description,bitSize,bitOffset,value,base):
             
-            remap = divmod((bitOffset-1),32)
-        
-            self.add(pr.RemoteVariable(  
+            self.addField(
                 name        = name, 
                 description = description,
-                base        = base,
-                offset      = (remap[0]<<2),
-                mode        = 'RW', 
                 bitSize     = bitSize, 
-                bitOffset   = remap[1],
+                bitOffset   = bitOffset,
+                base        = base,
                 # value       = value, 
-            ))
+            )
         
         addReg(
             name        = 'dac', 
@@ -665,5 +661,7 @@ class AltirocSlowControl(pr.Device):
             mode         = 'RW',
             base         = pr.UInt,
             value       = 0x1,
-        ))         
+        ))
         
+        # Per-pixel array variables (e.g. bit_vth_corArray), written/read as a few block transactions
+        self.addArrayVariables()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the 
+## top-level directory of this distribution and at: 
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html. 
+## No part of 'ATLAS ALTIROC DEV', including this file, 
+## may be copied, modified, propagated, or distributed except according to 
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import time
+import threading
+import collections
+import click
+
+import pyrogue as pr
+
+# One planned block transaction: words [first, first+numWords) of a device and the variables in them
+BlockRead = collections.namedtuple('BlockRead', ['device', 'first', 'numWords', 'variables'])
+
+# Device is enabled (and so are all its parents)
+def DeviceEnabled(dev):
+    while isinstance(dev, pr.Device):
+        if (dev.enable.value() is False):
+            return False
+        dev = dev.parent
+    return True
+
+# Load [(variable, value), ...] of "dev" that are already in the hardware (read back, or written
+# and verified) into the variable shadows and notify their listeners (GUI, SemMonitor, ...):
+# set(write=False) goes through the block, checkBlocks() then runs the variable update path.
+# Blocks without a pending write before are left in sync with the hardware, so a later
+# writeBlocks() does not write them back (pyrogue has no public call to clear the pending
+# write of a block: this is the one place that does it)
+def LoadShadow(dev, values):
+    values  = list(values)
+    pending = {}
+    for var, value in values:
+        pending.setdefault(var._block, var._block.stale)
+    for var, value in values:
+        var.set(value, write=False)
+    for block, stale in pending.items():
+        if not stale:
+            block._stale = False
+    dev.checkBlocks(recurse=False)
+
+class BlockReadPlanner(object):
+    '''
+    Coalesces the register reads of a set of devices into contiguous SRP block transactions.
+
+    pyrogue reads every block of a device (the variables that share a 32-bit word) in a
+    transaction of its own, so a ReadAll of AltirocTrig alone is about 30 round trips. The
+    planner takes the address map of each device, merges the words of adjacent registers
+    (no gaps, so no address is read that pyrogue would not read) into runs of up to
+    maxWords words, reads each run with one _rawRead() and updates the variables from the
+    words. Variables of a base that is not decoded here are read by pyrogue as before.
+
+    planner = BlockReadPlanner([top.Fpga[0].Asic, top.Fpga[0].Sem])
+    planner.read()
+    planner.report()
+
+    select(var) restricts the plan to some of the variables (see BlockPoller).
+    '''
+    def __init__(self, devices, maxWords=256, select=None):
+        self.maxWords = maxWords
+        self.select   = select
+        self.runs     = []
+        self.fallback = []
+        self.stats    = collections.OrderedDict()
+        self.planned  = set()
+
+        for root in devices:
+            for dev in [root] + list(root.find(typ=pr.Device)):
+                self.planned.add(dev.path)
+                variables = [var for var in dev.variables.values() if self._readable(var)]
+                if variables:
+                    self._plan(dev, variables)
+
+    def _readable(self, var):
+        if (not isinstance(var, pr.RemoteVariable)) or isinstance(var, pr.BaseCommand):
+            return False
+        if (var.mode == 'WO') or (var.offset is None):
+            return False
+        return (self.select is None) or self.select(var)
+
+    # Words [first, last] of the device that hold a variable
+    @staticmethod
+    def _span(var):
+        top = max(offset+size for offset, size in zip(var.bitOffset, var.bitSize))
+        return (var.offset >> 2, (var.offset + ((top+7) >> 3) - 1) >> 2)
+
+    def _plan(self, dev, variables):
+        spans = sorted([(self._span(var), var) for var in variables], key=lambda span: span[0])
+
+        # pyrogue blocks: only variables that overlap in address are accessed together
+        blocks = 0
+        end    = None
+        for (first, last), var in spans:
+            if (end is None) or (first > end):
+                blocks += 1
+                end = last
+            end = max(end, last)
+
+        # Planned runs: overlapping and adjacent words, up to maxWords per run
+        runs     = []
+        fallback = []
+        run      = None
+        for (first, last), var in spans:
+            if _decoder(var) is None:
+                fallback.append(var)
+            elif (run is not None) and (first <= run[1]+1) and (max(last, run[1])-run[0] < self.maxWords):
+                run[1] = max(run[1], last)
+                run[2].append(var)
+            else:
+                run = [first, last, [var]]
+                runs.append(run)
+
+        self.runs     += [BlockRead(dev, first, last-first+1, variables) for first, last, variables in runs]
+        self.fallback += fallback
+        self.stats[dev.path] = (len(variables), blocks, len(runs)+len(fallback))
+
+    # Read all the planned runs of the enabled devices and update (and notify) their variables
+    def read(self):
+        loaded = collections.OrderedDict()
+        for run in self.runs:
+            if not DeviceEnabled(run.device):
+                continue
+            words = run.device._rawRead(run.first*4, run.numWords)
+            if run.numWords == 1:
+                words = [words]
+            image = 0
+            for i, word in enumerate(words):
+                image |= int(word) << (32*i)
+            loaded.setdefault(run.device, []).extend(
+                (var, _decoder(var)(var, image >> (8*var.offset - 32*run.first))) for var in run.variables)
+        for dev, values in loaded.items():
+            LoadShadow(dev, values)
+        for var in self.fallback:
+            if DeviceEnabled(var.parent):
+                var.get()
+
+    # ReadAll of a tree: the planned devices with block reads, all the others through pyrogue
+    def readAll(self, root):
+        others = [dev for dev in [root] + list(root.find(typ=pr.Device)) if dev.path not in self.planned]
+        for dev in others:
+            dev.readBlocks(recurse=False)
+        self.read()
+        for dev in others:
+            dev.checkBlocks(recurse=False)
+
+    # Number of transactions of a read as (pyrogue blocks, planned block reads)
+    def transactions(self):
+        return (sum(stat[1] for stat in self.stats.values()), sum(stat[2] for stat in self.stats.values()))
+
+    def report(self):
+        print(f'{"Device":<40} {"Variables":>9} {"pyrogue":>8} {"planned":>8}')
+        for path, (numVars, blocks, reads) in self.stats.items():
+            print(f'{path:<40} {numVars:>9} {blocks:>8} {reads:>8}')
+        before, after = self.transactions()
+        numVars = sum(stat[0] for stat in self.stats.values())
+        print(f'{"Total":<40} {numVars:>9} {before:>8} {after:>8}')
+
+#################################################################
+
+def _bits(var, image):
+    value = 0
+    shift = 0
+    for offset, size in zip(var.bitOffset, var.bitSize):
+        value |= ((image >> offset) & ((1 << size)-1)) << shift
+        shift += size
+    return value, shift
+
+def _decodeUInt(var, image):
+    return _bits(var, image)[0]
+
+def _decodeInt(var, image):
+    value, size = _bits(var, image)
+    return value - (1 << size) if value >> (size-1) else value
+
+def _decodeUIntReversed(var, image):
+    value, size = _bits(var, image)
+    return int(format(value, f'0{size}b')[::-1], 2)
+
+def _decodeBool(var, image):
+    return bool(_bits(var, image)[0])
+
+# Decoder of a variable's base, None if it is read by pyrogue
+def _decoder(var):
+    base = var._base if isinstance(var._base, type) else type(var._base)
+    for model, decode in [(pr.UIntReversed, _decodeUIntReversed), (pr.Int, _decodeInt), (pr.UInt, _decodeUInt), (pr.Bool, _decodeBool)]:
+        if issubclass(base, model):
+            return decode
+    return None
+
+#################################################################
+
+class BlockPoller(object):
+    '''
+    Polls the variables with a pollInterval through a BlockReadPlanner instead of the pyrogue
+    poll queue (one block transaction per run of adjacent registers and interval, instead of
+    one per register). The planned variables are taken off the pyrogue poll queue
+    (pollInterval = 0) while the poller owns them, every poll notifies their listeners like
+    a pyrogue poll does (see LoadShadow()); stop() gives them back.
+    '''
+    def __init__(self, root, devices, maxWords=256):
+        self.root      = root
+        self.intervals = {}
+        self._plans    = {}
+        self._thread   = None
+        self._stop     = threading.Event()
+
+        # One plan per poll interval
+        planner = BlockReadPlanner(devices, maxWords=maxWords, select=lambda var: bool(var.pollInterval))
+        for var in [var for run in planner.runs for var in run.variables] + planner.fallback:
+            self.intervals[var] = var.pollInterval
+        for interval in sorted(set(self.intervals.values())):
+            self._plans[interval] = BlockReadPlanner(devices, maxWords=maxWords,
+                                                     select=lambda var, interval=interval: var.pollInterval == interval)
+
+    def start(self):
+        for var in self.intervals:
+            var.pollInterval = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        for var, interval in self.intervals.items():
+            var.pollInterval = interval
+
+    def _run(self):
+        due = {interval: time.monotonic() for interval in self._plans}
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if self.root.PollEn.value():
+                for interval, planner in self._plans.items():
+                    if now >= due[interval]:
+                        due[interval] = now + interval
+                        try:
+                            planner.read()
+                        except Exception as e:
+                            click.secho(f'BlockPoller: {e}', fg='yellow')
+            wait = min(due.values()) - time.monotonic() if due else 1.0
+            self._stop.wait(max(wait, 0.01))
+
+    def report(self):
+        for interval, planner in self._plans.items():
+            before, after = planner.transactions()
+            print(f'Poll interval {interval} s: {before} pyrogue transactions -> {after} block reads')
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the 
+## top-level directory of this distribution and at: 
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html. 
+## No part of 'ATLAS ALTIROC DEV', including this file, 
+## may be copied, modified, propagated, or distributed except according to 
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import time
+import click
+
+# CalPulseCount is a 16-bit "zero inclusive" register: one Start fires up to 0x10000 pulses
+CalPulseMaxTrain = 0x10000
+
+# Default spacing of the pulses of a train: 1 ms (1/40MHz units, zero inclusive). The trigger
+# block drops every cal pulse that arrives before the readout of the previous one is complete
+CalPulseDefaultDelay = 40000-1
+
+class CalPulseSweep(object):
+    '''
+    Fires calibration pulse bursts and waits for the resulting events.
+
+    On the V2 ASIC a burst is one hardware pulse train per 0x10000 pulses: CalPulseCount is
+    programmed to the number of pulses (minus one) and CalPulse.Start() is issued once.
+    Completion is signalled by the EventReader that is connected to the data stream
+    (reader.waitCount()), so there is no fixed sleep or busy loop. A train is only armed once
+    the events of the previous one have arrived, as writing CalPulseCount aborts a running
+    train. The V1 ASIC has to reset its RAM/TDC before every pulse (LegacyV1AsicCalPulseStart),
+    so the pulses are paced in software there.
+
+    pulseDelay (CalPulseDelay) must leave time for the readout of every pulse, the pulses that
+    arrive during a readout are dropped (Trig.CalPulseTrigDropCnt). None keeps the YAML value.
+
+    sweep = CalPulseSweep(top.Fpga[0].Asic, dataStream, asicVersion=2)
+    for value in sweep.sweep(top.Fpga[0].Asic.Gpio.DlyCalPulseSet, range(0, 2500, 10), 50):
+        ...
+    '''
+    def __init__(self, asic, reader, asicVersion=2, pulseDelay=CalPulseDefaultDelay, timeout=10.0, softPace=0.001):
+        self.asic        = asic
+        self.reader      = reader
+        self.asicVersion = asicVersion
+        self.timeout     = timeout
+        self.softPace    = softPace
+        self._count      = None
+
+        # Spacing between the pulses of a train (1/40MHz units, zero inclusive)
+        if (asicVersion == 1):
+            self.pulsePeriod = softPace
+        else:
+            if pulseDelay is not None:
+                self.asic.CalPulse.CalPulseDelay.set(pulseDelay)
+            self.pulsePeriod = (self.asic.CalPulse.CalPulseDelay.get()+1)*25.0E-9
+
+    # Only write CalPulseCount when it changes
+    def _setCount(self, count):
+        if count != self._count:
+            self.asic.CalPulse.CalPulseCount.set(count-1)
+            self._count = count
+
+    # Fire one train of nPulses calibration pulses without waiting for the data
+    def fire(self, nPulses):
+        if (self.asicVersion == 1):
+            for i in range(nPulses):
+                self.asic.LegacyV1AsicCalPulseStart()
+                time.sleep(self.softPace)
+        else:
+            if nPulses > CalPulseMaxTrain:
+                errMsg = f'CalPulseSweep.fire(): nPulses = {nPulses} > {CalPulseMaxTrain} (use burst())'
+                click.secho(errMsg, bg='red')
+                raise ValueError(errMsg)
+            self._setCount(nPulses)
+            self.asic.CalPulse.Start()
+
+    # Fire nPulses calibration pulses and wait until nPulses events have been received.
+    # Returns False if the events of a train did not arrive within the timeout
+    def burst(self, nPulses):
+        start = self.reader.count
+        drops = self.asic.Trig.CalPulseTrigDropCnt.get()
+        fired = 0
+        while fired < nPulses:
+            count = nPulses-fired if (self.asicVersion == 1) else min(nPulses-fired, CalPulseMaxTrain)
+            self.fire(count)
+            fired += count
+            if not self.reader.waitCount(start+fired, timeout=self.timeout + count*self.pulsePeriod):
+                dropped = self.asic.Trig.CalPulseTrigDropCnt.get() - drops
+                errMsg = (f'CalPulseSweep: received {self.reader.count-start} of {nPulses} events within the timeout, '
+                          f'{dropped} cal pulse triggers dropped (CalPulseTrigDropCnt)')
+                click.secho(errMsg, fg='yellow')
+                return False
+        return True
+
+    # Set "variable" to each of "values" and fire a burst of nPulses at every step
+    def sweep(self, variable, values, nPulses):
+        for value in values:
+            variable.set(value)
+            self.burst(nPulses)
+            yield value
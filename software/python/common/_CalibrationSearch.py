@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the 
+## top-level directory of this distribution and at: 
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html. 
+## No part of 'ATLAS ALTIROC DEV', including this file, 
+## may be copied, modified, propagated, or distributed except according to 
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import math
+import threading
+import numpy as np
+import click
+
+import common
+
+class HitCounter(common.EventReader):
+    '''
+    Counts, per PixelIndex, the events with a valid TOA hit (Hit set, no TOA overflow)
+    and histograms their TOA codes. Used as the stream reader of a CalibrationSearch.
+    '''
+    def __init__(self):
+        super().__init__()
+        self.hits    = np.zeros(common.NumPixelIndex, dtype=np.int64)
+        self.toaHist = common.PixelHistogram(common.ToaCodes)
+        self.lock    = threading.Lock()
+
+    def processFrame(self, frame, channel=0):
+        pixData = self.decoder.decode(frame).pixData
+        valid   = (pixData['Hit'] > 0) & (pixData['ToaOverflow'] == 0)
+        pixels  = np.unique(pixData['PixelIndex'][valid])
+        with self.lock:
+            self.hits[pixels] += 1
+            self.toaHist.fill(pixData['PixelIndex'], pixData['ToaData'], mask=valid)
+
+    def reset(self):
+        with self.lock:
+            self.hits[:] = 0
+            self.toaHist.reset()
+
+#################################################################
+
+# Sequential probability ratio test (Wald) results
+EffOff       = 0
+EffOn        = 1
+EffUndecided = -1
+
+class EfficiencyTest(object):
+    '''
+    Sequential probability ratio test of the hit efficiency of a pixel at one setting:
+    H0 "off" (efficiency <= p0) against H1 "on" (efficiency >= p1), with error rates
+    alpha (false "on") and beta (false "off"). Pulses are fired "chunk" at a time until
+    every pixel is decided; after maxPulses the undecided pixels are decided by majority.
+    '''
+    def __init__(self, p0=0.2, p1=0.8, alpha=0.05, beta=0.05, chunk=4, maxPulses=64):
+        self.chunk     = chunk
+        self.maxPulses = maxPulses
+        self.llrHit    = math.log(p1/p0)
+        self.llrMiss   = math.log((1-p1)/(1-p0))
+        self.upper     = math.log((1-beta)/alpha)
+        self.lower     = math.log(beta/(1-alpha))
+
+    # EffOn/EffOff/EffUndecided for each entry of "hits" after "pulses" pulses
+    def decide(self, hits, pulses):
+        hits   = np.asarray(hits)
+        llr    = hits*self.llrHit + (pulses-hits)*self.llrMiss
+        states = np.full(len(hits), EffUndecided, dtype=np.int8)
+        states[llr >= self.upper] = EffOn
+        states[llr <= self.lower] = EffOff
+        if pulses >= self.maxPulses:
+            undecided = (states == EffUndecided)
+            states[undecided] = np.where(2*hits[undecided] >= pulses, EffOn, EffOff)
+        return states
+
+#################################################################
+
+# Number of pixel columns of the ASIC matrix (pixel = PixelColumns*row + column)
+PixelColumns = 5
+
+# Splits "pixels" into groups that can be injected and calibrated at the same time: two pixels
+# of a group are at least "spacing" rows or columns apart (spacing=2: no direct or diagonal
+# neighbours, 4 groups for the 25 pixels). spacing=0 returns one group per pixel
+def CrosstalkSafeGroups(pixels=range(25), spacing=2, columns=PixelColumns):
+    if spacing <= 0:
+        return [[pixel] for pixel in pixels]
+    groups = {}
+    for pixel in pixels:
+        row, col = divmod(pixel, columns)
+        groups.setdefault((row % spacing, col % spacing), []).append(pixel)
+    return [groups[key] for key in sorted(groups)]
+
+#################################################################
+
+class CalibrationSearch(object):
+    '''
+    Finds the TOA efficiency turn-on and turn-off edges of pixels along a delay (or any
+    other) variable with as few calibration pulses as possible.
+
+    A coarse scan from low to high in coarseStep locates the efficient window of every
+    pixel, then each edge is bisected down to "resolution". At every point pulses are only
+    fired until the EfficiencyTest is decided, and every result is cached, so points shared
+    by several pixels or edges are measured once. Several pixels can be injected together
+    (see CrosstalkSafeGroups()): the hits are split by PixelIndex in the HitCounter and
+    every pixel gets its own edges from the same pulses. The pulses spent are kept in
+    self.pulses (total) and self.points ([(value, pulses), ...]).
+
+    counter = HitCounter()
+    pyrogue.streamTap(top.dataStream[0], counter)
+    sweep   = CalPulseSweep(top.Fpga[0].Asic, counter)
+    search  = CalibrationSearch(sweep, counter, top.Fpga[0].Asic.Gpio.DlyCalPulseSet, pixels=[4])
+    edges   = search.edges() # {pixel: (turnOn, turnOff) or None}
+    '''
+    def __init__(self, sweep, counter, variable, pixels=(0,), test=None, low=0, high=4000, coarseStep=100, resolution=2):
+        self.sweep      = sweep
+        self.counter    = counter
+        self.variable   = variable
+        self.pixels     = list(pixels)
+        self.test       = test if test is not None else EfficiencyTest()
+        self.low        = low
+        self.high       = high
+        self.coarseStep = coarseStep
+        self.resolution = resolution
+        self.pulses     = 0
+        self.points     = []
+        self._cache     = {}
+
+    # Sets the variable and clears the counter before a measurement
+    def _setPoint(self, value):
+        self.variable.set(value)
+        self.counter.reset()
+
+    # Efficiency state (EffOn/EffOff) of the given pixels at "value"
+    def measure(self, value, pixels=None):
+        pixels = self.pixels if pixels is None else list(pixels)
+        states = self._cache.setdefault(value, {})
+        todo   = [pixel for pixel in pixels if pixel not in states]
+
+        if todo:
+            self._setPoint(value)
+            pulses  = 0
+            decided = np.full(len(todo), EffUndecided, dtype=np.int8)
+            while (decided == EffUndecided).any():
+                n = min(self.test.chunk, self.test.maxPulses-pulses)
+                self.sweep.burst(n)
+                pulses += n
+                with self.counter.lock:
+                    hits = self.counter.hits[todo]
+                decided = self.test.decide(hits, pulses)
+            states.update(zip(todo, decided.tolist()))
+
+            # The other injected pixels saw the same pulses: keep the ones that are decided too
+            others = [pixel for pixel in self.pixels if pixel not in states]
+            if others:
+                with self.counter.lock:
+                    hits = self.counter.hits[others]
+                for pixel, state in zip(others, self.test.decide(hits, pulses).tolist()):
+                    if state != EffUndecided:
+                        states[pixel] = state
+            self.pulses += pulses
+            self.points.append((value, pulses))
+
+        return np.array([states[pixel] for pixel in pixels], dtype=np.int8)
+
+    # Bisects between an "off" and an "on" value (either order), returns the "on" side of the edge
+    def _bisect(self, pixel, off, on):
+        while abs(on-off) > self.resolution:
+            mid = (on+off)//2
+            if self.measure(mid, [pixel])[0] == EffOn:
+                on = mid
+            else:
+                off = mid
+        return on
+
+    # {pixel: (turnOn, turnOff)} of the efficient window, None for pixels without hits
+    def edges(self):
+        values = list(range(self.low, self.high, self.coarseStep))
+        coarse = np.array([self.measure(value) for value in values])
+
+        result = {}
+        for i, pixel in enumerate(self.pixels):
+            on = np.flatnonzero(coarse[:,i] == EffOn)
+            if len(on) == 0:
+                result[pixel] = None
+                continue
+            first, last = on[0], on[-1]
+
+            # Edges at the boundary of the scan range are not bisected any further
+            turnOn  = values[first] if first == 0             else self._bisect(pixel, values[first-1], values[first])
+            turnOff = values[last]  if last == len(values)-1 else self._bisect(pixel, values[last+1], values[last])
+            result[pixel] = (turnOn, turnOff)
+
+        return result
+
+    # True for the pixels whose TOA mean at the current point is known well enough: decided
+    # "off" by the EfficiencyTest (no usable mean) or "on" with a standard error of the mean
+    # (quantization included) below meanError TOA codes
+    def _scanDone(self, pixels, pulses, meanError):
+        with self.counter.lock:
+            hits   = self.counter.hits[pixels]
+            count  = np.array([self.counter.toaHist.count(pixel) for pixel in pixels])
+            std    = np.array([self.counter.toaHist.std(pixel)   for pixel in pixels])
+        states = self.test.decide(hits, pulses)
+        error  = np.sqrt(np.square(std) + 1/12) / np.sqrt(np.maximum(count, 1))
+        return (states == EffOff) | ((states == EffOn) & (error <= meanError))
+
+    # Fires up to nPulses at each of "values" and returns the per-pixel TOA (count, mean, std)
+    # arrays [value, pixel]. With meanError set, the pulses are fired test.chunk at a time and a
+    # point stops as soon as _scanDone() holds for every pixel whose range (ranges: {pixel: values},
+    # default all of "values") contains it
+    def scan(self, values, nPulses, meanError=None, ranges=None):
+        values = list(values)
+        ranges = {} if ranges is None else {pixel: set(r) for pixel, r in ranges.items()}
+        count  = np.zeros((len(values), len(self.pixels)), dtype=np.int64)
+        mean   = np.zeros((len(values), len(self.pixels)))
+        std    = np.zeros((len(values), len(self.pixels)))
+
+        for i, value in enumerate(values):
+            self._setPoint(value)
+            pixels = [pixel for pixel in self.pixels if pixel not in ranges or value in ranges[pixel]]
+            pulses = 0
+            while pulses < nPulses:
+                n = nPulses-pulses if meanError is None else min(self.test.chunk, nPulses-pulses)
+                self.sweep.burst(n)
+                pulses += n
+                if meanError is not None and self._scanDone(pixels, pulses, meanError).all():
+                    break
+            self.pulses += pulses
+            self.points.append((value, pulses))
+            with self.counter.lock:
+                for j, pixel in enumerate(self.pixels):
+                    count[i,j] = self.counter.toaHist.count(pixel)
+                    mean[i,j]  = self.counter.toaHist.mean(pixel)
+                    std[i,j]   = self.counter.toaHist.std(pixel)
+
+        return count, mean, std
+
+    def report(self):
+        click.secho(f'CalibrationSearch: {self.pulses} pulses at {len(self.points)} points', fg='green')
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the 
+## top-level directory of this distribution and at: 
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html. 
+## No part of 'ATLAS ALTIROC DEV', including this file, 
+## may be copied, modified, propagated, or distributed except according to 
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import os
+import re
+import json
+import hashlib
+import yaml
+import click
+import pyrogue as pr
+
+import common
+
+#################################################################
+# Compiled configuration snapshots
+#
+# A stack of YAML configuration files is compiled once into one stage of
+# (RemoteVariable path, value) register settings per file: the YAML parsing, the
+# wildcard resolution ("Fpga[:]", "bit_vth_cor[:]", ...) and the enum/LinkVariable
+# conversions are done at compile time. The snapshot is cached on disk, keyed by
+# the contents of the files and by the layout of the device tree, and reloaded
+# stage by stage (like one LoadConfig per file) with one block transaction per
+# shift register device plus the block writes of the other devices.
+#################################################################
+
+# Format of the cached snapshots (part of the cache key)
+ConfigSnapshotVersion = 3
+
+# Hash of the register layout of a tree: a snapshot is only valid for the tree it was compiled for
+def ConfigTreeVersion(root):
+    h = hashlib.sha256()
+    for var in root.find(typ=pr.RemoteVariable):
+        h.update(f'{var.path},{var.address:#x},{var.bitOffset},{var.bitSize},{var.mode};'.encode())
+    return h.hexdigest()
+
+# Cache key of a stack of YAML files for a tree
+def ConfigSnapshotKey(root, files):
+    h = hashlib.sha256(f'{ConfigSnapshotVersion};{ConfigTreeVersion(root)}'.encode())
+    for path in files:
+        with open(path, 'rb') as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+# Nodes of "node" matching a YAML key: "Name", "Name[3]", "Name[1:4]", "Name[:]" or "Name[*]"
+def _matchNodes(node, key):
+    nodes = node.nodes
+    if key in nodes:
+        return [nodes[key]]
+
+    match = re.match(r'^(\w+)\[(.*)\]$', key)
+    if match is None:
+        return []
+    name, sel = match.groups()
+
+    array = {}
+    for childName, child in nodes.items():
+        childMatch = re.match(r'^(\w+)\[(\d+)\]$', childName)
+        if childMatch and (childMatch.group(1) == name):
+            array[int(childMatch.group(2))] = child
+    array = [array[i] for i in sorted(array)]
+
+    if sel in ['*', ':']:
+        return array
+    if ':' in sel:
+        return array[slice(*[int(s) if s != '' else None for s in sel.split(':')])]
+    return []
+
+# Variables excluded from the configuration files (pyrogue "NoConfig" group)
+def _noConfig(var):
+    return hasattr(var, 'inGroup') and var.inGroup('NoConfig')
+
+# Resolve a YAML dictionary against the tree into {variable path: (variable, value)}.
+# The settings that are not applied are described in "warnings"
+def _resolveDict(node, d, out, warnings):
+    for key, value in d.items():
+        children = _matchNodes(node, key)
+        if not children:
+            warnings.append(f'{node.path}.{key} not found')
+        for child in children:
+            if isinstance(value, dict):
+                _resolveDict(child, value, out, warnings)
+            elif not isinstance(child, pr.BaseVariable):
+                warnings.append(f'{child.path} is not a variable')
+            elif child.mode not in ['RW', 'WO']:
+                warnings.append(f'{child.path} is {child.mode}, skipped')
+            elif _noConfig(child):
+                warnings.append(f'{child.path} is NoConfig, skipped')
+            else:
+                out.pop(child.path, None)
+                out[child.path] = (child, value)
+
+class ConfigSnapshot(object):
+    '''
+    Compiled stack of YAML configuration files.
+
+    snapshot = ConfigSnapshot.get(top, ['config/defaults.yml', 'config/testBojanV2.yml'])
+    snapshot.load(top)
+
+    get() returns the cached snapshot if the files and the tree did not change and compiles
+    (and caches) it otherwise, in the .snapshots directory next to the first (default) file.
+    Compiling sets the shadow values of the tree (no hardware access); load() then writes them.
+    The settings that cannot be compiled into register writes (unknown keys, read-only, NoConfig
+    and local variables) are kept in self.warnings and reported by every load().
+    '''
+    def __init__(self, key, files, stages, warnings=()):
+        self.key      = key
+        self.files    = list(files)
+        self.stages   = stages # One [(RemoteVariable path, value), ...] per file, in load order
+        self.warnings = list(warnings)
+
+    @staticmethod
+    def cachePath(key, cacheDir):
+        return os.path.join(cacheDir, f'{key}.json')
+
+    @classmethod
+    def get(cls, root, files, cacheDir=None):
+        files = [path for path in files if path != '']
+        key   = ConfigSnapshotKey(root, files)
+        if cacheDir is None:
+            cacheDir = os.path.join(os.path.dirname(os.path.abspath(files[0])), '.snapshots')
+        path  = cls.cachePath(key, cacheDir)
+
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            return cls(key, data['files'], [[tuple(entry) for entry in stage] for stage in data['stages']], data['warnings'])
+
+        snapshot = cls.compile(root, files, key)
+        os.makedirs(cacheDir, exist_ok=True)
+        with open(path+'.tmp', 'w') as f:
+            json.dump({'files': snapshot.files, 'stages': snapshot.stages, 'warnings': snapshot.warnings}, f)
+        os.replace(path+'.tmp', path)
+        return snapshot
+
+    @classmethod
+    def compile(cls, root, files, key=None):
+        if key is None:
+            key = ConfigSnapshotKey(root, files)
+
+        # One stage per file, in order: a file is resolved on top of the shadow left by the previous ones
+        stages   = []
+        warnings = []
+        for path in files:
+            settings = {}
+            with open(path) as f:
+                d = yaml.safe_load(f)
+            for rootName, value in d.items():
+                if (rootName == root.name) and isinstance(value, dict):
+                    _resolveDict(root, value, settings, warnings)
+                else:
+                    warnings.append(f'{path}: {rootName} not found')
+
+            # Let the variables convert the values (enums, link variables, ...) into their shadow
+            for var, value in settings.values():
+                if isinstance(value, str):
+                    var.setDisp(value, write=False)
+                else:
+                    var.set(value, write=False)
+
+            # Keep the resulting values of the underlying remote variables
+            entries = {}
+            for var, value in settings.values():
+                remotes = [remote for remote in ([var] if isinstance(var, pr.RemoteVariable) else var.dependencies)
+                           if isinstance(remote, pr.RemoteVariable)]
+                if not remotes:
+                    warnings.append(f'{var.path} is not backed by a register, skipped')
+                for remote in remotes:
+                    entries.pop(remote.path, None)
+                    entries[remote.path] = remote.value()
+            stages.append(list(entries.items()))
+
+        return cls(key, files, stages, warnings)
+
+    # Write the snapshot to the hardware, one stage (file) after the other
+    def load(self, root):
+        for warning in self.warnings:
+            click.secho(f'ConfigSnapshot: {warning}', bg='yellow')
+
+        force = root.ForceWrite.value()
+        for stage in self.stages:
+            self._loadStage(root, stage, force)
+
+        if root.InitAfterConfig.value():
+            root.initialize()
+
+    def _loadStage(self, root, stage, force):
+        # Group the settings by device, keeping the load order
+        devices = {}
+        for path, value in stage:
+            var = root.getNode(path)
+            if var is None:
+                errMsg = f'ConfigSnapshot: {path} not found (snapshot {self.key})'
+                click.secho(errMsg, bg='red')
+                raise ValueError(errMsg)
+            devices.setdefault(var.parent, []).append((var, value))
+
+        # The trigger enables (EnableReadout, EnCalPulseTrig, ...) go last, once the ASIC is configured
+        order = sorted(devices, key=lambda dev: isinstance(dev, common.AltirocTrig))
+
+        for dev in order:
+            settings = devices[dev]
+            if isinstance(dev, common.ShiftRegisterDevice):
+                # One block write of all the shift register words: the firmware only shifts the ASIC on
+                # a data write and its image is never read back from the ASIC, so after an ASIC reset
+                # a diff against it would shift nothing (LoadConfig always wrote every word too)
+                txn = dev.transaction(refresh=True)
+                for var, value in settings:
+                    if var.name in dev._fields:
+                        txn.set(var.name, value)
+                txn.commit(force=True)
+                for var, value in settings:
+                    if var.name not in dev._fields:
+                        var.set(value)
+            else:
+                for var, value in settings:
+                    var.set(value, write=False)
+                dev.writeBlocks(force=force, recurse=False)
+                dev.verifyBlocks(recurse=False)
+                dev.checkBlocks(recurse=False)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the 
+## top-level directory of this distribution and at: 
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html. 
+## No part of 'ATLAS ALTIROC DEV', including this file, 
+## may be copied, modified, propagated, or distributed except according to 
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import glob
+import numpy as np
+
+import common
+
+class ColumnarEventWriter(object):
+    '''
+    Chunked columnar export of batch decoded events (replacement for the CSV dump).
+
+    Events are buffered per channel and written every "blockSize" pixel words as
+        <prefix>_fpga<channel>_<block>.npz
+    Each block holds the per-event columns (EventIndex, SeqCnt, TrigCnt, Timestamp,
+    DropTrigCnt) and the per-pixel-word columns (EventIndex + PixDataType fields).
+    EventIndex counts the events of the channel from the start of the export, so
+    the blocks of a channel can simply be concatenated (see LoadColumnarEvents).
+
+    writer = ColumnarEventWriter('run')
+    for batch in dataFile.batches(channel=None):
+        writer.write(batch)
+    writer.close()
+    '''
+    def __init__(self, prefix, blockSize=1<<20, compress=False):
+        self.prefix    = prefix
+        self.blockSize = blockSize
+        self.compress  = compress
+        self.pending   = {}
+        self.numEvents = {}
+        self.numBlocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # Add an EventBatch (can hold events of several channels)
+    def write(self, batch):
+        for channel in np.unique(batch.Channel):
+            channel  = int(channel)
+            events   = np.flatnonzero(batch.Channel == channel)
+            first    = self.numEvents.get(channel, 0)
+
+            # Map the batch event numbers to the running event count of the channel
+            eventMap = np.zeros(len(batch), dtype=np.uint64)
+            eventMap[events] = first + np.arange(len(events), dtype=np.uint64)
+            if len(events) == len(batch):
+                pixData = batch.pixData
+            else:
+                pixData = batch.pixData[np.isin(batch.pixData['EventIndex'], events)]
+
+            block = {
+                'EventIndex'  : eventMap[events],
+                'SeqCnt'      : batch.SeqCnt[events],
+                'TrigCnt'     : batch.TrigCnt[events],
+                'Timestamp'   : batch.Timestamp[events],
+                'DropTrigCnt' : batch.dropTrigCnt[events],
+                'pixEventIndex' : eventMap[pixData['EventIndex']],
+            }
+            for name in common.PixDataType.names:
+                block[name] = pixData[name]
+
+            self.numEvents[channel] = first + len(events)
+            self.pending.setdefault(channel, []).append(block)
+            if sum(len(b['pixEventIndex']) for b in self.pending[channel]) >= self.blockSize:
+                self.flush(channel)
+
+    # Write the buffered events of a channel (or of all channels) to a new block file
+    def flush(self, channel=None):
+        channels = list(self.pending.keys()) if channel is None else [channel]
+        for channel in channels:
+            blocks = self.pending.pop(channel, [])
+            if not blocks:
+                continue
+            columns = {name: np.concatenate([b[name] for b in blocks]) for name in blocks[0]}
+            index   = self.numBlocks.get(channel, 0)
+            path    = f'{self.prefix}_fpga{channel}_{index:05d}.npz'
+            if self.compress:
+                np.savez_compressed(path, **columns)
+            else:
+                np.savez(path, **columns)
+            self.numBlocks[channel] = index + 1
+
+    def close(self):
+        self.flush()
+
+# Stream interface of the columnar export: the frames of a data stream (e.g. a rogue
+# StreamReader replaying a file) are batch decoded "batchSize" frames at a time per channel
+class ColumnarStreamWriter(common.EventReader):
+    def __init__(self, writer, batchSize=1024):
+        super().__init__()
+        self.writer    = writer
+        self.batchSize = batchSize
+        self.frames    = {}
+
+    def processFrame(self, frame, channel=0):
+        # Channels >= 128 are the SEM monitor streams
+        if channel >= 128:
+            return
+        pending = self.frames.setdefault(channel, [])
+        pending.append(self.decoder.words(frame).tobytes())
+        if len(pending) == self.batchSize:
+            self.flush(channel)
+
+    # Decode and write the buffered frames of a channel (or of all channels)
+    def flush(self, channel=None):
+        channels = list(self.frames.keys()) if channel is None else [channel]
+        for channel in channels:
+            pending = self.frames.pop(channel, [])
+            if pending:
+                batch = common.ParseFrameBatch(pending)
+                batch.Channel[:] = channel
+                self.writer.write(batch)
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+# Load and concatenate all the blocks of a channel written by ColumnarEventWriter
+def LoadColumnarEvents(prefix, channel=0):
+    columns = {}
+    for path in sorted(glob.glob(f'{glob.escape(prefix)}_fpga{channel}_*.npz')):
+        with np.load(path) as block:
+            for name in block.files:
+                columns.setdefault(name, []).append(block[name])
+    return {name: np.concatenate(arrays) for name, arrays in columns.items()}
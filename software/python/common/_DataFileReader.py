@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the 
+## top-level directory of this distribution and at: 
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html. 
+## No part of 'ATLAS ALTIROC DEV', including this file, 
+## may be copied, modified, propagated, or distributed except according to 
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import os
+import struct
+import hashlib
+import collections
+import threading
+import click
+import numpy as np
+
+import common
+
+# One record of a file written by pr.utilities.fileio.StreamWriter
+DataFileRecord = collections.namedtuple('DataFileRecord', ['offset', 'channel', 'error', 'flags', 'payload'])
+
+# Size of the StreamWriter record header: 32-bit size + 32-bit channel/error/flags word
+DataFileHeaderSize = 8
+
+class DataFileReader(object):
+    '''
+    Reads the .dat files written by pr.utilities.fileio.StreamWriter without rogue.
+
+    The file is memory-mapped and walked record by record. Each record is
+        [31:0]  size    = payload size + 4 (bytes)
+        [15:0]  flags,  [23:16] error,  [31:24] channel
+        payload
+    Payloads are returned as zero-copy numpy uint8 slices of the mapping, which can be
+    given directly to ParseFrame(), FrameDecoder.decode() or ParseFrameBatch().
+
+    with DataFileReader('TestData/TOA2400.dat') as dataFile:
+        for payload in dataFile.frames(channel=0):
+            eventFrame = ParseFrame(payload)
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+        self.remap()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.data = None
+
+    # (Re)map the file, e.g. to see records appended since the last call
+    def remap(self):
+        if os.path.getsize(self.path) > 0:
+            self.data = np.memmap(self.path, dtype=np.uint8, mode='r').view(np.ndarray)
+        else:
+            self.data = np.zeros(0, dtype=np.uint8)
+        return len(self.data)
+
+    # Size of the mapped region in bytes
+    def size(self):
+        return len(self.data)
+
+    # Returns the header of the record at "offset" as (payloadSize, channel, error, flags)
+    # or None if the record is not complete in the mapped region (file still being written)
+    def header(self, offset):
+        if (offset + DataFileHeaderSize) > len(self.data):
+            return None
+        size, word = struct.unpack_from('<II', self.data, offset)
+        if (size < 4) or ((offset + 4 + size) > len(self.data)):
+            return None
+        return (size-4, (word >> 24) & 0xFF, (word >> 16) & 0xFF, word & 0xFFFF)
+
+    # Iterate over the records, starting from byte "offset"
+    def records(self, channel=None, offset=0):
+        while True:
+            header = self.header(offset)
+            if header is None:
+                return
+            size, chan, error, flags = header
+            if (channel is None) or (chan == channel):
+                start = offset + DataFileHeaderSize
+                yield DataFileRecord(offset, int(chan), int(error), int(flags), self.data[start:start+size])
+            offset += DataFileHeaderSize + size
+
+    # Iterate over the frame payloads of a channel
+    def frames(self, channel=0):
+        for record in self.records(channel=channel):
+            yield record.payload
+
+    # Iterate over EventBatch blocks of up to "batchSize" frames. With channel=None all
+    # data channels are read and every batch holds the frames of a single channel
+    def batches(self, channel=0, batchSize=1024):
+        frames = {}
+        for record in self.records(channel=channel):
+            # Channels >= 128 are the SEM monitor streams
+            if record.channel >= 128:
+                continue
+            pending = frames.setdefault(record.channel, [])
+            pending.append(record.payload)
+            if len(pending) == batchSize:
+                yield self._batch(record.channel, pending)
+                frames[record.channel] = []
+        for chan, pending in sorted(frames.items()):
+            if pending:
+                yield self._batch(chan, pending)
+
+    def _batch(self, channel, frames):
+        batch = common.ParseFrameBatch(frames)
+        batch.Channel[:] = channel
+        return batch
+
+#################################################################
+
+# Fixed size entry of the sidecar frame index
+DataFileIndexType = np.dtype([
+    ('Offset',    '<u8'), # Byte offset of the record in the .dat file
+    ('Channel',   'u1'),
+    ('SeqCnt',    '<u4'),
+    ('TrigCnt',   '<u4'),
+    ('Timestamp', '<u8'),
+])
+
+# Sidecar header: magic + byte offset in the .dat file up to which the index is complete
+# + fingerprint of the indexed part of the .dat file (its first and last bytes)
+DataFileIndexMagic      = b'ALTIDX02'
+DataFileIndexHeaderSize = 48
+
+# Bytes at the start and at the end of the indexed part that are hashed in the fingerprint
+DataFileFingerprintSize = 4096
+
+class DataFileIndex(object):
+    '''
+    Sidecar index (<file>.dat.idx) of the frames in a StreamWriter .dat file.
+
+    Each entry holds the byte offset, channel, SeqCnt, TrigCnt and Timestamp of a frame.
+    update() only scans the records written since the previous call and appends them to
+    the sidecar, so it can be called periodically while Top.dataWriter is still writing
+    (or run in the background with start()/stop(), see Top(dataIndex=True)). If the sidecar
+    cannot be written (e.g. read-only data directory) the index is only kept in memory
+    (indexPath = None).
+
+    index = DataFileIndex('run.dat')
+    payload = index.payload(index.findEvent(1000, channel=0))
+    events  = index.findTimestamp(t0, t1, channel=0)
+    '''
+    def __init__(self, path, indexPath=None, update=True):
+        self.path       = path
+        self.indexPath  = indexPath if indexPath is not None else (path + '.idx')
+        self.reader     = DataFileReader(path)
+        self.entries    = np.zeros(0, dtype=DataFileIndexType)
+        self.nextOffset = 0
+        self.lock       = threading.Lock()
+        self._channel   = {}
+        self._thread    = None
+        self._stopEvent = threading.Event()
+        self.load()
+        if update:
+            self.update()
+
+    # Hash of the first and last bytes of the data file before "offset" (32 bytes): a rewritten
+    # or truncated and regrown data file does not match the fingerprint of its old index
+    def fingerprint(self, offset):
+        with open(self.path, 'rb') as f:
+            head = f.read(min(offset, DataFileFingerprintSize))
+            f.seek(max(offset - DataFileFingerprintSize, 0))
+            tail = f.read(offset - f.tell())
+        return (hashlib.blake2b(head, digest_size=16).digest() +
+                hashlib.blake2b(tail, digest_size=16).digest())
+
+    def _header(self, offset):
+        return struct.pack('<Q', offset) + self.fingerprint(offset)
+
+    # Load the existing sidecar, discarding it if it does not match the data file
+    def load(self):
+        if (self.indexPath is not None) and os.path.exists(self.indexPath):
+            with open(self.indexPath, 'rb') as f:
+                header = f.read(DataFileIndexHeaderSize)
+                if (len(header) == DataFileIndexHeaderSize) and (header[:8] == DataFileIndexMagic):
+                    nextOffset = struct.unpack('<Q', header[8:16])[0]
+                    entries    = np.fromfile(f, dtype=DataFileIndexType)
+                    if (nextOffset <= os.path.getsize(self.path)) and (header[8:] == self._header(nextOffset)):
+                        self.entries    = entries[entries['Offset'] < nextOffset]
+                        self.nextOffset = nextOffset
+                        return
+        self.entries    = np.zeros(0, dtype=DataFileIndexType)
+        self.nextOffset = 0
+        self._writeSidecar(0, 'wb', DataFileIndexMagic + self._header(0))
+
+    # Write "data" at "offset" of the sidecar, falling back to an in-memory index if it cannot be written
+    def _writeSidecar(self, offset, mode, *data):
+        if self.indexPath is None:
+            return
+        try:
+            with open(self.indexPath, mode) as f:
+                f.seek(offset)
+                for d in data:
+                    f.write(d)
+        except OSError as e:
+            click.secho(f'DataFileIndex: cannot write {self.indexPath} ({e}), the index is only kept in memory', bg='yellow')
+            self.indexPath = None
+
+    # Index the records appended to the data file since the last update
+    def update(self):
+        with self.lock:
+            self.reader.remap()
+            new = []
+            offset = self.nextOffset
+            for record in self.reader.records(offset=self.nextOffset):
+                entry = [record.offset, record.channel, 0, 0, 0]
+                # Channels >= 128 are the SEM monitor streams (no event header)
+                if (record.channel < 128) and (len(record.payload) >= 24):
+                    wrdData  = record.payload[:20].view('<u4')
+                    entry[2] = wrdData[1]
+                    entry[3] = wrdData[2]
+                    entry[4] = (int(wrdData[4]) << 32) | int(wrdData[3])
+                new.append(tuple(entry))
+                offset = record.offset + DataFileHeaderSize + len(record.payload)
+
+            if new:
+                new = np.array(new, dtype=DataFileIndexType)
+                self._writeSidecar(DataFileIndexHeaderSize + self.entries.nbytes, 'r+b', new.tobytes())
+                self._writeSidecar(8, 'r+b', self._header(offset))
+                self.entries    = np.concatenate((self.entries, new))
+                self.nextOffset = offset
+                self._channel   = {}
+            return len(new)
+
+    # Periodically update the index in a background thread (e.g. while the run is being written)
+    def start(self, interval=1.0):
+        self._stopEvent.clear()
+        def run():
+            while not self._stopEvent.wait(interval):
+                self.update()
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopEvent.set()
+            self._thread.join()
+            self._thread = None
+        self.update()
+
+    # Entries of one channel plus their TrigCnt/Timestamp sort orders (cached until the next update)
+    def channel(self, channel=0):
+        with self.lock:
+            if channel not in self._channel:
+                entries = self.entries[self.entries['Channel'] == channel]
+                self._channel[channel] = (
+                    entries,
+                    np.argsort(entries['TrigCnt'],   kind='stable'),
+                    np.argsort(entries['Timestamp'], kind='stable'),
+                )
+            return self._channel[channel]
+
+    # Number of frames of a channel
+    def numEvents(self, channel=0):
+        return len(self.channel(channel)[0])
+
+    # Index entry of the n-th frame of a channel
+    def findEvent(self, n, channel=0):
+        return self.channel(channel)[0][n]
+
+    # Event numbers (within the channel) with the given TrigCnt
+    def findTrigCnt(self, trigCnt, channel=0):
+        entries, trigOrder, timeOrder = self.channel(channel)
+        trig = entries['TrigCnt'][trigOrder]
+        lo   = np.searchsorted(trig, trigCnt, side='left')
+        hi   = np.searchsorted(trig, trigCnt, side='right')
+        return np.sort(trigOrder[lo:hi])
+
+    # Event numbers (within the channel) with start <= Timestamp < stop
+    def findTimestamp(self, start, stop, channel=0):
+        entries, trigOrder, timeOrder = self.channel(channel)
+        time = entries['Timestamp'][timeOrder]
+        lo   = np.searchsorted(time, start, side='left')
+        hi   = np.searchsorted(time, stop,  side='left')
+        return np.sort(timeOrder[lo:hi])
+
+    # Zero-copy payload of an index entry (or of the n-th frame of a channel)
+    def payload(self, entry, channel=0):
+        if not isinstance(entry, np.void):
+            entry = self.findEvent(entry, channel)
+        offset = int(entry['Offset'])
+        size   = self.reader.header(offset)[0]
+        start  = offset + DataFileHeaderSize
+        return self.reader.data[start:start+size]
@@ -1,20 +1,12 @@
 #!/usr/bin/env python3
 #################################################################
-import sys
-import os
 import rogue
-import time
-import random
-import argparse
-import pyrogue as pr
-import pyrogue.gui
 import numpy as np
-import rogue.utilities.fileio
-import statistics
-import math
-import matplotlib.pyplot as plt
 import csv
 import click
+import threading
+
+import common
 
 #################################################################
 
@@ -28,6 +20,20 @@ class PixValue(object):
      self.Hit         = Hit
      self.Sof         = Sof
 
+# Bit fields of the 32-bit pixel data word: (name, bitOffset, mask, dtype)
+PixWordFields = [
+    ('PixelIndex',  24, 0x1F,  np.uint8),
+    ('TotOverflow', 20, 0x1,   np.uint8),
+    ('TotData',     11, 0x1FF, np.uint16),
+    ('ToaOverflow', 10, 0x1,   np.uint8),
+    ('ToaData',      3, 0x7F,  np.uint8),
+    ('Hit',          2, 0x1,   np.uint8),
+    ('Sof',          0, 0x3,   np.uint8),
+]
+
+# Columnar (structured array) layout of the decoded pixel words
+PixDataType = np.dtype([(name, dtype) for (name, bitOffset, mask, dtype) in PixWordFields])
+
 class EventValue(object):
   def __init__(self):
      self.FormatVersion     = None
@@ -35,9 +41,21 @@ class EventValue(object):
      self.ReadoutSize       = None
      self.SeqCnt            = None
      self.TrigCnt           = None
-     self.pixValue          = None
+     self.pixData           = None
      self.dropTrigCnt       = None
      self.Timestamp         = None
+     self._pixValue         = None
+
+  # Per-pixel object view of pixData, only built when someone asks for it
+  @property
+  def pixValue(self):
+     if (self._pixValue is None) and (self.pixData is not None):
+        self._pixValue = [PixValue(*row) for row in self.pixData.tolist()]
+     return self._pixValue
+
+  @pixValue.setter
+  def pixValue(self, value):
+     self._pixValue = value
 
 def ParseDataWord(dataWord):
     #Parse the 32-bit word
@@ -52,173 +70,406 @@ def ParseDataWord(dataWord):
     #print( "{:028b}".format(dataWord) )
     return PixValue(PixelIndex, TotOverflow, TotData, ToaOverflow, ToaData, Hit, Sof)
 
+def ParseDataWords(dataWords, out=None, scratch=None):
+    # Parse an array of 32-bit words into the PixDataType columns in one pass
+    if out is None:
+        out = np.empty(len(dataWords), dtype=PixDataType)
+    if scratch is None:
+        for (name, bitOffset, mask, dtype) in PixWordFields:
+            out[name] = (dataWords >> bitOffset) & mask
+    else:
+        # Reuse the caller's scratch buffer instead of allocating temporaries
+        tmp = scratch[:len(dataWords)]
+        for (name, bitOffset, mask, dtype) in PixWordFields:
+            np.right_shift(dataWords, bitOffset, out=tmp)
+            np.bitwise_and(tmp, mask, out=tmp)
+            out[name] = tmp
+    return out
+
+# Largest frame payload in 32-bit words: header (5) + 512 iterations x 32 pixels + dropTrigCnt (1)
+MaxFrameWords = 5+512*32+1
+
+def FramePayloadSize(frame):
+    # rogue frames report their own payload size, anything else must support the buffer protocol
+    if hasattr(frame, 'getPayload'):
+        return frame.getPayload()
+    else:
+        return memoryview(frame).nbytes
+
+class FrameDecoder(object):
+  def __init__(self):
+     self.fullData = bytearray(4*MaxFrameWords)
+     self.fullView = memoryview(self.fullData)
+     self.wrdData  = np.frombuffer(self.fullData, dtype='uint32')
+     self.scratch  = np.empty(MaxFrameWords, dtype='uint32')
+     self.pixData  = np.empty(MaxFrameWords, dtype=PixDataType)
+     self.event    = EventValue()
+
+  # Returns the 32-bit word view of a frame's payload
+  def words(self, frame):
+     # Buffer-protocol objects (bytes, numpy slices of a mapped file, ...) are decoded in place
+     if not hasattr(frame, 'getPayload'):
+        return np.frombuffer(frame, dtype='uint32', count=(memoryview(frame).nbytes>>2))
+
+     # rogue frames are copied once into the reusable buffer
+     size = frame.getPayload()
+     if size > len(self.fullData):
+        self.fullData = bytearray(size)
+        self.fullView = memoryview(self.fullData)
+        self.wrdData  = np.frombuffer(self.fullData, dtype='uint32')
+     frame.read(self.fullView[:size],0)
+     return self.wrdData[:(size>>2)]
+
+  # Returns the raw 32-bit pixel data words of a frame (same lifetime as words())
+  def pixWords(self, frame):
+     wrdData = self.words(frame)
+     numPixValues = (((wrdData[0] >> 27) & 0x1F)+1)*(((wrdData[0] >> 12) & 0x1FF)+1)
+     return wrdData[5:5+numPixValues]
+
+  # Decodes a frame. By default the returned EventValue (and its pixData) is owned by
+  # the decoder and only valid until the next call; copy=True returns independent data
+  def decode(self, frame, copy=False):
+     wrdData = self.words(frame)
+     numPixValues = (((wrdData[0] >> 27) & 0x1F)+1)*(((wrdData[0] >> 12) & 0x1FF)+1)
+
+     if copy:
+        eventFrame = EventValue()
+        eventFrame.pixData = ParseDataWords(wrdData[5:5+numPixValues])
+     else:
+        if numPixValues > len(self.pixData):
+           self.pixData = np.empty(numPixValues, dtype=PixDataType)
+           self.scratch = np.empty(numPixValues, dtype='uint32')
+        eventFrame = self.event
+        eventFrame.pixValue = None
+        eventFrame.pixData  = ParseDataWords(wrdData[5:5+numPixValues], out=self.pixData[:numPixValues], scratch=self.scratch)
+
+     # Parse the data and data to data frame
+     eventFrame.FormatVersion     = (wrdData[0] >>  0) & 0xFFF
+     eventFrame.PixReadIteration  = (wrdData[0] >> 12) & 0x1FF
+     eventFrame.ReadoutSize       = (wrdData[0] >> 27) & 0x1F
+     eventFrame.SeqCnt            = wrdData[1]
+     eventFrame.TrigCnt           = wrdData[2]
+     eventFrame.Timestamp         = (int(wrdData[4]) << 32) | (int(wrdData[3]) << 0)
+     eventFrame.dropTrigCnt       = wrdData[numPixValues+5]
+
+     return eventFrame
+
+# One reusable read buffer per thread for ParseFrame()
+_threadDecoder = threading.local()
+
 def ParseFrame(frame):
-    # Next we can get the size of the frame payload
-    size = frame.getPayload()
-    
-    # To access the data we need to create a byte array to hold the data
-    fullData = bytearray(size)
-    
-    # Next we read the frame data into the byte array, from offset 0
-    frame.read(fullData,0)
-
-    # Fill an array of 32-bit formatted word
-    wrdData = [None for i in range(5+512*32+1)]
-    wrdData = np.frombuffer(fullData, dtype='uint32', count=(size>>2))
-    
-    # Parse the data and data to data frame
-    eventFrame = EventValue()
-    eventFrame.FormatVersion     = (wrdData[0] >>  0) & 0xFFF
-    eventFrame.PixReadIteration  = (wrdData[0] >> 12) & 0x1FF
-    eventFrame.ReadoutSize       = (wrdData[0] >> 27) & 0x1F
-    eventFrame.SeqCnt            = wrdData[1]
-    eventFrame.TrigCnt           = wrdData[2]
-    eventFrame.Timestamp         = (wrdData[4] << 32) | (wrdData[3] << 0)
-    numPixValues = (eventFrame.ReadoutSize+1)*(eventFrame.PixReadIteration+1)
-    eventFrame.pixValue  = [None for i in range(numPixValues)]
-    for i in range(numPixValues):
-        eventFrame.pixValue[i] = ParseDataWord(wrdData[5+i])
-    eventFrame.dropTrigCnt = wrdData[numPixValues+5]
-
-    return eventFrame
+    if not hasattr(_threadDecoder, 'decoder'):
+        _threadDecoder.decoder = FrameDecoder()
+    return _threadDecoder.decoder.decode(frame, copy=True)
 
 #################################################################
 
-# Class for printing out events
-class PrintEventReader(rogue.interfaces.stream.Slave):
-    # Init method must call the parent class init
-    def __init__(self, cvsDump=False):
-        super().__init__()
-        self.count   = 0
-        self.cvsDump = cvsDump
-        if cvsDump:
-            self.file   = [None for i in range(2)]
-            self.writer = [None for i in range(2)]
-            for i in range(2):
-                self.file[i]   = open(f'fpga{i}.csv', 'w', newline='') 
-                self.writer[i] = csv.writer(self.file[i])
-                self.writer[i].writerow([
-                    'Timestamp',    # 0 = Timestamp
-                    'SeqCnt',       # 1 = SeqCnt
-                    'TrigCnt',      # 2 = TrigCnt
-                    'DropTrigCnt',  # 3 = DropTrigCnt
-                    'pixIndex',     # 4 = pixIndex
-                    'TotOverflow',  # 5 = TotOverflow
-                    'TotData',      # 6 = TotData
-                    'ToaOverflow',  # 7 = ToaOverflow
-                    'ToaData',      # 8 = ToaData
-                    'Hit',          # 9 = Hit
-                    'Sof',          # 10 = Sof
-                ])
-                
+# Columnar layout of batch decoded pixel words (PixDataType plus the event each word belongs to)
+PixBatchDataType = np.dtype([('EventIndex', np.uint32)] + PixDataType.descr)
+
+class EventBatch(object):
+  def __init__(self, numEvents, numPixValues):
+     self.numEvents         = numEvents
+     self.FrameIndex        = np.zeros(numEvents, dtype=np.int64) # Index of the frame in the decoded frames
+     self.Channel           = np.zeros(numEvents, dtype=np.uint8)
+     self.FormatVersion     = np.zeros(numEvents, dtype=np.uint16)
+     self.PixReadIteration  = np.zeros(numEvents, dtype=np.uint16)
+     self.ReadoutSize       = np.zeros(numEvents, dtype=np.uint8)
+     self.SeqCnt            = np.zeros(numEvents, dtype=np.uint32)
+     self.TrigCnt           = np.zeros(numEvents, dtype=np.uint32)
+     self.Timestamp         = np.zeros(numEvents, dtype=np.uint64)
+     self.dropTrigCnt       = np.zeros(numEvents, dtype=np.uint32)
+     self.pixOffset         = np.zeros(numEvents+1, dtype=np.int64)
+     self.pixData           = np.empty(numPixValues, dtype=PixBatchDataType)
+
+  def __len__(self):
+     return self.numEvents
+
+  # Returns the i-th event as an EventValue (pixData is a view into the batch)
+  def event(self, i):
+     eventFrame = EventValue()
+     eventFrame.FormatVersion     = self.FormatVersion[i]
+     eventFrame.PixReadIteration  = self.PixReadIteration[i]
+     eventFrame.ReadoutSize       = self.ReadoutSize[i]
+     eventFrame.SeqCnt            = self.SeqCnt[i]
+     eventFrame.TrigCnt           = self.TrigCnt[i]
+     eventFrame.Timestamp         = int(self.Timestamp[i])
+     eventFrame.dropTrigCnt       = self.dropTrigCnt[i]
+     eventFrame.pixData           = self.pixData[self.pixOffset[i]:self.pixOffset[i+1]][list(PixDataType.names)]
+     return eventFrame
+
+def ParseBufferBatch(buf, channel=0):
+    # 32-bit word view of a contiguous region holding many frames back to back
+    wrdData = np.frombuffer(buf, dtype='uint32', count=(len(buf)>>2))
+
+    # Walk the frame headers to find where each frame starts
+    starts = []
+    pos    = 0
+    while (pos+6) <= len(wrdData):
+        numPixValues = (((wrdData[pos] >> 27) & 0x1F)+1)*(((wrdData[pos] >> 12) & 0x1FF)+1)
+        if (pos+6+numPixValues) > len(wrdData):
+            break
+        starts.append(pos)
+        pos += 6+numPixValues
+
+    batch = _decodeBatch(wrdData, np.asarray(starts, dtype=np.int64))
+    batch.Channel[:] = channel
+    return batch
+
+# Decodes the frames that start at the word indexes "starts" of wrdData into an EventBatch
+def _decodeBatch(wrdData, starts):
+    # Decode the headers of all events at once
+    header       = wrdData[starts]
+    readoutSize  = (header >> 27) & 0x1F
+    pixReadIter  = (header >> 12) & 0x1FF
+    numPixValues = ((readoutSize+1)*(pixReadIter+1)).astype(np.int64)
+
+    batch = EventBatch(len(starts), int(numPixValues.sum()))
+    batch.FrameIndex[:]       = np.arange(len(starts))
+    batch.FormatVersion[:]    = header & 0xFFF
+    batch.PixReadIteration[:] = pixReadIter
+    batch.ReadoutSize[:]      = readoutSize
+    batch.SeqCnt[:]           = wrdData[starts+1]
+    batch.TrigCnt[:]          = wrdData[starts+2]
+    batch.Timestamp[:]        = (wrdData[starts+4].astype(np.uint64) << np.uint64(32)) | wrdData[starts+3]
+    batch.dropTrigCnt[:]      = wrdData[starts+5+numPixValues]
+    np.cumsum(numPixValues, out=batch.pixOffset[1:])
+
+    # Gather every pixel word of the batch and decode them in a single pass
+    eventIndex = np.repeat(np.arange(len(starts), dtype=np.uint32), numPixValues)
+    wordIndex  = np.arange(len(batch.pixData), dtype=np.int64) + (starts+5-batch.pixOffset[:-1])[eventIndex]
+    batch.pixData['EventIndex'] = eventIndex
+    ParseDataWords(wrdData[wordIndex], out=batch.pixData)
+
+    return batch
+
+def ParseFrameBatch(frames):
+    # Copy all the frame payloads into one buffer, every frame at a 32-bit aligned offset
+    sizes    = np.array([FramePayloadSize(frame) for frame in frames], dtype=np.int64)
+    offsets  = np.concatenate(([0], np.cumsum((sizes+3) & ~3))).astype(np.int64)
+    fullData = bytearray(int(offsets[-1]))
+    view     = memoryview(fullData)
+    for i, frame in enumerate(frames):
+        if hasattr(frame, 'getPayload'):
+            frame.read(view[offsets[i]:offsets[i]+sizes[i]], 0)
+        else:
+            view[offsets[i]:offsets[i]+sizes[i]] = memoryview(frame).cast('B')
+    wrdData = np.frombuffer(fullData, dtype='uint32')
+
+    # Every frame is decoded at its own offset and checked against the size given by its header
+    # (trailing padding is ignored). A bad frame is rejected on its own, the others are kept
+    starts   = offsets[:-1] >> 2
+    numWords = sizes >> 2
+    valid    = (numWords >= 6)
+    header   = wrdData[starts[valid]]
+    valid[valid] = (numWords[valid] >= 6+(((header >> 27) & 0x1F)+1)*(((header >> 12) & 0x1FF)+1))
+    rejected = np.flatnonzero(~valid)
+    if len(rejected) > 0:
+        click.secho(f'ParseFrameBatch: rejected {len(rejected)} of {len(frames)} frames shorter than their header '
+                    f'(frames {rejected.tolist()})', bg='yellow')
+
+    kept  = np.flatnonzero(valid)
+    batch = _decodeBatch(wrdData, starts[kept])
+    batch.FrameIndex[:] = kept
+    batch.Channel[:]    = [frames[i].getChannel() if hasattr(frames[i], 'getChannel') else 0 for i in kept]
+
+    return batch
+
+#################################################################
+
+# Base class of the event readers: counts the received frames and lets
+# other threads wait (without polling) until a number of frames has arrived
+class EventReader(rogue.interfaces.stream.Slave):
+    def __init__(self):
+        rogue.interfaces.stream.Slave.__init__(self)
+        self.count     = 0
+        self.countCond = threading.Condition()
+        self.decoder   = FrameDecoder()
+
     # Method which is called when a frame is received
     def _acceptFrame(self,frame):
 
         # First it is good practice to hold a lock on the frame data.
         with frame.lock():
-            eventFrame = ParseFrame(frame)
-                
-            # Print out the event
-            header_still_needs_to_be_printed = True
-            for i in range( len(eventFrame.pixValue) ):
-                pixel = eventFrame.pixValue[i]
-                pixIndex = pixel.PixelIndex
-                
-                #if pixel.ToaOverflow != 1: #make sure this pixel is worth printing
-                if (pixel.Hit != 0) and (pixel.ToaData != 0x7F): #make sure this pixel is worth printing
-                    if header_still_needs_to_be_printed: #print the header only once per pixel
-                        print('FPGA {:#}'.format( frame.getChannel() ) +
-                              ', payloadSize(Bytes) {:#}'.format( frame.getPayload() ) +
-                              ', FormatVersion {:#}'.format(eventFrame.FormatVersion) +
-                              ', PixReadIteration {:#}'.format(eventFrame.PixReadIteration) +
-                              ', ReadoutSize {:#}'.format(eventFrame.ReadoutSize) + 
-                              ', DropTrigCnt 0x{:X}'.format(eventFrame.dropTrigCnt) + 
-                              ', SeqCnt {:#}'.format(eventFrame.SeqCnt) +
-                              ', Timestamp {:#}'.format( eventFrame.Timestamp ) )
-                        print('    Pixel : TotOverflow | TotData | ToaOverflow | ToaData | Hit | Sof') 
-                        header_still_needs_to_be_printed = False
-
-                    print('    {:>#5} | {:>#11} | {:>#7} | {:>#11} | {:>#7} | {:>#3} | {:>#3}'.format(
-                        pixIndex,
-                        pixel.TotOverflow,
-                        pixel.TotData,
-                        pixel.ToaOverflow,
-                        pixel.ToaData,
-                        pixel.Hit,
-                        pixel.Sof)
-                    )
-                    
-                # Check if dumping to .CVS file
-                if self.cvsDump:
-                    self.writer[frame.getChannel()].writerow([
-                        '0x%016X'%eventFrame.Timestamp,  # 0 = Timestamp
-                        eventFrame.SeqCnt,     # 1 = SeqCnt
-                        eventFrame.TrigCnt,    # 2 = TrigCnt
-                        eventFrame.dropTrigCnt,# 3 = DropTrigCnt
-                        pixIndex,           # 4 = pixIndex
-                        pixel.TotOverflow,  # 5 = TotOverflow
-                        pixel.TotData,      # 6 = TotData
-                        pixel.ToaOverflow,  # 7 = ToaOverflow
-                        pixel.ToaData,      # 8 = ToaData
-                        pixel.Hit,          # 9 = Hit
-                        pixel.Sof,          # 10 = Sof
-                    ])                
-                        
+            self.processFrame(frame, frame.getChannel())
+            
+        self.countFrame()
+
+    def processFrame(self, frame, channel=0):
+        pass
+
+    def countFrame(self):
+        with self.countCond:
             self.count += 1
+            self.countCond.notify_all()
+
+    def resetCount(self):
+        with self.countCond:
+            self.count = 0
+
+    # Blocks until "count" frames have been received, returns False on timeout
+    def waitCount(self, count, timeout=None):
+        with self.countCond:
+            return self.countCond.wait_for(lambda: self.count >= count, timeout)
+
 #################################################################
 
-# Class for Reading the Data from File
-class MyFileReader(rogue.interfaces.stream.Slave):
+# Class for printing out events
+class PrintEventReader(EventReader):
+    # Init method must call the parent class init
+    def __init__(self, cvsDump=False, printEvents=True):
+        super().__init__()
+        self.cvsDump = cvsDump
+        self.printEvents = printEvents
+        self.file    = {}
+        self.writer  = {}
 
-    def __init__(self):
-        rogue.interfaces.stream.Slave.__init__(self)
-        self.HitData = []
-        self.HitDataTOTf_vpa = []
-        self.HitDataTOTf_tz = []
-        self.HitDataTOTc_vpa = []
-        self.HitDataTOTc_tz = []
-        self.HitDataTOTc_int1_vpa = []
-        self.HitDataTOTc_int1_tz = []
-        self.HitDataTOTf_vpa_temp = 0
-        self.HitDataTOTc_vpa_temp = 0
-        self.HitDataTOTf_tz_temp = 0
-        self.HitDataTOTc_tz_temp = 0
-        self.HitDataTOTc_int1_vpa_temp = 0
-        self.HitDataTOTc_int1_tz_temp = 0
+    # Opens the fpga<channel>.csv file the first time a channel is seen
+    def csvWriter(self, channel):
+        if channel not in self.writer:
+            self.file[channel]   = open(f'fpga{channel}.csv', 'w', newline='') 
+            self.writer[channel] = csv.writer(self.file[channel])
+            self.writer[channel].writerow([
+                'Timestamp',    # 0 = Timestamp
+                'SeqCnt',       # 1 = SeqCnt
+                'TrigCnt',      # 2 = TrigCnt
+                'DropTrigCnt',  # 3 = DropTrigCnt
+                'pixIndex',     # 4 = pixIndex
+                'TotOverflow',  # 5 = TotOverflow
+                'TotData',      # 6 = TotData
+                'ToaOverflow',  # 7 = ToaOverflow
+                'ToaData',      # 8 = ToaData
+                'Hit',          # 9 = Hit
+                'Sof',          # 10 = Sof
+            ])
+        return self.writer[channel]
 
-    def _acceptFrame(self,frame):
-        # First it is good practice to hold a lock on the frame data.
-        with frame.lock():
-            eventFrame = ParseFrame(frame)
-            for i in range( len(eventFrame.pixValue) ):
-                dat = eventFrame.pixValue[i]
+    def close(self):
+        for f in self.file.values():
+            f.close()
+                
+    # Prints/dumps one frame (rogue frame or buffer, e.g. from DataFileReader)
+    def processFrame(self, frame, channel=0):
+        # Nothing to print or dump: do not decode the frame
+        if not (self.printEvents or self.cvsDump):
+            return
+        eventFrame = self.decoder.decode(frame)
+            
+        # Print out the event
+        header_still_needs_to_be_printed = True
+        for i in range( len(eventFrame.pixValue) ):
+            pixel = eventFrame.pixValue[i]
+            pixIndex = pixel.PixelIndex
+            
+            #if pixel.ToaOverflow != 1: #make sure this pixel is worth printing
+            if self.printEvents and (pixel.Hit != 0) and (pixel.ToaData != 0x7F): #make sure this pixel is worth printing
+                if header_still_needs_to_be_printed: #print the header only once per pixel
+                    print('FPGA {:#}'.format( channel ) +
+                          ', payloadSize(Bytes) {:#}'.format( FramePayloadSize(frame) ) +
+                          ', FormatVersion {:#}'.format(eventFrame.FormatVersion) +
+                          ', PixReadIteration {:#}'.format(eventFrame.PixReadIteration) +
+                          ', ReadoutSize {:#}'.format(eventFrame.ReadoutSize) + 
+                          ', DropTrigCnt 0x{:X}'.format(eventFrame.dropTrigCnt) + 
+                          ', SeqCnt {:#}'.format(eventFrame.SeqCnt) +
+                          ', Timestamp {:#}'.format( eventFrame.Timestamp ) )
+                    print('    Pixel : TotOverflow | TotData | ToaOverflow | ToaData | Hit | Sof') 
+                    header_still_needs_to_be_printed = False
 
-                if (dat.Hit > 0) and (dat.ToaOverflow == 0):
-                    self.HitData.append(dat.ToaData)
+                print('    {:>#5} | {:>#11} | {:>#7} | {:>#11} | {:>#7} | {:>#3} | {:>#3}'.format(
+                    pixIndex,
+                    pixel.TotOverflow,
+                    pixel.TotData,
+                    pixel.ToaOverflow,
+                    pixel.ToaData,
+                    pixel.Hit,
+                    pixel.Sof)
+                )
                 
-                if (dat.Hit > 0) and (dat.TotData != 0x1fc):
-                    self.HitDataTOTf_vpa_temp = ((dat.TotData >>  0) & 0x3) + dat.TotOverflow*math.pow(2,2)
-                    self.HitDataTOTc_vpa_temp = (dat.TotData >>  2) & 0x7F
-                    self.HitDataTOTc_int1_vpa_temp = (((dat.TotData >>  2) + 1) >> 1) & 0x3F
-                    self.HitDataTOTf_vpa.append(self.HitDataTOTf_vpa_temp)
-                    self.HitDataTOTc_vpa.append(self.HitDataTOTc_vpa_temp)
-                    self.HitDataTOTc_int1_vpa.append(self.HitDataTOTc_int1_vpa_temp)
-
-                if (dat.Hit > 0) and (dat.TotData != 0x1f8):
-                    self.HitDataTOTf_tz_temp = ((dat.TotData >>  0) & 0x7) + dat.TotOverflow*math.pow(2,3)
-                    self.HitDataTOTc_tz_temp = (dat.TotData >>  3) & 0x3F
-                    self.HitDataTOTc_int1_tz_temp = (((dat.TotData >>  3) + 1) >> 1) & 0x1F
-                    self.HitDataTOTf_tz.append(self.HitDataTOTf_tz_temp)                    
-                    self.HitDataTOTc_tz.append(self.HitDataTOTc_tz_temp)
-                    self.HitDataTOTc_int1_tz.append(self.HitDataTOTc_int1_tz_temp)
+            # Check if dumping to .CVS file
+            if self.cvsDump:
+                self.csvWriter(channel).writerow([
+                    '0x%016X'%eventFrame.Timestamp,  # 0 = Timestamp
+                    eventFrame.SeqCnt,     # 1 = SeqCnt
+                    eventFrame.TrigCnt,    # 2 = TrigCnt
+                    eventFrame.dropTrigCnt,# 3 = DropTrigCnt
+                    pixIndex,           # 4 = pixIndex
+                    pixel.TotOverflow,  # 5 = TotOverflow
+                    pixel.TotData,      # 6 = TotData
+                    pixel.ToaOverflow,  # 7 = ToaOverflow
+                    pixel.ToaData,      # 8 = ToaData
+                    pixel.Hit,          # 9 = Hit
+                    pixel.Sof,          # 10 = Sof
+                ])                
+#################################################################
+
+# Derived hit quantities computed by ExtractHits()
+#   toa: ToaData of the hits without TOA overflow
+#   vpa: TOT fine/coarse/int1 codes in the VPA convention (2-bit fine)
+#   tz:  TOT fine/coarse/int1 codes in the TZ convention (3-bit fine)
+HitOutputs = ('toa', 'vpa', 'tz')
+
+# TotData code of the hits without a TOT measurement, in each convention
+TotSentinel = {'vpa': 0x1fc, 'tz': 0x1f8}
+
+# TOT fine/coarse/int1 codes of TotData/TotOverflow arrays in the VPA or TZ convention
+def TotFields(tot, totOverflow, convention):
+    if convention == 'vpa':
+        return {
+            'TOTf'      : ((tot >> 0) & 0x3) + (totOverflow << 2),
+            'TOTc'      : (tot >> 2) & 0x7F,
+            'TOTc_int1' : (((tot >> 2) + 1) >> 1) & 0x3F,
+        }
+    return {
+        'TOTf'      : ((tot >> 0) & 0x7) + (totOverflow << 3),
+        'TOTc'      : (tot >> 3) & 0x3F,
+        'TOTc_int1' : (((tot >> 3) + 1) >> 1) & 0x1F,
+    }
+
+# TOT fields of every bin of a TotWords histogram (e.g. HitReader.totHist.bins()), with the
+# number of hits of each bin in 'Counts' (0 for the sentinel of the convention)
+def TotHistFields(bins, convention):
+    words  = np.arange(common.TotWords, dtype=np.uint16)
+    fields = TotFields(words & 0x1FF, words >> 9, convention)
+    fields['Counts'] = np.where((words & 0x1FF) != TotSentinel[convention], bins, 0)
+    return fields
+
+def ExtractHits(pixData, outputs=HitOutputs):
+    # Masked column operations over decoded pixel words (one frame or a whole EventBatch)
+    hits        = {}
+    hit         = (pixData['Hit'] > 0)
+    pixelIndex  = pixData['PixelIndex']
+    totData     = pixData['TotData']
+    totOverflow = pixData['TotOverflow'].astype(np.uint16)
+
+    if 'toa' in outputs:
+        mask = hit & (pixData['ToaOverflow'] == 0)
+        hits['toa'] = {
+            'PixelIndex' : pixelIndex[mask],
+            'ToaData'    : pixData['ToaData'][mask],
+        }
+
+    for convention in ['vpa', 'tz']:
+        if convention in outputs:
+            mask = hit & (totData != TotSentinel[convention])
+            hits[convention] = {'PixelIndex' : pixelIndex[mask]}
+            hits[convention].update(TotFields(totData[mask], totOverflow[mask], convention))
+
+    return hits
 
 #################################################################
 
-# Class for Reading Data output by pixels
-class MyPixelReader(rogue.interfaces.stream.Slave):
+# Class for extracting the hits from the data stream, a data file or an EventBatch.
+# The hits are accumulated in constant memory per-pixel histograms: toaHist (TOA codes) and
+# totHist (TotWords, see TotHistFields()). With keepHits=True every hit is also appended to
+# the HitData* lists, which grow with the length of the run
+class HitReader(EventReader):
 
-    def __init__(self):
-        rogue.interfaces.stream.Slave.__init__(self)
+    def __init__(self, outputs=HitOutputs, keepHits=False):
+        super().__init__()
+        self.outputs  = outputs
+        self.keepHits = keepHits
+        self.toaHist  = common.PixelHistogram(common.ToaCodes)
+        self.totHist  = common.PixelHistogram(common.TotWords)
         self.HitData = []
         self.HitDataTOTf_vpa = []
         self.HitDataTOTf_tz = []
@@ -226,38 +477,46 @@ class MyPixelReader(rogue.interfaces.stream.Slave):
         self.HitDataTOTc_tz = []
         self.HitDataTOTc_int1_vpa = []
         self.HitDataTOTc_int1_tz = []
-        self.HitDataTOTf_vpa_temp = 0
-        self.HitDataTOTc_vpa_temp = 0
-        self.HitDataTOTf_tz_temp = 0
-        self.HitDataTOTc_tz_temp = 0
-        self.HitDataTOTc_int1_vpa_temp = 0
-        self.HitDataTOTc_int1_tz_temp = 0
 
-    def _acceptFrame(self,frame):
-        # First it is good practice to hold a lock on the frame data.
-        with frame.lock():
-            eventFrame = ParseFrame(frame)
+    def processFrame(self, frame, channel=0):
+        self.processPixData(self.decoder.decode(frame).pixData)
 
-            for i in range( len(eventFrame.pixValue) ):
-                dat = eventFrame.pixValue[i]
+    def processBatch(self, batch):
+        self.processPixData(batch.pixData)
 
-                if (dat.Hit > 0) and (dat.ToaOverflow == 0):
-                    self.HitData.append(dat.ToaData)
-                
-                if (dat.Hit > 0) and (dat.TotData != 0x1fc):
-                    self.HitDataTOTf_vpa_temp = ((dat.TotData >>  0) & 0x3) + dat.TotOverflow*math.pow(2,2)
-                    self.HitDataTOTc_vpa_temp = (dat.TotData >>  2) & 0x7F
-                    self.HitDataTOTc_int1_vpa_temp = (((dat.TotData >>  2) + 1) >> 1) & 0x3F
-                    self.HitDataTOTf_vpa.append(self.HitDataTOTf_vpa_temp)
-                    self.HitDataTOTc_vpa.append(self.HitDataTOTc_vpa_temp)
-                    self.HitDataTOTc_int1_vpa.append(self.HitDataTOTc_int1_vpa_temp)
-
-                if (dat.Hit > 0) and (dat.TotData != 0x1f8):
-                    self.HitDataTOTf_tz_temp = ((dat.TotData >>  0) & 0x7) + dat.TotOverflow*math.pow(2,3)
-                    self.HitDataTOTc_tz_temp = (dat.TotData >>  3) & 0x3F
-                    self.HitDataTOTc_int1_tz_temp = (((dat.TotData >>  3) + 1) >> 1) & 0x1F
-                    self.HitDataTOTf_tz.append(self.HitDataTOTf_tz_temp)                    
-                    self.HitDataTOTc_tz.append(self.HitDataTOTc_tz_temp)
-                    self.HitDataTOTc_int1_tz.append(self.HitDataTOTc_int1_tz_temp)
+    def processPixData(self, pixData):
+        # Constant memory per-pixel histograms of the raw TOA and TOT codes
+        hit = (pixData['Hit'] > 0)
+        if 'toa' in self.outputs:
+            self.toaHist.fill(pixData['PixelIndex'], pixData['ToaData'], mask=(hit & (pixData['ToaOverflow'] == 0)))
+        if ('vpa' in self.outputs) or ('tz' in self.outputs):
+            # Shared by both conventions: the sentinel code of each one is only dropped when the
+            # histogram is read with its convention (TotHistFields())
+            totWord = pixData['TotData'].astype(np.intp) | (pixData['TotOverflow'].astype(np.intp) << 9)
+            self.totHist.fill(pixData['PixelIndex'], totWord, mask=hit)
+
+        if not self.keepHits:
+            return
+
+        hits = ExtractHits(pixData, self.outputs)
+
+        if 'toa' in hits:
+            self.HitData.extend(hits['toa']['ToaData'].tolist())
+
+        if 'vpa' in hits:
+            self.HitDataTOTf_vpa.extend(hits['vpa']['TOTf'].tolist())
+            self.HitDataTOTc_vpa.extend(hits['vpa']['TOTc'].tolist())
+            self.HitDataTOTc_int1_vpa.extend(hits['vpa']['TOTc_int1'].tolist())
+
+        if 'tz' in hits:
+            self.HitDataTOTf_tz.extend(hits['tz']['TOTf'].tolist())
+            self.HitDataTOTc_tz.extend(hits['tz']['TOTc'].tolist())
+            self.HitDataTOTc_int1_tz.extend(hits['tz']['TOTc_int1'].tolist())
+
+# Class for Reading the Data from File
+MyFileReader = HitReader
+
+# Class for Reading Data output by pixels
+MyPixelReader = HitReader
 
 #################################################################
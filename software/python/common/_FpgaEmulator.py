@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the 
+## top-level directory of this distribution and at: 
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html. 
+## No part of 'ATLAS ALTIROC DEV', including this file, 
+## may be copied, modified, propagated, or distributed except according to 
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import rogue
+import rogue.interfaces.stream
+import pyrogue as pr
+
+import time
+import struct
+import threading
+import collections
+import numpy as np
+
+import common
+
+# FormatVersion written in the header of the emulated event frames
+EmulatorFormatVersion = 0x1
+
+# TimeCounter/Timestamp clock
+EmulatorTimeClock = 160.0E+6
+
+class EmulatorRegisterMap(object):
+    '''
+    Register memory of the FPGA emulator, laid out from the pyrogue device definitions.
+
+    Every RemoteVariable of the device tree is indexed by its path relative to the tree
+    (e.g. 'Asic.Trig.EnableReadout') and the memory is preset with the variable defaults.
+    Unmapped addresses read as zero. Callbacks can be attached to the write of a register
+    (onWrite) and to every read (onRead, to refresh free running counters).
+    '''
+    def __init__(self, device):
+        self.words   = {}
+        self.fields  = {}
+        self.lock    = threading.RLock()
+        self._write  = {}
+        self._read   = []
+
+        for var in device.find(typ=pr.RemoteVariable):
+            path    = [var.name]
+            address = var.offset
+            node    = var.parent
+            while node is not device:
+                path.insert(0, node.name)
+                address += node.offset
+                node = node.parent
+            path = '.'.join(path)
+            self.fields[path] = (address, var.bitOffset[0], var.bitSize[0])
+            if isinstance(var._default, (bool, int)) and not isinstance(var, pr.BaseCommand):
+                self.set(path, int(var._default))
+
+    # Call function(value) after every write of a register
+    def onWrite(self, path, function):
+        self._write.setdefault(self.fields[path][0] & ~0x3, []).append((path, function))
+
+    # Call function() before every read transaction
+    def onRead(self, function):
+        self._read.append(function)
+
+    def get(self, path):
+        address, bitOffset, bitSize = self.fields[path]
+        with self.lock:
+            value = 0
+            for i in range((bitOffset+bitSize+31) >> 5):
+                value |= self.words.get((address & ~0x3)+4*i, 0) << (32*i)
+        return (value >> bitOffset) & ((1 << bitSize)-1)
+
+    def set(self, path, value):
+        address, bitOffset, bitSize = self.fields[path]
+        mask = ((1 << bitSize)-1) << bitOffset
+        with self.lock:
+            numWords = (bitOffset+bitSize+31) >> 5
+            current  = 0
+            for i in range(numWords):
+                current |= self.words.get((address & ~0x3)+4*i, 0) << (32*i)
+            current = (current & ~mask) | ((int(value) << bitOffset) & mask)
+            for i in range(numWords):
+                self.words[(address & ~0x3)+4*i] = (current >> (32*i)) & 0xFFFFFFFF
+
+    # Increment a counter register (wrapping at its size)
+    def increment(self, path, count=1):
+        with self.lock:
+            self.set(path, (self.get(path) + count) & ((1 << self.fields[path][2])-1))
+
+    # Block read of "size" bytes as a bytearray
+    def read(self, address, size):
+        for function in self._read:
+            function()
+        with self.lock:
+            data = np.array([self.words.get(address+4*i, 0) for i in range(size >> 2)], dtype='<u4')
+        return bytearray(data.tobytes())
+
+    # Block write of a bytes-like object, followed by the write callbacks
+    def write(self, address, data):
+        words = np.frombuffer(bytes(data), dtype='<u4')
+        calls = []
+        with self.lock:
+            for i, word in enumerate(words.tolist()):
+                self.words[address+4*i] = word
+                calls += self._write.get(address+4*i, [])
+        for path, function in calls:
+            function(self.get(path))
+
+#################################################################
+
+class SrpV3Emulator(rogue.interfaces.stream.Master, rogue.interfaces.stream.Slave):
+    '''
+    Server side of SRPv3: answers the request frames of rogue.protocols.srp.SrpV3 from an
+    EmulatorRegisterMap. The response echoes the 20 byte header, followed by the read (or
+    written) data and a 32-bit status word. Posted writes are not answered.
+    '''
+    def __init__(self, regs):
+        rogue.interfaces.stream.Master.__init__(self)
+        rogue.interfaces.stream.Slave.__init__(self)
+        self.regs     = regs
+        self.requests = 0
+
+    def _acceptFrame(self, frame):
+        request = bytearray(frame.getPayload())
+        frame.read(request, 0)
+        if len(request) < 20:
+            return
+        header  = struct.unpack_from('<5I', request, 0)
+        opCode  = (header[0] >> 8) & 0x3
+        address = header[2] | (header[3] << 32)
+        size    = header[4] + 1
+        self.requests += 1
+
+        # Only aligned 32-bit accesses are emulated
+        status = 0
+        data   = bytearray(size)
+        if ((header[0] & 0xFF) != 0x3) or (address & 0x3) or (size & 0x3):
+            status = 0xFF
+        elif opCode == 0:
+            data = self.regs.read(address, size)
+        elif opCode in [1, 2]:
+            data = request[20:20+size]
+            self.regs.write(address, data)
+            if opCode == 2:
+                return
+        else:
+            return
+
+        response = request[:20] + data + struct.pack('<I', status)
+        txFrame  = self._reqFrame(len(response), True)
+        txFrame.write(response, 0)
+        self._sendFrame(txFrame)
+
+#################################################################
+
+# Builds the 32-bit words of one event frame in the ParseFrame() layout: header (5 words),
+# iterations x readout pixel words and the dropTrigCnt word
+def EmulatorFrameWords(seqCnt, trigCnt, timestamp, pixels, hit, toa, tot, iterations=1, dropTrigCnt=0):
+    pixels    = np.asarray(pixels, dtype=np.uint32)
+    numPixels = len(pixels)
+    words     = np.zeros(5+iterations*numPixels+1, dtype='<u4')
+    words[0]  = EmulatorFormatVersion | ((iterations-1) << 12) | ((numPixels-1) << 27)
+    words[1]  = seqCnt & 0xFFFFFFFF
+    words[2]  = trigCnt & 0xFFFFFFFF
+    words[3]  = timestamp & 0xFFFFFFFF
+    words[4]  = (timestamp >> 32) & 0xFFFFFFFF
+
+    hit = np.asarray(hit, dtype=np.uint32)
+    toa = np.asarray(toa, dtype=np.int64)
+    tot = np.asarray(tot, dtype=np.int64)
+    pixWords  = np.tile(pixels, iterations) << 24
+    pixWords |= hit << 2
+    pixWords |= hit*(((tot > 0x1FF).astype(np.uint32) << 20) | (np.clip(tot, 0, 0x1FF).astype(np.uint32) << 11))
+    pixWords |= hit*(((toa > 0x7F).astype(np.uint32) << 10) | (np.clip(toa, 0, 0x7F).astype(np.uint32) << 3))
+    words[5:5+len(pixWords)] = pixWords
+    words[-1] = dropTrigCnt & 0xFFFFFFFF
+    return words
+
+class EventEmulator(rogue.interfaces.stream.Master):
+    '''
+    Synthetic event stream of the FPGA emulator.
+
+    Triggers come from CalPulse.Start (CalPulseCount+1 pulses, sent as fast as possible),
+    Readout.ForceStart and a free running source at "rate" Hz (BNC external trigger, or the
+    cal pulse while CalPulse.Continuous is set). A trigger is read out when Trig.EnableReadout
+    and the enable of its source are set, otherwise it is counted as dropped. Every readout
+    sends one frame with the pixels of Readout.RdIndexLut[0:ReadoutSize+1]; each pixel is hit
+    with probability "occupancy", with gaussian TOA/TOT codes.
+    '''
+    def __init__(self, regs, rate=0.0, occupancy=1.0, iterations=1,
+                 toaMean=64.0, toaSigma=2.0, totMean=100.0, totSigma=5.0, seed=None):
+        rogue.interfaces.stream.Master.__init__(self)
+        self.regs       = regs
+        self.rate       = rate
+        self.occupancy  = occupancy
+        self.iterations = iterations
+        self.toaMean    = toaMean
+        self.toaSigma   = toaSigma
+        self.totMean    = totMean
+        self.totSigma   = totSigma
+        self.frames     = 0
+        self._rng       = np.random.default_rng(seed)
+        self._t0        = time.monotonic()
+        self._pending   = collections.deque()
+        self._cond      = threading.Condition()
+        self._thread    = None
+        self._run       = False
+
+        regs.onRead(self._updateTime)
+        regs.onWrite('Asic.CalPulse.Start',     lambda value: self._calPulse() if value else None)
+        regs.onWrite('Asic.Readout.ForceStart', lambda value: self._trigger(None, 1) if value else None)
+        regs.onWrite('Asic.Trig.CountReset',    lambda value: self._countReset() if value else None)
+        regs.onWrite('Asic.Readout.SeqCntReset', lambda value: regs.set('Asic.Readout.SeqCnt', 0) if value else None)
+
+    def _timeCounter(self):
+        return int((time.monotonic()-self._t0)*EmulatorTimeClock)
+
+    def _updateTime(self):
+        self.regs.set('Asic.Trig.TimeCounter', self._timeCounter())
+
+    def _countReset(self):
+        for name in ['CalPulseTrig', 'BncExtTrig', 'LocalMasterTrig', 'RemoteSlaveTrig']:
+            self.regs.set(f'Asic.Trig.{name}Cnt', 0)
+            self.regs.set(f'Asic.Trig.{name}DropCnt', 0)
+        self.regs.set('Asic.Trig.TriggerCnt', 0)
+        self.regs.set('Asic.Trig.TriggerDropCnt', 0)
+
+    def _calPulse(self):
+        self._trigger('CalPulse', self.regs.get('Asic.CalPulse.CalPulseCount')+1)
+
+    # Count "count" triggers of a source and queue the ones that are read out
+    def _trigger(self, source, count):
+        regs = self.regs
+        with regs.lock:
+            trigCnt = regs.get('Asic.Trig.TriggerCnt')
+            regs.increment('Asic.Trig.TriggerCnt', count)
+            if source is not None:
+                regs.increment(f'Asic.Trig.{source}TrigCnt', count)
+            enabled = regs.get('Asic.Trig.EnableReadout') and ((source is None) or regs.get(f'Asic.Trig.En{source}Trig'))
+            if not enabled:
+                regs.increment('Asic.Trig.TriggerDropCnt', count)
+                if source is not None:
+                    regs.increment(f'Asic.Trig.{source}TrigDropCnt', count)
+                return
+        with self._cond:
+            self._pending.append([trigCnt, count])
+            self._cond.notify()
+
+    # Readout pixels from the lookup table
+    def readoutPixels(self):
+        size = self.regs.get('Asic.Readout.ReadoutSize')+1
+        return [self.regs.get(f'Asic.Readout.RdIndexLut[{i}]') for i in range(size)]
+
+    # Sends one event frame per trigger counter value
+    def sendEvents(self, trigCnts):
+        count     = len(trigCnts)
+        pixels    = self.readoutPixels()
+        numValues = count*self.iterations*len(pixels)
+        hit = (self._rng.random(numValues) < self.occupancy).reshape(count, -1)
+        toa = np.rint(self._rng.normal(self.toaMean, self.toaSigma, numValues)).reshape(count, -1)
+        tot = np.rint(self._rng.normal(self.totMean, self.totSigma, numValues)).reshape(count, -1)
+        for i in range(count):
+            with self.regs.lock:
+                seqCnt = self.regs.get('Asic.Readout.SeqCnt')
+                self.regs.set('Asic.Readout.SeqCnt', (seqCnt+1) & 0xFFFFFFFF)
+                dropTrigCnt = self.regs.get('Asic.Trig.TriggerDropCnt')
+            words = EmulatorFrameWords(
+                seqCnt      = seqCnt,
+                trigCnt     = trigCnts[i],
+                timestamp   = self._timeCounter(),
+                pixels      = pixels,
+                hit         = hit[i],
+                toa         = toa[i],
+                tot         = tot[i],
+                iterations  = self.iterations,
+                dropTrigCnt = dropTrigCnt,
+            )
+            frame = self._reqFrame(words.nbytes, True)
+            frame.write(bytearray(words.tobytes()), 0)
+            self._sendFrame(frame)
+            self.frames += 1
+
+    def start(self):
+        self._run    = True
+        self._thread = threading.Thread(target=self._runLoop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._run = False
+        with self._cond:
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _runLoop(self):
+        last   = time.monotonic()
+        credit = 0.0
+        while self._run:
+            # Free running triggers since the last pass
+            now    = time.monotonic()
+            credit += self.rate*(now-last)
+            last   = now
+            if int(credit) > 0:
+                source = 'CalPulse' if self.regs.get('Asic.CalPulse.Continuous') else 'BncExt'
+                self._trigger(source, int(credit))
+                credit -= int(credit)
+
+            with self._cond:
+                if not self._pending:
+                    self._cond.wait(0.01 if self.rate > 0 else 0.1)
+                # Up to 1024 events per pass
+                trigCnts = []
+                while self._pending and (len(trigCnts) < 1024):
+                    first, count = self._pending[0]
+                    num = min(count, 1024-len(trigCnts))
+                    trigCnts += range(first, first+num)
+                    self._pending[0] = [first+num, count-num]
+                    if num == count:
+                        self._pending.popleft()
+            if trigCnts:
+                self.sendEvents(trigCnts)
+
+#################################################################
+
+class FpgaEmulator(object):
+    '''
+    Software stand-in for the FEB FPGA in Top(ip=['simulation']) mode: serves SRPv3 on TCP
+    "port" (+1) and the event stream on "port"+2 (+3), the ports the simulation TcpClients
+    connect to. The register map is laid out from common.Fpga.
+
+    emulator = FpgaEmulator(rate=1000.0, occupancy=0.1)
+    emulator.start()
+    ...
+    emulator.stop()
+    '''
+    def __init__(self, port=9000, **kwargs):
+        self.fpga   = common.Fpga(name='Fpga')
+        self.regs   = EmulatorRegisterMap(self.fpga)
+        self.srp    = SrpV3Emulator(self.regs)
+        self.events = EventEmulator(self.regs, **kwargs)
+
+        self.srpServer  = rogue.interfaces.stream.TcpServer('127.0.0.1', port)
+        self.dataServer = rogue.interfaces.stream.TcpServer('127.0.0.1', port+2)
+        pr.streamConnectBiDir(self.srp, self.srpServer)
+        pr.streamConnect(self.events, self.dataServer)
+
+    def start(self):
+        self.events.start()
+
+    def stop(self):
+        self.events.stop()
+        self.srpServer.close()
+        self.dataServer.close()
+
+    def status(self):
+        return f'SRP requests = {self.srp.requests}, event frames = {self.events.frames}'
@@ -1,4 +1,5 @@
 import datetime
+import time
 import rogue
 import numpy as np
 import matplotlib
@@ -9,7 +10,7 @@ import os
 import common as feb
 
 
-class onlineEventDisplay(rogue.interfaces.stream.Slave):
+class onlineEventDisplay(feb.LiveHistograms):
     '''
     Python 3 compatible
     Requires numpy, matplotlib, datetime, os, shutil packages
@@ -66,7 +67,9 @@ class onlineEventDisplay(rogue.interfaces.stream.Slave):
     '''
     def __init__(self, plot_title='Live Display', toa_xrange=(0,127), toa_yrange=(0,24), toa_xbins=128, toa_ybins=25, 
                  tot_xrange=(0,127), tot_yrange=(0,24), tot_xbins=128, tot_ybins=25, 
-                 xpixels=5, ypixels=5, font_size=6, fig_size=(15,8), submitDir='./', overwrite=False):
+                 xpixels=5, ypixels=5, font_size=6, fig_size=(15,8), submitDir='./', overwrite=False,
+                 blit=True, xtick_step=8, clim_headroom=1.25, rescale_fraction=0.5,
+                 window=10.0, slices=10, show_window=True):
         '''
         To initialize:
         myObject = onlineEventDisplay(TOA_range_of_bit_values like (0,127), TOA_range_of_number_of_pixels like (0,24), 
@@ -83,13 +86,25 @@ class onlineEventDisplay(rogue.interfaces.stream.Slave):
             1. Large :  Font Size = 8, Figure Size = (30,15)
             2. Medium:  Font Size = 6, Figure Size = (15,8)
             3. Small :  Font Size = 4, Figure Size = (10,6)
+
+        With blit=True the static part of the figure (axes, ticks, colorbars) is drawn once and
+        cached, and a refresh only redraws the three images on top of it. The color scales are
+        only rescaled (full redraw) when the data leaves the current range or shrinks below
+        rescale_fraction of it, with clim_headroom of margin for the growing histograms.
+        Only every xtick_step-th TOA/TOT bin is labelled.
+
+        With show_window=True the histograms of the last "window" seconds (see LiveHistograms)
+        are shown next to the whole run ones.
         '''
-        rogue.interfaces.stream.Slave.__init__(self)
-        self.has_new_data = False
         self.toa_xrange, self.toa_yrange, self.toa_xbins, self.toa_ybins = toa_xrange, toa_yrange, toa_xbins,toa_ybins
         self.tot_xrange, self.tot_yrange, self.tot_xbins, self.tot_ybins = tot_xrange, tot_yrange, tot_xbins,tot_ybins
         self.xpixels, self.ypixels, self.submitDir, self.overwrite = xpixels, ypixels, submitDir, overwrite
-        self.tot_binning_count = self.tot_xrange[1] / self.toa_xrange[1]
+        feb.LiveHistograms.__init__(self, toa_xbins=toa_xbins, toa_ybins=toa_ybins, tot_xbins=tot_xbins, tot_ybins=tot_ybins,
+                                    xpixels=xpixels, ypixels=ypixels, tot_binning_count=self.tot_xrange[1] / self.toa_xrange[1],
+                                    window=window, slices=slices)
+        self.show_window = show_window
+        self.blit, self.clim_headroom, self.rescale_fraction = blit, clim_headroom, rescale_fraction
+        self.background, self.timer, self.render_time = None, None, 0.0
 
         if os.path.exists(self.submitDir):
             if not self.overwrite:
@@ -104,9 +119,6 @@ class onlineEventDisplay(rogue.interfaces.stream.Slave):
             else:  
                 print ("Successfully created the directory %s" % self.submitDir)
     
-        self.toa_array = np.zeros((toa_ybins,toa_xbins), dtype=int)
-        self.tot_array = np.zeros((tot_ybins,tot_xbins), dtype=int)
-        self.hits_toa_array = np.zeros((ypixels,xpixels), dtype=int)
         self.hits_tot_array = np.zeros((ypixels,xpixels), dtype=int)
         plt.rcParams.update({'font.size': font_size})
 #         plt.ion()
@@ -114,87 +126,101 @@ class onlineEventDisplay(rogue.interfaces.stream.Slave):
         self.fig = plt.figure(num=plot_title, figsize=fig_size, dpi=100)
         self.gs = gridspec.GridSpec(6, 16)
         
-        self.ax = self.fig.add_subplot(self.gs[:3, :14])
-        self.ax.set_title('TOA')
-        self.ax.set_xlabel('TOA Discrete Units')
-        self.ax.set_ylabel('Pixel Number')
-        self.im = self.ax.imshow(self.toa_array, aspect='auto')
-        self.cbar = self.ax.figure.colorbar(self.im, ax=self.ax, orientation='horizontal', aspect=150, pad=.13)
-        self.cbar.ax.set_ylabel("Scale")
-        self.ax.set_xticks(np.arange(self.toa_xbins))
-        self.ax.set_yticks(np.arange(self.toa_ybins))
-        self.ax.set_xticklabels(np.linspace(start=self.toa_xrange[0],stop=self.toa_xrange[1],num=self.toa_xbins,dtype=int))
-        self.ax.set_yticklabels(np.linspace(start=self.toa_yrange[0],stop=self.toa_yrange[1],num=self.toa_ybins,dtype=int))
-        plt.setp(self.ax.get_xticklabels(), rotation=90, ha="right",
-                 rotation_mode="anchor")
-        for edge, spine in self.ax.spines.items():
-            spine.set_visible(False)
-        self.ax.set_xticks(np.arange(self.toa_xbins+1)-.5, minor=True)
-        self.ax.set_yticks(np.arange(self.toa_ybins+1)-.5, minor=True)
-        self.ax.grid(which="minor", color="w", linestyle='-', linewidth=1)
-        self.ax.tick_params(which="minor", bottom=False, left=False)
+        self.xtick_step = xtick_step
+        toa, tot, hits = [np.zeros(shape, dtype=int) for shape in self.shapes]
+        if self.show_window:
+            last = f', last {self.window:g} s'
+            self.ax,  self.im,  self.cbar  = self.__addHistogram(self.gs[:3, :7],  'TOA', toa, self.toa_xrange, self.toa_yrange)
+            self.ax1, self.im1, self.cbar1 = self.__addHistogram(self.gs[3:, :7],  'TOT', tot, self.tot_xrange, self.tot_yrange)
+            self.ax2, self.im2, self.cbar2 = self.__addHitMap(self.gs[:3, 14:], 'TOA - Hits', hits)
+            windowPanels = [self.__addHistogram(self.gs[:3, 7:14], 'TOA'+last, toa, self.toa_xrange, self.toa_yrange),
+                            self.__addHistogram(self.gs[3:, 7:14], 'TOT'+last, tot, self.tot_xrange, self.tot_yrange),
+                            self.__addHitMap(self.gs[3:, 14:], 'TOA - Hits'+last, hits)]
+        else:
+            self.ax,  self.im,  self.cbar  = self.__addHistogram(self.gs[:3, :14], 'TOA', toa, self.toa_xrange, self.toa_yrange)
+            self.ax1, self.im1, self.cbar1 = self.__addHistogram(self.gs[3:, :14], 'TOT', tot, self.tot_xrange, self.tot_yrange)
+            self.ax2, self.im2, self.cbar2 = self.__addHitMap(self.gs[2:5, 14:], 'TOA - Hits', hits)
+            windowPanels = []
         
-        self.ax2 = self.fig.add_subplot(self.gs[2:5, 14:])
-        self.ax2.set_title('TOA - Hits')
-        self.ax2.set_xlabel('Column')
-        self.ax2.set_ylabel('Row')
-        self.im2 = self.ax2.imshow(self.hits_toa_array, aspect='equal', cmap='cividis')
-        self.cbar2 = self.ax2.figure.colorbar(self.im2, ax=self.ax2, orientation='horizontal', aspect=20, pad=.15)
-        self.cbar2.ax.set_ylabel("Scale")
-        self.ax2.set_xticks(np.arange(self.xpixels))
-        self.ax2.set_yticks(np.arange(self.ypixels))
-        self.ax2.set_xticklabels(np.linspace(start=0,stop=self.xpixels-1,num=self.xpixels,dtype=int))
-        self.ax2.set_yticklabels(np.linspace(start=0,stop=self.ypixels-1,num=self.ypixels,dtype=int))
-        for edge, spine in self.ax2.spines.items():
-            spine.set_visible(False)
-        self.ax2.set_xticks(np.arange(self.xpixels+1)-.5, minor=True)
-        self.ax2.set_yticks(np.arange(self.ypixels+1)-.5, minor=True)
-        self.ax2.grid(which="minor", color="w", linestyle='-', linewidth=3)
-        self.ax2.tick_params(which="minor", bottom=False, left=False)
+        self.fig.tight_layout()
         
-        self.ax1 = self.fig.add_subplot(self.gs[3:, :14])
-        self.ax1.set_title('TOT')
-        self.ax1.set_xlabel('TOT Discrete Units')
-        self.ax1.set_ylabel('Pixel Number')
-        self.im1 = self.ax1.imshow(self.tot_array, aspect='auto')
-        self.cbar1 = self.ax1.figure.colorbar(self.im1, ax=self.ax1, orientation='horizontal', aspect=150, pad=.13)
-        self.cbar1.ax.set_ylabel("Scale")
-        self.ax1.set_xticks(np.arange(self.tot_xbins))
-        self.ax1.set_yticks(np.arange(self.tot_ybins))
-        self.ax1.set_xticklabels(np.linspace(start=self.tot_xrange[0],stop=self.tot_xrange[1],num=self.tot_xbins,dtype=int))
-        self.ax1.set_yticklabels(np.linspace(start=self.tot_yrange[0],stop=self.tot_yrange[1],num=self.tot_ybins,dtype=int))
-        plt.setp(self.ax1.get_xticklabels(), rotation=90, ha="right",
-                 rotation_mode="anchor")
-        for edge, spine in self.ax1.spines.items():
-            spine.set_visible(False)
-        self.ax1.set_xticks(np.arange(self.tot_xbins+1)-.5, minor=True)
-        self.ax1.set_yticks(np.arange(self.tot_ybins+1)-.5, minor=True)
-        self.ax1.grid(which="minor", color="w", linestyle='-', linewidth=1)
-        self.ax1.tick_params(which="minor", bottom=False, left=False)
+        # Blitting: the images are drawn on top of the cached background after every full draw
+        self.images = [(self.ax, self.im, self.cbar), (self.ax1, self.im1, self.cbar1), (self.ax2, self.im2, self.cbar2)] + windowPanels
+        if self.blit:
+            for (ax, im, cbar) in self.images:
+                im.set_animated(True)
+            self.fig.canvas.mpl_connect('draw_event', self._onDraw)
         
-        self.fig.tight_layout()
         self.fig.canvas.draw()
         plt.pause(0.000001)
         self.fig.canvas.flush_events()
         
+    # TOA or TOT histogram panel (pixel vs code)
+    def __addHistogram(self, slot, title, data, xrange, yrange):
+        ybins, xbins = data.shape
+        ax = self.fig.add_subplot(slot)
+        ax.set_title(title)
+        ax.set_xlabel(f'{title[:3]} Discrete Units')
+        ax.set_ylabel('Pixel Number')
+        im = ax.imshow(data, aspect='auto')
+        cbar = ax.figure.colorbar(im, ax=ax, orientation='horizontal', aspect=150 if not self.show_window else 75, pad=.13)
+        cbar.ax.set_ylabel("Scale")
+        ax.set_xticks(np.arange(xbins)[::self.xtick_step])
+        ax.set_yticks(np.arange(ybins))
+        ax.set_xticklabels(np.linspace(start=xrange[0],stop=xrange[1],num=xbins,dtype=int)[::self.xtick_step])
+        ax.set_yticklabels(np.linspace(start=yrange[0],stop=yrange[1],num=ybins,dtype=int))
+        plt.setp(ax.get_xticklabels(), rotation=90, ha="right",
+                 rotation_mode="anchor")
+        for edge, spine in ax.spines.items():
+            spine.set_visible(False)
+        ax.set_xticks(np.arange(xbins+1)-.5, minor=True)
+        ax.set_yticks(np.arange(ybins+1)-.5, minor=True)
+        ax.grid(which="minor", color="w", linestyle='-', linewidth=1)
+        ax.tick_params(which="minor", bottom=False, left=False)
+        return ax, im, cbar
+        
+    # Hit map panel (row vs column)
+    def __addHitMap(self, slot, title, data):
+        ax = self.fig.add_subplot(slot)
+        ax.set_title(title)
+        ax.set_xlabel('Column')
+        ax.set_ylabel('Row')
+        im = ax.imshow(data, aspect='equal', cmap='cividis')
+        cbar = ax.figure.colorbar(im, ax=ax, orientation='horizontal', aspect=20, pad=.15)
+        cbar.ax.set_ylabel("Scale")
+        ax.set_xticks(np.arange(self.xpixels))
+        ax.set_yticks(np.arange(self.ypixels))
+        ax.set_xticklabels(np.linspace(start=0,stop=self.xpixels-1,num=self.xpixels,dtype=int))
+        ax.set_yticklabels(np.linspace(start=0,stop=self.ypixels-1,num=self.ypixels,dtype=int))
+        for edge, spine in ax.spines.items():
+            spine.set_visible(False)
+        ax.set_xticks(np.arange(self.xpixels+1)-.5, minor=True)
+        ax.set_yticks(np.arange(self.ypixels+1)-.5, minor=True)
+        ax.grid(which="minor", color="w", linestyle='-', linewidth=3)
+        ax.tick_params(which="minor", bottom=False, left=False)
+        return ax, im, cbar
+        
     def reset(self):
         '''
         To reset, or zero out, the stored arrays that integrate the number of hits and TOT/TOA values recorded:
             myObject.reset()
         '''
-        self.toa_array = np.zeros((self.toa_ybins,self.toa_xbins), dtype=int)
-        self.tot_array = np.zeros((self.tot_ybins,self.tot_xbins), dtype=int)
-        self.hits_toa_array = np.zeros((self.ypixels,self.xpixels), dtype=int)
-        self.refreshDisplay()
+        feb.LiveHistograms.reset(self)
+        # With the refresh timer running the display is only drawn from the GUI event loop
+        if self.timer is None:
+            self.refreshDisplay()
+        else:
+            self.has_new_data = True
         
     def snapshot(self):
         '''
         This function is used to make a special call to the makeDisplay() that saves the current state of the plot
         to a pdf file in the same directory as the script
         '''
-        self.__makeDisplay(self.toa_array, self.tot_array, self.hits_toa_array, 
+        integrated, windowed = self.histograms()
+        self.__makeDisplay(*integrated, 
                         "onlineEventDisplaySnapshot-{date:%Y-%m-%d__%H_%M_%S}".format(date=datetime.datetime.now()),
-                          snap=True)
+                          snap=True, window_data=windowed)
         
     def instantaneous(self, toa_data, tot_data, hits_toa_data):
         '''
@@ -206,52 +232,35 @@ class onlineEventDisplay(rogue.interfaces.stream.Slave):
                           snap=True)
     
 
-    def _acceptFrame(self,frame):
-        snap=False 
-        instant=False
-        # First it is good practice to hold a lock on the frame data.
-        with frame.lock():
-            eventFrame = feb.ParseFrame(frame)
-
-            hit_data = np.zeros(self.xpixels*self.ypixels, dtype=int)
-            for i in range( len(eventFrame.pixValue) ):
-                pixel = eventFrame.pixValue[i]
-                if pixel.Hit and not pixel.ToaOverflow:
-                    hit_data[pixel.PixelIndex] = pixel.Hit
-                    self.toa_array[pixel.PixelIndex][pixel.ToaData] += 1
-                    #scale down tot data so we can use 128 bins for tot and toa
-                    HitDataTOTc = (pixel.TotData >>  2) & 0x7F
-                    tot_bin = int(HitDataTOTc/self.tot_binning_count)
-                    self.tot_array[pixel.PixelIndex][tot_bin] += 1
-            hits_toa_data_binary = np.reshape(hit_data, (self.ypixels,self.xpixels), order='F')
-            self.hits_toa_array += hits_toa_data_binary
-        if(snap): self.snapshot()
-        if(instant): self.instantaneous(toa_data_binary, tot_data_binary, hits_toa_data_binary)
-        self.has_new_data = True
-
-
     def refreshDisplay(self):
         self.has_new_data = False
-        self.__makeDisplay(self.toa_array, self.tot_array, self.hits_toa_array)
+        integrated, windowed = self.histograms()
+        self.__makeDisplay(*integrated, window_data=windowed)
         
 
-    def makeDisplay(self, toa_data, tot_data, hits_toa_data, figname="onlineEventDisplay", snap=False):
+    def makeDisplay(self, toa_data, tot_data, hits_toa_data, figname="onlineEventDisplay", snap=False, window_data=None):
         '''
         This function updates the plot with the new arrays. The comments can be uncommented if
         one wishes to establish a fixed number of tick marks on the various colorbars in the plot
         A copy of this function is made private to protect against changes from inheritance 
         
+        window_data = (toa, tot, hits) of the last window, shown next to the other arrays with
+        show_window=True (the same arrays are shown if it is None)
+        
         the plt.pause() can be uncommented if one wishes to keep the plot constantly in the foreground
         '''
-        self.im.set_data(toa_data)
-        self.im1.set_data(tot_data)
-        self.im2.set_data(hits_toa_data)
-        self.cbar.mappable.set_clim(vmin=np.amin(toa_data),vmax=np.amax(toa_data))
-        self.cbar1.mappable.set_clim(vmin=np.amin(tot_data),vmax=np.amax(tot_data))
-        self.cbar2.mappable.set_clim(vmin=np.amin(hits_toa_data),vmax=np.amax(hits_toa_data))
-        self.cbar.draw_all() 
-        self.cbar1.draw_all() 
-        self.cbar2.draw_all() 
+        if self.blit and not snap:
+            self.__blitDisplay(toa_data, tot_data, hits_toa_data, window_data)
+            return
+        
+        data = self.__panelData(toa_data, tot_data, hits_toa_data, window_data)
+        
+        # Snapshots are full draws, including the (otherwise blitted) images
+        for (ax, im, cbar), array in zip(self.images, data):
+            im.set_animated(False)
+            im.set_data(array)
+            cbar.mappable.set_clim(vmin=np.amin(array),vmax=np.amax(array))
+            cbar.draw_all() 
         #self.fig.tight_layout()
         if(snap): self.fig.savefig(self.submitDir+"/"+ figname + ".pdf")
         self.fig.canvas.draw()
@@ -261,5 +270,75 @@ class onlineEventDisplay(rogue.interfaces.stream.Slave):
         #self.fig.canvas.update()
 
         self.fig.canvas.flush_events()
+        for (ax, im, cbar) in self.images:
+            im.set_animated(self.blit)
 
     __makeDisplay = makeDisplay
+    
+    # Arrays of the panels, in the order of self.images
+    def __panelData(self, toa_data, tot_data, hits_toa_data, window_data):
+        data = [toa_data, tot_data, hits_toa_data]
+        if self.show_window:
+            data += list(window_data) if window_data is not None else data
+        return data
+    
+    def blitDisplay(self, toa_data, tot_data, hits_toa_data, window_data=None):
+        '''
+        Updates the images only. The cached background is restored and the images are drawn on top,
+        unless a color scale has to be rescaled, which needs a full draw of the figure (the background
+        is then cached again by _onDraw())
+        '''
+        rescale = False
+        for (ax, im, cbar), data in zip(self.images, self.__panelData(toa_data, tot_data, hits_toa_data, window_data)):
+            im.set_data(data)
+            rescale = self.__rescale(cbar, data) or rescale
+        
+        canvas = self.fig.canvas
+        if rescale or (self.background is None):
+            canvas.draw()
+        else:
+            canvas.restore_region(self.background)
+            for (ax, im, cbar) in self.images:
+                ax.draw_artist(im)
+            canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+        
+    __blitDisplay = blitDisplay
+    
+    # Rescales a color scale when the data leaves its range or only uses a small part of it
+    def __rescale(self, cbar, data):
+        vmin, vmax = cbar.mappable.get_clim()
+        lo, hi = np.amin(data), np.amax(data)
+        if (lo < vmin) or (hi > vmax) or ((hi-lo) < self.rescale_fraction*(vmax-vmin)):
+            cbar.mappable.set_clim(vmin=lo, vmax=lo + max(hi-lo, 1)*self.clim_headroom)
+            cbar.draw_all()
+            return True
+        return False
+    
+    # Caches the background after every full draw (also after a window resize) and puts the images back
+    def _onDraw(self, event):
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        for (ax, im, cbar) in self.images:
+            ax.draw_artist(im)
+    
+    def startRefresh(self, maxRate=10.0, load=0.25):
+        '''
+        Refreshes the display from the GUI event loop (a canvas timer, so several displays can share
+        the GUI thread) at up to maxRate Hz, and only when new data arrived or a window slice closed. The refresh interval
+        follows the measured render time so that rendering takes at most "load" of the time.
+        '''
+        self.timer = self.fig.canvas.new_timer(interval=int(1000/maxRate))
+        self.timer.add_callback(self.__refreshTick, maxRate, load)
+        self.timer.start()
+        
+    def stopRefresh(self):
+        if self.timer is not None:
+            self.timer.stop()
+            self.timer = None
+    
+    def __refreshTick(self, maxRate, load):
+        if self.has_new_data or (self.show_window and time.monotonic() >= self.slice_end):
+            start = time.monotonic()
+            self.refreshDisplay()
+            self.render_time = 0.8*self.render_time + 0.2*(time.monotonic()-start)
+            self.timer.interval = int(1000*max(1.0/maxRate, self.render_time/load))
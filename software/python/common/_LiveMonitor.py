@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the 
+## top-level directory of this distribution and at: 
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html. 
+## No part of 'ATLAS ALTIROC DEV', including this file, 
+## may be copied, modified, propagated, or distributed except according to 
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import rogue
+import re
+import time
+import threading
+import collections
+import click
+import numpy as np
+
+import common
+
+class LiveHistograms(rogue.interfaces.stream.Slave):
+    '''
+    Online TOA, TOT and hit map accumulators of one FPGA data stream, without any display.
+
+        toa  [pixel, TOA code]
+        tot  [pixel, TOT bin]  (TOT code scaled down to the 128 TOA bins)
+        hits [row, column]     (frames with a hit, pixels are numbered column by column)
+
+    Only hits without TOA overflow are counted. This is the accumulation part of the live display
+    (onlineEventDisplay) and of the headless LiveMonitor.
+
+    The histograms are kept for the whole run and for the last "window" seconds (histograms()).
+    Frames are only added to the current time slice of a ring of "slices" slices; when a slice
+    closes it is added to the run and window sums, and the oldest slice is subtracted from the
+    window, so the sliding window costs nothing per frame. The window covers between
+    window*(slices-1)/slices and window seconds.
+    '''
+    def __init__(self, toa_xbins=128, toa_ybins=25, tot_xbins=128, tot_ybins=25, xpixels=5, ypixels=5, tot_binning_count=1.0,
+                 window=10.0, slices=10):
+        rogue.interfaces.stream.Slave.__init__(self)
+        self.decoder = common.FrameDecoder()
+        self.lock    = threading.Lock()
+        self.has_new_data = False
+        self.frames  = 0
+        self.toa_xbins, self.toa_ybins, self.tot_xbins, self.tot_ybins = toa_xbins, toa_ybins, tot_xbins, tot_ybins
+        self.xpixels, self.ypixels, self.tot_binning_count = xpixels, ypixels, tot_binning_count
+        self.window, self.slices, self.slice_time = window, slices, window/slices
+
+        # Ring of time slices, run and window sums of the closed slices: toa, tot, hits
+        self.shapes     = [(toa_ybins,toa_xbins), (tot_ybins,tot_xbins), (ypixels,xpixels)]
+        self.ring       = [np.zeros((slices,)+shape, dtype=int) for shape in self.shapes]
+        self.run_sum    = [np.zeros(shape, dtype=int) for shape in self.shapes]
+        self.window_sum = [np.zeros(shape, dtype=int) for shape in self.shapes]
+        self.slot       = 0
+        self.current    = [ring[0] for ring in self.ring]
+        self.slice_end  = time.monotonic() + self.slice_time
+
+        # Lookup tables and scratch buffers for the vectorized accumulation in _acceptFrame()
+        # TOT code -> TOT bin (scaled down so we can use 128 bins for tot and toa)
+        self.tot_bin_lut = (((np.arange(0x200) >> 2) & 0x7F) / self.tot_binning_count).astype(np.intp)
+        # Pixel index -> flat position in the hit map (pixels are numbered column by column)
+        pixels = np.arange(xpixels*ypixels)
+        self.hit_map_lut = (pixels % ypixels)*xpixels + (pixels // ypixels)
+        self.hit_scratch = np.zeros(xpixels*ypixels, dtype=bool)
+        self.word_scratch  = np.empty(common.MaxFrameWords, dtype=np.uint32)
+        self.valid_scratch = np.empty(common.MaxFrameWords, dtype=bool)
+
+    # Zero the accumulators
+    def reset(self):
+        with self.lock:
+            for array in self.ring + self.run_sum + self.window_sum:
+                array[...] = 0
+            self.frames = 0
+
+    # Close the slices that ended before "now" (called with the lock held)
+    def _rotate(self, now):
+        steps = int((now - self.slice_end) // self.slice_time) + 1
+        for i in range(min(steps, self.slices)):
+            for ring, runSum, windowSum in zip(self.ring, self.run_sum, self.window_sum):
+                runSum    += ring[self.slot]
+                windowSum += ring[self.slot]
+                windowSum -= ring[(self.slot+1) % self.slices]
+                ring[(self.slot+1) % self.slices] = 0
+            self.slot = (self.slot+1) % self.slices
+        self.current    = [ring[self.slot] for ring in self.ring]
+        self.slice_end += steps*self.slice_time
+
+    # Histograms of the whole run and of the last "window" seconds, each as [toa, tot, hits] (new arrays)
+    def histograms(self):
+        with self.lock:
+            now = time.monotonic()
+            if now >= self.slice_end:
+                self._rotate(now)
+            return ([runSum + current for runSum, current in zip(self.run_sum, self.current)],
+                    [windowSum + current for windowSum, current in zip(self.window_sum, self.current)])
+
+    def _acceptFrame(self,frame):
+        # First it is good practice to hold a lock on the frame data.
+        with frame.lock(), self.lock:
+            now = time.monotonic()
+            if now >= self.slice_end:
+                self._rotate(now)
+            toa, tot, hits = self.current
+
+            pixWords = self.decoder.pixWords(frame)
+
+            # Hits (bit 2) that are not TOA overflows (bit 10)
+            scratch = self.word_scratch[:len(pixWords)]
+            valid   = self.valid_scratch[:len(pixWords)]
+            np.bitwise_and(pixWords, 0x404, out=scratch)
+            np.equal(scratch, 0x004, out=valid)
+            hitWords = pixWords[valid]
+            pixel    = ((hitWords >> 24) & 0x1F).astype(np.intp)
+
+            np.add.at(toa, (pixel, (hitWords >> 3) & 0x7F), 1)
+            np.add.at(tot, (pixel, self.tot_bin_lut[(hitWords >> 11) & 0x1FF]), 1)
+
+            # A pixel counts once per frame in the hit map
+            self.hit_scratch[:] = False
+            self.hit_scratch[pixel] = True
+            hits.ravel()[self.hit_map_lut[self.hit_scratch]] += 1
+            self.frames += 1
+        self.has_new_data = True
+
+#################################################################
+
+# Header of a LiveMonitor shared memory segment, followed by the whole run and the last window
+# toa, tot and hit map arrays (int64)
+LiveMonitorHeader = np.dtype([
+    ('Magic',  'S8'),
+    ('Seq',    '<u8'),        # Odd while a snapshot is being written
+    ('Time',   '<f8'),        # time.time() of the snapshot
+    ('Frames', '<u8'),        # Frames accumulated since the last reset
+    ('Window', '<f8'),        # Length of the sliding window (s)
+    ('Shapes', '<u4', (6,2)), # Shapes of the arrays
+])
+LiveMonitorMagic = b'ALTLIVE2'
+
+# A segment published less than this many seconds ago belongs to a running monitor
+LiveMonitorActiveTime = 10.0
+
+# Shared memory segment name of the LiveMonitor of FPGA "fpga" at "ip"
+def LiveMonitorName(ip, fpga=0):
+    return 'altiroc_live_{}_{}'.format(re.sub(r'[^0-9A-Za-z]', '_', ip), fpga)
+
+# One published snapshot (independent copies of the arrays)
+LiveSnapshot = collections.namedtuple('LiveSnapshot', ['seq', 'time', 'frames', 'window',
+                                                       'toa', 'tot', 'hits', 'toa_window', 'tot_window', 'hits_window'])
+
+def _liveMonitorViews(buf, shapes):
+    header = np.ndarray((), dtype=LiveMonitorHeader, buffer=buf)
+    views  = []
+    offset = LiveMonitorHeader.itemsize
+    for shape in shapes:
+        shape = tuple(int(n) for n in shape)
+        views.append(np.ndarray(shape, dtype='<i8', buffer=buf, offset=offset))
+        offset += 8*int(np.prod(shape))
+    return header, views
+
+class LiveMonitor(LiveHistograms):
+    '''
+    Headless live monitor: accumulates the histograms of one FPGA data stream (LiveHistograms) and
+    publishes a snapshot every "interval" seconds to the shared memory segment "name". Nothing is
+    drawn in the acquisition process; any number of viewers (LiveMonitorReader,
+    scripts/LiveMonitorViewer.py) can attach to the segment and detach at any time.
+
+    monitor = LiveMonitor(LiveMonitorName('10.0.0.1', 0))
+    pr.streamTap(top.dataStream[0], monitor)
+    monitor.start()
+    '''
+    def __init__(self, name, interval=0.5, **kwargs):
+        super().__init__(**kwargs)
+        self.name     = name
+        self.interval = interval
+        self._thread  = None
+        self._stop    = threading.Event()
+
+        # Python >= 3.8
+        from multiprocessing import shared_memory
+
+        shapes = self.shapes + self.shapes
+        size   = LiveMonitorHeader.itemsize + sum(8*int(np.prod(shape)) for shape in shapes)
+
+        # Replace the segment of a previous run that did not exit cleanly, but never one that
+        # is not a LiveMonitor segment or that is still being published
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            stale = None
+        if stale is not None:
+            header = np.ndarray((), dtype=LiveMonitorHeader, buffer=stale.buf) if stale.size >= LiveMonitorHeader.itemsize else None
+            if header is None or header['Magic'] != LiveMonitorMagic:
+                errMsg = f'Shared memory segment {name} exists and is not a LiveMonitor segment'
+            elif time.time() - float(header['Time']) < LiveMonitorActiveTime:
+                errMsg = f'LiveMonitor {name} is in use (published {time.time()-float(header["Time"]):.1f} s ago)'
+            else:
+                errMsg = None
+            del header
+            stale.close()
+            if errMsg is not None:
+                click.secho(errMsg, bg='red')
+                raise ValueError(errMsg)
+            stale.unlink()
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.header, self.views = _liveMonitorViews(self.shm.buf, shapes)
+        self.header['Magic']  = LiveMonitorMagic
+        self.header['Window'] = self.window
+        self.header['Shapes'] = shapes
+        self.publish()
+
+    # Copy the current histograms to the shared memory segment
+    def publish(self):
+        integrated, windowed = self.histograms()
+        self.header['Seq'] += 1
+        for view, array in zip(self.views, integrated + windowed):
+            view[...] = array
+        self.header['Frames'] = self.frames
+        self.header['Time']   = time.time()
+        self.header['Seq'] += 1
+
+    def start(self):
+        self._stop.clear()
+        def run():
+            # Published even without new data, the window keeps sliding
+            while not self._stop.wait(self.interval):
+                self.publish()
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.publish()
+
+    # Stop publishing and remove the segment
+    def close(self):
+        self.stop()
+        self.header, self.views = None, None
+        self.shm.close()
+        self.shm.unlink()
+
+class LiveMonitorReader(object):
+    '''
+    Attaches to the shared memory segment of a LiveMonitor (raises FileNotFoundError if it does not exist)
+
+    reader = LiveMonitorReader(LiveMonitorName('10.0.0.1', 0))
+    snap   = reader.read()   # None if nothing was published since the last read
+    '''
+    def __init__(self, name):
+        # Python >= 3.8
+        from multiprocessing import shared_memory, resource_tracker
+
+        self.name = name
+        self.shm  = shared_memory.SharedMemory(name=name)
+        # The segment belongs to the monitor: do not let this process remove it at exit
+        resource_tracker.unregister(self.shm._name, 'shared_memory')
+        header = np.ndarray((), dtype=LiveMonitorHeader, buffer=self.shm.buf)
+        if header['Magic'] != LiveMonitorMagic:
+            self.close()
+            raise ValueError(f'{name} is not a LiveMonitor segment')
+        self.header, self.views = _liveMonitorViews(self.shm.buf, header['Shapes'])
+        self.lastSeq = None
+
+    # Consistent copy of the latest snapshot (seqlock), or None if it was already read
+    def read(self, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            seq = int(self.header['Seq'])
+            if (seq & 0x1) == 0:
+                if seq == self.lastSeq:
+                    return None
+                snap = LiveSnapshot(seq, float(self.header['Time']), int(self.header['Frames']), float(self.header['Window']),
+                                    *[view.copy() for view in self.views])
+                if int(self.header['Seq']) == seq:
+                    self.lastSeq = seq
+                    return snap
+            if time.monotonic() > deadline:
+                return None
+            time.sleep(0.001)
+
+    def close(self):
+        self.header, self.views = None, None
+        self.shm.close()
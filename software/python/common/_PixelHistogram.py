@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the 
+## top-level directory of this distribution and at: 
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html. 
+## No part of 'ATLAS ALTIROC DEV', including this file, 
+## may be copied, modified, propagated, or distributed except according to 
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import numpy as np
+
+# Size of the TOA (7-bit) and TOT (9-bit) code spaces
+ToaCodes = 128
+TotCodes = 512
+
+# TOT code with its overflow bit (TotOverflow << 9 | TotData)
+TotWords = 2*TotCodes
+
+# Size of the PixelIndex (5-bit) space
+NumPixelIndex = 32
+
+class PixelHistogram(object):
+    '''
+    Fixed-size per-pixel histogram of an integer code space (e.g. TOA or TOT codes).
+
+    Memory is numPixels*numBins counters, whatever the length of the run. Histograms
+    filled in different threads/files are combined with merge() (or +=) and the
+    statistics are computed from the bins:
+
+    hist = PixelHistogram(ToaCodes)
+    hist.fill(pixData['PixelIndex'], pixData['ToaData'], mask=(pixData['Hit'] == 1))
+    hist.count(4), hist.mean(4), hist.std(4)
+    '''
+    def __init__(self, numBins, numPixels=NumPixelIndex):
+        self.numBins   = numBins
+        self.numPixels = numPixels
+        self.counts    = np.zeros((numPixels, numBins), dtype=np.int64)
+        self.flat      = self.counts.reshape(-1)
+        self.codes     = np.arange(numBins, dtype=np.float64)
+
+    def reset(self):
+        self.counts[:] = 0
+
+    # Add one entry per (pixel, code) pair, optionally only where mask is True
+    def fill(self, pixel, code, mask=None):
+        pixel = np.asarray(pixel)
+        code  = np.asarray(code)
+        if mask is not None:
+            pixel = pixel[mask]
+            code  = code[mask]
+        index = pixel.astype(np.intp) * self.numBins + code
+        if len(index) > (self.flat.size >> 4):
+            self.flat += np.bincount(index, minlength=self.flat.size)
+        else:
+            np.add.at(self.flat, index, 1)
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def copy(self):
+        hist = PixelHistogram(self.numBins, self.numPixels)
+        hist.counts[:] = self.counts
+        return hist
+
+    # Bin contents of one pixel, or summed over all the pixels (pixel=None)
+    def bins(self, pixel=None):
+        if pixel is None:
+            return self.counts.sum(axis=0)
+        return self.counts[pixel]
+
+    def count(self, pixel=None):
+        return int(self.bins(pixel).sum())
+
+    # Mean code value (0 if empty)
+    def mean(self, pixel=None):
+        bins = self.bins(pixel)
+        n = bins.sum()
+        if n == 0:
+            return 0.0
+        return float(np.dot(bins, self.codes) / n)
+
+    # Standard deviation of the code value (0 if empty)
+    def std(self, pixel=None):
+        bins = self.bins(pixel)
+        n = bins.sum()
+        if n == 0:
+            return 0.0
+        mean = np.dot(bins, self.codes) / n
+        return float(np.sqrt(np.dot(bins, (self.codes - mean)**2) / n))
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the 
+## top-level directory of this distribution and at: 
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html. 
+## No part of 'ATLAS ALTIROC DEV', including this file, 
+## may be copied, modified, propagated, or distributed except according to 
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import rogue
+import os
+import time
+import queue
+import datetime
+import threading
+import collections
+import click
+
+# One SEM message: FPGA index, arrival time (time.monotonic() and time.time()) and payload
+SemMessage = collections.namedtuple('SemMessage', ['fpga', 'monotonic', 'time', 'data'])
+
+class SemMonitorChannel(rogue.interfaces.stream.Slave):
+    '''
+    Receives the SEM stream of one FPGA. The frame is only copied and queued with its FPGA index
+    and arrival time, so an SEU burst never stalls the stream thread (messages are dropped and
+    counted if the queue is full).
+    '''
+    def __init__(self, monitor, fpga):
+        rogue.interfaces.stream.Slave.__init__(self)
+        self.monitor = monitor
+        self.fpga    = fpga
+
+    def _acceptFrame(self, frame):
+        with frame.lock():
+            ba = bytearray(frame.getPayload())
+            frame.read(ba, 0)
+        try:
+            self.monitor.queue.put_nowait(SemMessage(self.fpga, time.monotonic(), time.time(), ba))
+        except queue.Full:
+            self.monitor.stats[self.fpga]['dropped'] += 1
+
+class SemMonitor(object):
+    '''
+    SEM (soft error mitigation) monitor of all the FPGAs.
+
+    pr.streamConnect(top.semStream[i], monitor.channel(i))
+    monitor.sem[i] = top.Fpga[i].Sem
+
+    The messages of all the channels are queued to a writer thread, which writes them in batches
+    (one flush per batch) to "path" as tab separated records:
+
+        time  monotonic  fpga  CorrectionCount  Uncorrectable  message
+
+    CorrectionCount and Uncorrectable are the last polled values of the FPGA's Sem device, to
+    correlate the messages with the SEM counters. The writer also keeps the message and
+    correction rates of each FPGA over the last rateWindow seconds (rates(), report()).
+
+    The console shows at most one message per FPGA every consoleInterval seconds, the others are
+    summarized.
+    '''
+    def __init__(self, numFpga, path=None, rateWindow=60.0, consoleInterval=5.0, batchSize=256, maxQueue=100000):
+        if path is None:
+            path = datetime.datetime.now().strftime('seu/SEU_Monitor-%Y%m%d_%H%M%S.dat')
+        self.path = os.path.abspath(path)
+        print(f'fpath: {self.path}')
+
+        self.rateWindow      = rateWindow
+        self.consoleInterval = consoleInterval
+        self.batchSize       = batchSize
+        self.queue           = queue.Queue(maxsize=maxQueue)
+        self.channels        = [SemMonitorChannel(self, i) for i in range(numFpga)]
+        self.sem             = [None for i in range(numFpga)]
+
+        # Per FPGA statistics, updated by the writer thread (except "dropped")
+        self.lock  = threading.Lock()
+        self.stats = [{
+            'messages'    : 0,
+            'dropped'     : 0,
+            'suppressed'  : 0,
+            'lastPrint'   : None,
+            'arrivals'    : collections.deque(),   # Arrival times in the rate window
+            'corrections' : collections.deque(),   # (time, CorrectionCount) in the rate window
+        } for i in range(numFpga)]
+
+        self.dataFile = open(self.path, 'a')
+        self.dataFile.write('# time\tmonotonic\tfpga\tCorrectionCount\tUncorrectable\tmessage\n')
+        self.dataFile.flush()
+
+        self._stop   = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # Stream slave of an FPGA's SEM stream
+    def channel(self, fpga):
+        return self.channels[fpga]
+
+    # Write the queued messages and stop the writer
+    def close(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.dataFile.close()
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self.queue.get(timeout=0.5)]
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                self._console(time.monotonic())
+                continue
+            while len(batch) < self.batchSize:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+            self._console(time.monotonic(), batch)
+
+    def _write(self, batch):
+        records = []
+        for msg in batch:
+            with self.lock:
+                stats = self.stats[msg.fpga]
+                stats['messages'] += 1
+                stats['arrivals'].append(msg.monotonic)
+                corrections, uncorrectable = self._counters(msg.fpga, msg.monotonic)
+            text = msg.data.rstrip(bytearray(1)).decode('utf8', errors='replace')
+            text = ' | '.join(line.strip() for line in text.splitlines() if line.strip())
+            records.append(f'{datetime.datetime.fromtimestamp(msg.time)}\t{msg.monotonic:.6f}\t{msg.fpga}\t'
+                           f'{corrections}\t{uncorrectable}\t{text}\n')
+        self.dataFile.write(''.join(records))
+        self.dataFile.flush()
+
+    # Last polled CorrectionCount and Uncorrectable of an FPGA (no register access from the writer)
+    def _counters(self, fpga, now):
+        sem = self.sem[fpga]
+        if sem is None:
+            return None, None
+        corrections   = sem.CorrectionCount.value()
+        uncorrectable = sem.Uncorrectable.value()
+        samples = self.stats[fpga]['corrections']
+        if (corrections is not None) and ((not samples) or (samples[-1][1] != corrections)):
+            samples.append((now, corrections))
+        return corrections, (int(uncorrectable) if uncorrectable is not None else None)
+
+    # Drop the samples older than the rate window
+    def _age(self, fpga, now):
+        stats = self.stats[fpga]
+        while stats['arrivals'] and (stats['arrivals'][0] < now-self.rateWindow):
+            stats['arrivals'].popleft()
+        while (len(stats['corrections']) > 1) and (stats['corrections'][1][0] < now-self.rateWindow):
+            stats['corrections'].popleft()
+
+    # Throttled console output: the first message of each consoleInterval, a summary of the others
+    def _console(self, now, batch=()):
+        for msg in batch:
+            stats = self.stats[msg.fpga]
+            if (stats['lastPrint'] is None) or (now - stats['lastPrint'] >= self.consoleInterval):
+                stats['lastPrint'] = now
+                text = msg.data.rstrip(bytearray(1)).decode('utf8', errors='replace').strip()
+                click.secho(f'SEU[{msg.fpga}]: {datetime.datetime.fromtimestamp(msg.time)} - {text}', bg='red')
+            else:
+                stats['suppressed'] += 1
+        for fpga, stats in enumerate(self.stats):
+            if stats['suppressed'] and (now - stats['lastPrint'] >= self.consoleInterval):
+                stats['lastPrint'] = now
+                rate = self.rates(now)[fpga][0]
+                click.secho(f'SEU[{fpga}]: {stats["suppressed"]} more messages ({rate:.2f} Hz), see {self.path}', bg='red')
+                stats['suppressed'] = 0
+
+    # (message rate, CorrectionCount rate) of each FPGA over the rate window (Hz)
+    def rates(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        rates = []
+        with self.lock:
+            for fpga, stats in enumerate(self.stats):
+                self._age(fpga, now)
+                samples = stats['corrections']
+                # CorrectionCount is a 12-bit counter
+                corrections = (samples[-1][1] - samples[0][1]) % 0x1000 if len(samples) > 1 else 0
+                rates.append((len(stats['arrivals'])/self.rateWindow, corrections/self.rateWindow))
+        return rates
+
+    def report(self):
+        print(f'{"FPGA":>4} {"Messages":>9} {"Dropped":>8} {"Rate(Hz)":>9} {"Corr.(Hz)":>9} {"CorrectionCount":>15} {"Uncorrectable":>13}')
+        for fpga, (stats, (rate, corrRate)) in enumerate(zip(self.stats, self.rates())):
+            sem = self.sem[fpga]
+            counters = (sem.CorrectionCount.value(), sem.Uncorrectable.value()) if sem is not None else ('-', '-')
+            print(f'{fpga:>4} {stats["messages"]:>9} {stats["dropped"]:>8} {rate:>9.3f} {corrRate:>9.3f} {str(counters[0]):>15} {str(counters[1]):>13}')
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the 
+## top-level directory of this distribution and at: 
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html. 
+## No part of 'ATLAS ALTIROC DEV', including this file, 
+## may be copied, modified, propagated, or distributed except according to 
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import re
+import numpy as np
+import pyrogue as pr
+import click
+
+import common
+
+class PixelArrayVariable(pr.LinkVariable):
+    '''
+    Array-valued variable over a list of shift register fields (one per pixel).
+    get() returns a numpy array, set() takes an array (or a scalar for all the fields).
+    '''
+    def __init__(self, fields, **kwargs):
+        self.fields = list(fields)
+        super().__init__(**kwargs)
+
+    # Accept the '[1 0 1 ...]' display format of the array (e.g. from a YAML file)
+    def setDisp(self, sValue, write=True):
+        if isinstance(sValue, str):
+            sValue = np.array(sValue.strip('[]').replace(',', ' ').split(), dtype=np.int64)
+        self.set(sValue, write=write)
+
+class ShiftRegisterDevice(pr.Device):
+    '''
+    Base class of the ASIC shift register devices (slow control and probe).
+
+    Every field is a RemoteVariable at its position along the shift register, and the layout
+    is also kept in self._fields so that the whole register image can be handled at once:
+    transaction() stages many fields and writes only the changed words as one block, and
+    the per-pixel array variables read/write all the pixels of a field in one block.
+    '''
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        # Layout of the fields in the register image: name -> (bit position, bitSize, bit reversed)
+        self._fields   = {}
+        self._numWords = 0
+
+    # Add a field; bitOffset counts from 1 along the shift register
+    def addField(self, name, description, bitSize, bitOffset, base=pr.UInt, hidden=False):
+        remap = divmod((bitOffset-1),32)
+        pos   = (remap[0]<<5)+remap[1]
+
+        self._fields[name] = (pos, bitSize, (base is pr.UIntReversed))
+        self._numWords     = max(self._numWords, (pos+bitSize+31) >> 5)
+
+        self.add(pr.RemoteVariable(  
+            name        = name, 
+            description = description,
+            base        = base,
+            offset      = (remap[0]<<2),
+            mode        = 'RW', 
+            bitSize     = bitSize, 
+            bitOffset   = remap[1],
+            hidden      = hidden,
+        ))
+
+    # Add an array variable over a list of fields
+    def addArrayVariable(self, name, fields, description=''):
+        fields = list(fields)
+        self.add(PixelArrayVariable(
+            name         = name,
+            description  = description,
+            fields       = fields,
+            mode         = 'RW',
+            linkedGet    = lambda read: self.getFields(fields, read=read),
+            linkedSet    = lambda value, write: self.setFields(fields, value, write=write),
+            dependencies = [self.node(field) for field in fields],
+        ))
+
+    # Add a {name}Array variable for every set of fields named {name}[0], {name}[1], ...
+    def addArrayVariables(self):
+        arrays = {}
+        for field in self._fields:
+            match = re.match(r'^(\w+)\[(\d+)\]$', field)
+            if match:
+                arrays.setdefault(match.group(1), []).append((int(match.group(2)), field))
+        for name, fields in arrays.items():
+            self.addArrayVariable(
+                name        = f'{name}Array',
+                fields      = [field for (index, field) in sorted(fields)],
+                description = f'{name}[0:{len(fields)}] as an array',
+            )
+
+    # Values of a list of fields as an array. With read=True the words holding
+    # them are read in one block transaction (and the cached values updated)
+    def getFields(self, fields, read=True):
+        if read:
+            first, last = self._wordSpan(fields)
+            image = self.readImage(first, last)
+            values = np.array([self._extractField(image, field) for field in fields], dtype=np.int64)
+            common.LoadShadow(self, [(self.node(field), value) for field, value in zip(fields, values.tolist())])
+            return values
+        return np.array([self.node(field).value() or 0 for field in fields], dtype=np.int64)
+
+    # Set a list of fields from an array (or a scalar for all of them), written as one transaction
+    def setFields(self, fields, values, write=True):
+        values = np.broadcast_to(np.asarray(values, dtype=np.int64), (len(fields),))
+        if write:
+            with self.transaction() as txn:
+                for field, value in zip(fields, values.tolist()):
+                    txn.set(field, value)
+        else:
+            # Pending writes, written by the next writeBlocks() (e.g. LoadConfig)
+            for field, value in zip(fields, values.tolist()):
+                self.node(field).set(value, write=False)
+
+    # Register image (as an integer) built from the cached variable values, no hardware access
+    def shadowImage(self):
+        image = 0
+        for name in self._fields:
+            value = self.node(name).value()
+            image = self._insertField(image, name, value if value is not None else 0)
+        return image
+
+    # Register image (as an integer) read from the hardware in one block transaction,
+    # optionally only words first to last (the other words are zero)
+    def readImage(self, first=0, last=None):
+        if last is None:
+            last = self._numWords-1
+        numWords = last-first+1
+        words = self._rawRead(first*4, numWords)
+        if numWords == 1:
+            words = [words]
+        return self._wordsToImage(words) << (32*first)
+
+    # First and last word holding a list of fields
+    def _wordSpan(self, fields):
+        first = min(self._fields[field][0] for field in fields) >> 5
+        last  = max(self._fields[field][0]+self._fields[field][1]-1 for field in fields) >> 5
+        return first, last
+
+    def _insertField(self, image, name, value):
+        pos, size, rev = self._fields[name]
+        value = int(value)
+        if (value < 0) or (value >= (1 << size)):
+            errMsg = f'{self.path}.{name}: value {value} does not fit in {size} bits'
+            click.secho(errMsg, bg='red')
+            raise ValueError(errMsg)
+        if rev:
+            value = int(format(value, f'0{size}b')[::-1], 2)
+        mask = ((1 << size)-1) << pos
+        return (image & ~mask) | (value << pos)
+
+    def _extractField(self, image, name):
+        pos, size, rev = self._fields[name]
+        value = (image >> pos) & ((1 << size)-1)
+        if rev:
+            value = int(format(value, f'0{size}b')[::-1], 2)
+        return value
+
+    def _imageToWords(self, image):
+        return [(image >> (32*i)) & 0xFFFFFFFF for i in range(self._numWords)]
+
+    def _wordsToImage(self, words):
+        image = 0
+        for i, word in enumerate(words):
+            image |= int(word) << (32*i)
+        return image
+
+    # Stages shift register changes against a shadow of the register image. On commit (or at the
+    # end of the "with" block) only the 32-bit words that changed are written, as one block write,
+    # followed by a single verify read-back:
+    #
+    #   with top.Fpga[0].Asic.SlowControl.transaction() as sc:
+    #       for i in range(25):
+    #           sc.disable_pa[i] = 0x1
+    #       sc.DAC10bit = 0x19f
+    #
+    # The shadow is built from the cached variable values, or read from the hardware with refresh=True
+    def transaction(self, refresh=False):
+        return ShiftRegisterTransaction(self, refresh)
+
+#################################################################
+# Staged field assignments of an array of fields (e.g. sc.disable_pa[3] = 1)
+class _FieldArray(object):
+    def __init__(self, txn, name):
+        self._txn  = txn
+        self._name = name
+        
+    def __setitem__(self, index, value):
+        self._txn.set(f'{self._name}[{index}]', value)
+
+class ShiftRegisterTransaction(object):
+    def __init__(self, dev, refresh=False):
+        object.__setattr__(self, 'dev',    dev)
+        object.__setattr__(self, 'shadow', dev.readImage() if refresh else dev.shadowImage())
+        object.__setattr__(self, 'image',  self.shadow)
+        object.__setattr__(self, 'staged', {})
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.commit()
+        
+    # Stage a field value, by name ('DAC10bit', 'bit_vth_cor[4]') or variable
+    def set(self, name, value):
+        if not isinstance(name, str):
+            name = name.name
+        if name not in self.dev._fields:
+            errMsg = f'{self.dev.path}: no shift register field named {name}'
+            click.secho(errMsg, bg='red')
+            raise ValueError(errMsg)
+        object.__setattr__(self, 'image', self.dev._insertField(self.image, name, value))
+        self.staged[name] = int(value)
+        
+    def __setitem__(self, name, value):
+        self.set(name, value)
+        
+    def __getattr__(self, name):
+        if f'{name}[0]' in self.dev._fields:
+            return _FieldArray(self, name)
+        raise AttributeError(name)
+        
+    def __setattr__(self, name, value):
+        self.set(name, value)
+        
+    # Indexes of the 32-bit words that differ from the shadow
+    def changedWords(self):
+        old = self.dev._imageToWords(self.shadow)
+        new = self.dev._imageToWords(self.image)
+        return [i for i in range(self.dev._numWords) if old[i] != new[i]]
+        
+    # Write the changed words (all of them with force=True) in one block, verify them with
+    # one read-back and update the cached variable values. Returns the number of written words
+    def commit(self, verify=True, force=False):
+        changed = list(range(self.dev._numWords)) if force else self.changedWords()
+        
+        if changed:
+            first, last = changed[0], changed[-1]
+            words = self.dev._imageToWords(self.image)[first:last+1]
+            self.dev._rawWrite(first*4, words)
+            
+            if verify:
+                readBack = self.dev._rawRead(first*4, len(words))
+                if len(words) == 1:
+                    readBack = [readBack]
+                if [int(word) for word in readBack] != words:
+                    errMsg = f'{self.dev.path}.transaction(): verify failed for words {first} to {last}'
+                    click.secho(errMsg, bg='red')
+                    raise ValueError(errMsg)
+        
+        # Keep the pyrogue shadow of the variables in sync, without pending writes (no hardware access)
+        common.LoadShadow(self.dev, [(self.dev.node(name), value) for name, value in self.staged.items()])
+        
+        object.__setattr__(self, 'shadow', self.image)
+        self.staged.clear()
+        return len(changed)         
+        
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the 
+## top-level directory of this distribution and at: 
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html. 
+## No part of 'ATLAS ALTIROC DEV', including this file, 
+## may be copied, modified, propagated, or distributed except according to 
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import os
+import math
+import multiprocessing
+import concurrent.futures
+
+import common
+
+# HitReader lists copied into a HitSummary
+HitDataNames = [
+    'HitData',
+    'HitDataTOTf_vpa',
+    'HitDataTOTf_tz',
+    'HitDataTOTc_vpa',
+    'HitDataTOTc_tz',
+    'HitDataTOTc_int1_vpa',
+    'HitDataTOTc_int1_tz',
+]
+
+# Picklable copy of the results of a HitReader (same attribute names)
+class HitSummary(object):
+    def __init__(self, reader):
+        self.outputs = reader.outputs
+        self.toaHist = reader.toaHist
+        self.totHist = reader.totHist
+        for name in HitDataNames:
+            setattr(self, name, getattr(reader, name))
+
+# Decodes one sweep step file and returns analyze(value, reader), or a HitSummary if analyze is None.
+# Runs in the pool workers: the file is read with DataFileReader, no rogue stream objects are involved
+def AnalyzeSweepFile(value, path, outputs=common.HitOutputs, keepHits=False, analyze=None, channel=0):
+    reader = common.HitReader(outputs=outputs, keepHits=keepHits)
+    with common.DataFileReader(path) as dataFile:
+        for batch in dataFile.batches(channel=channel):
+            reader.processBatch(batch)
+    return HitSummary(reader) if analyze is None else analyze(value, reader)
+
+# TOA statistics of a sweep step from the TOA code histogram (all pixels):
+# (hits per TOA code, hit count, mean, std. dev.)
+def ToaStepStats(value, reader):
+    count = reader.toaHist.count()
+    if count > 0:
+        return (reader.toaHist.bins(), count, reader.toaHist.mean(), math.sqrt(math.pow(reader.toaHist.std(),2)+1/12))
+    return (reader.toaHist.bins(), count, 0, 0)
+
+# [(value, path), ...] for the step files of a sweep, e.g. SweepFiles('TestData/TOA%d.dat', range(2300,2700))
+def SweepFiles(pattern, values):
+    return [(value, pattern % value) for value in values]
+
+class SweepAnalyzer(object):
+    '''
+    Offline analysis of a multi-file sweep (one .dat file per step) on a process pool.
+
+    Every step file is decoded and analyzed by AnalyzeSweepFile() in a worker process.
+    "analyze" must be a picklable function analyze(value, reader) with a picklable return
+    value, defined in a module (e.g. ToaStepStats), not in the script. run() returns
+    [(value, result), ...] in the order of the steps.
+
+    The workers are started by a forkserver, never forked from the DAQ process (its rogue
+    threads would deadlock them). They import the main script, so its acquisition code must
+    be under "if __name__ == '__main__':".
+
+    analyzer = SweepAnalyzer(outputs=('toa',), analyze=ToaStepStats)
+    results  = analyzer.run(SweepFiles('TestData/TOA%d.dat', range(2300, 2700)))
+    '''
+    def __init__(self, outputs=common.HitOutputs, keepHits=False, analyze=None, processes=None, channel=0):
+        self.outputs   = outputs
+        self.keepHits  = keepHits
+        self.analyze   = analyze
+        self.processes = processes if processes is not None else os.cpu_count()
+        self.channel   = channel
+
+    def _kwargs(self):
+        return dict(outputs=self.outputs, keepHits=self.keepHits, analyze=self.analyze, channel=self.channel)
+
+    def run(self, steps):
+        steps = list(steps)
+
+        # Nothing to gain from a pool for a single step (or a single process)
+        if (len(steps) <= 1) or (self.processes <= 1):
+            return [(value, AnalyzeSweepFile(value, path, **self._kwargs())) for value, path in steps]
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(self.processes, len(steps)),
+                                                    mp_context=multiprocessing.get_context('forkserver')) as pool:
+            futures = [pool.submit(AnalyzeSweepFile, value, path, **self._kwargs()) for value, path in steps]
+            return [(value, future.result()) for (value, path), future in zip(steps, futures)]
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the 
+## top-level directory of this distribution and at: 
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html. 
+## No part of 'ATLAS ALTIROC DEV', including this file, 
+## may be copied, modified, propagated, or distributed except according to 
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import queue
+import threading
+import traceback
+
+import common
+
+class SweepStep(object):
+    def __init__(self, index, value, reader):
+        self.index  = index
+        self.value  = value
+        self.reader = reader
+        self.result = None
+
+class SweepPipeline(common.EventReader):
+    '''
+    Accumulates a parameter sweep straight from the data stream, without a .dat file per step.
+
+    The stream thread only appends the raw frame words of the current step to a buffer.
+    Full buffers (and the end of every step) are handed to a worker thread which decodes
+    them into a per-step HitReader and, when the step is closed, calls analyze(value, reader)
+    and keeps its return value (the HitReader itself if analyze is None). So step N is
+    decoded and analyzed while the hardware already runs step N+1.
+
+    pipeline = SweepPipeline(outputs=('toa',), analyze=lambda value, reader: reader.toaHist.mean())
+    pyrogue.streamTap(top.dataStream[0], pipeline)
+    sweep = CalPulseSweep(top.Fpga[0].Asic, pipeline)
+    for value in delays:
+        pipeline.step(value)
+        top.Fpga[0].Asic.Gpio.DlyCalPulseSet.set(value)
+        sweep.burst(50)
+    results = pipeline.finish() # [(value, result), ...] in step order
+    '''
+    def __init__(self, outputs=common.HitOutputs, keepHits=False, analyze=None, bufferSize=1<<20):
+        super().__init__()
+        self.outputs    = outputs
+        self.keepHits   = keepHits
+        self.analyze    = analyze
+        self.bufferSize = bufferSize
+        self.steps      = []
+        self._step      = None
+        self._buffer    = bytearray()
+        self._lock      = threading.Lock()
+        self._queue     = queue.Queue()
+        self._thread    = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # Runs in the stream thread: keep a copy of the frame words of the current step
+    def processFrame(self, frame, channel=0):
+        with self._lock:
+            if self._step is None:
+                return
+            self._buffer += memoryview(self.decoder.words(frame))
+            if len(self._buffer) >= self.bufferSize:
+                self._queue.put((self._step, self._buffer))
+                self._buffer = bytearray()
+
+    # Close the current step (if any) and start accumulating a new one for "value"
+    def step(self, value):
+        with self._lock:
+            self._closeStep()
+            self._step = SweepStep(len(self.steps), value, common.HitReader(outputs=self.outputs, keepHits=self.keepHits))
+            self.steps.append(self._step)
+
+    def _closeStep(self):
+        if self._step is not None:
+            self._queue.put((self._step, self._buffer))
+            self._queue.put((self._step, None))
+            self._step   = None
+            self._buffer = bytearray()
+
+    # Close the last step, wait for the worker and return [(value, result), ...] in step order
+    def finish(self):
+        with self._lock:
+            self._closeStep()
+        self._queue.join()
+        return [(step.value, step.result) for step in self.steps]
+
+    def stop(self):
+        self.finish()
+        self._queue.put(None)
+        self._thread.join()
+
+    # Worker thread: decode the buffered frames and analyze the closed steps
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                step, buf = item
+                if buf is None:
+                    step.result = step.reader if self.analyze is None else self.analyze(step.value, step.reader)
+                elif len(buf) > 0:
+                    step.reader.processBatch(common.ParseBufferBatch(buf))
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
@@ -21,10 +21,8 @@ import pyrogue.interfaces.simulation
 
 import common
 import time
-import datetime
 import click
-import os
-import threading
+import concurrent.futures
 
 # Force the rogue version to be v3.7.0
 if rogue.Version.current() != 'v3.7.0':
@@ -33,30 +31,26 @@ if rogue.Version.current() != 'v3.7.0':
     click.secho(errMsg, bg='red')
     raise ValueError(errMsg) 
 
-class SemAsciiFileWriter(rogue.interfaces.stream.Slave):
-    def __init__(self):
-        rogue.interfaces.stream.Slave.__init__(self)
+# StreamWriter that optionally keeps the sidecar frame index (DataFileIndex) of the open
+# file up to date while it is being written (started on Open, completed on Close)
+class IndexedStreamWriter(pr.utilities.fileio.StreamWriter):
+    def __init__(self, index=False, interval=1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.index     = index
+        self.interval  = interval
+        self.fileIndex = None
 
-        now = datetime.datetime.now()
-        fpath = os.path.abspath(now.strftime('seu/SEU_Monitor-%Y%m%d_%H%M%S.dat'))
-        print(f'fpath: {fpath}')
-        
-        self.dataFile = open(fpath, 'a')
-        self.lock = threading.Lock()
-
-    def close(self):
-        self.dataFile.close()
+    def _open(self):
+        super()._open()
+        if self.index:
+            self.fileIndex = common.DataFileIndex(self.DataFile.value(), update=False)
+            self.fileIndex.start(self.interval)
 
-    def _acceptFrame(self, frame):
-        with self.lock:
-            ba = bytearray(frame.getPayload())
-            frame.read(ba, 0)
-            s = ba.rstrip(bytearray(1))
-            s = s.decode('utf8')
-            s = f'{datetime.datetime.now()} - {s}'
-            errMsg = 'SEU:' + s
-            click.secho(errMsg, bg='red')
-            self.dataFile.write(s)
+    def _close(self):
+        super()._close()
+        if self.fileIndex is not None:
+            self.fileIndex.stop()
+            self.fileIndex = None
 
 class Top(pr.Root):
     def __init__(   self,       
@@ -71,6 +65,12 @@ class Top(pr.Root):
             loadYaml    = True,
             userYaml    = [''],
             defaultFile = 'config/defaults.yml',
+            parallelStart  = True,
+            pllLockTimeout = 10.0,
+            configSnapshot = False,
+            blockReads     = True,
+            liveMonitor    = False,
+            dataIndex      = False,
             **kwargs):
         super().__init__(name=name, description=description, **kwargs)
         
@@ -91,6 +91,13 @@ class Top(pr.Root):
         self.usrLoadYaml = loadYaml
         self.userYaml    = userYaml
         self.defaultFile = defaultFile
+        self.parallelStart  = parallelStart
+        self.pllLockTimeout = pllLockTimeout
+        self.configSnapshot = configSnapshot
+        self.blockReads     = blockReads
+        self.readPlanner    = None
+        self.blockPoller    = None
+        self.reset_list     = []
         self.pllConfig   = [None for i in range(self.numEthDev)]
         
         # Check if missing refClkSel configuration
@@ -112,8 +119,8 @@ class Top(pr.Root):
                 click.secho(errMsg, bg='red')
                 raise ValueError(errMsg)        
         
-        # File writer
-        self.dataWriter = pr.utilities.fileio.StreamWriter()
+        # File writer (same node name as the plain StreamWriter), with the optional sidecar frame index
+        self.dataWriter = IndexedStreamWriter(name='StreamWriter', index=dataIndex)
         self.add(self.dataWriter)
                 
         # Create arrays to be filled
@@ -122,9 +129,10 @@ class Top(pr.Root):
         self.dataStream = [None for i in range(self.numEthDev)]
         self.semStream  = [None for i in range(self.numEthDev)]
         self.memMap     = [None for i in range(self.numEthDev)]
+        self.liveMonitor = [None for i in range(self.numEthDev)]
         
         # SEM monitor streams
-        self.semDataWriter = SemAsciiFileWriter()        
+        self.semMonitor = common.SemMonitor(self.numEthDev)
         
         # Loop through the devices
         for i in range(self.numEthDev):
@@ -151,9 +159,17 @@ class Top(pr.Root):
                 # Connect data stream to file as channel to dataStream
                 pr.streamConnect(self.dataStream[i],self.dataWriter.getChannel(i))
                 
-                # Connect to the SEM monitor streams and file writer
-                pr.streamConnect(self.semStream[i], self.semDataWriter)
-                pr.streamTap(self.semStream[i],self.dataWriter.getChannel(i+128))
+                # Connect to the SEM monitor streams and file writer (no SEM stream in simulation)
+                if self.semStream[i] is not None:
+                    pr.streamConnect(self.semStream[i], self.semMonitor.channel(i))
+                    pr.streamTap(self.semStream[i],self.dataWriter.getChannel(i+128))
+                    
+                # Headless live monitor, published to shared memory for scripts/LiveMonitorViewer.py
+                if liveMonitor:
+                    self.liveMonitor[i] = common.LiveMonitor(common.LiveMonitorName(self.ip[i], i))
+                    pr.streamTap(self.dataStream[i], self.liveMonitor[i])
+                    self.liveMonitor[i].start()
+                    self.reset_list.append(self.liveMonitor[i].reset)
                 
             ######################################################################
             
@@ -166,6 +182,7 @@ class Top(pr.Root):
                 advanceUser = self.advanceUser, 
                 expand      = True, 
             ))
+            self.semMonitor.sem[i] = self.Fpga[i].Sem
         
             ######################################################################
             
@@ -246,12 +263,22 @@ class Top(pr.Root):
         )        
         
     def add_live_display_resets(self, reset_list):
-        self.reset_list = reset_list
+        self.reset_list = self.reset_list + reset_list
 
 
     def start(self,**kwargs):
         super(Top, self).start(**kwargs) 
 
+        # Read the ASIC/SEM/DAC registers as coalesced block transactions (ReadAll and polling)
+        if self.blockReads:
+            devices = []
+            for i in range(self.numEthDev):
+                devices += [self.Fpga[i].Asic, self.Fpga[i].Sem, self.Fpga[i].Dac]
+            self.readPlanner = common.BlockReadPlanner(devices)
+            if self._pollEn:
+                self.blockPoller = common.BlockPoller(self, devices)
+                self.blockPoller.start()
+
         # Check if not PROM loading 
         if not self.configProm and (self.ip[0] != 'simulation'):
         
@@ -260,70 +287,37 @@ class Top(pr.Root):
                 # Hide by default
                 enableList.hidden = True  
             
-            # Loop through FPGA devices
-            for i in range(self.numEthDev):
+            # Check if the list of user YAML file les than number of FPGAs
+            if (len(self.userYaml) < self.numEthDev):
+                errMsg = 'There are less User YAML files than the number of FPGAs to load'
+                click.secho(errMsg, bg='red')
+                raise ValueError(errMsg)                    
             
-                # Disable auto-polling during PLL config
-                self.Fpga[i].Asic.enable.set(False)
-                
-                # Check for min. FW version
-                fwVersion = self.Fpga[i].AxiVersion.FpgaVersion.get()
-                if (fwVersion < self.minFpgaVersion):
-                    errMsg = f"""
-                        Fpga[{i}].AxiVersion.FpgaVersion = {fwVersion:#04x} < {self.minFpgaVersion:#04x}
-                        Please update Fpga[{i}] at IP={self.ip[i]} firmware using software/scripts/ReprogramFpga.py
-                        """
-                    click.secho(errMsg, bg='red')
-                    raise ValueError(errMsg)
-                
-                # Check for an incompatible V1 FPGA eFUSE value
-                if (self.Fpga[i].AxiVersion.Efuse.get() < 0x00004EA9):
-                    errMsg = 'incompatible Version1 FPGA board Detected'
-                    click.secho(errMsg, bg='red')
-                    raise ValueError(errMsg)
-                    
-                # Check if the list of user YAML file les than number of FPGAs
-                if (len(self.userYaml) < self.numEthDev):
-                    errMsg = 'There are less User YAML files than the number of FPGAs to load'
-                    click.secho(errMsg, bg='red')
-                    raise ValueError(errMsg)                    
-                
-                if (self.advanceUser):
-                    # Prevent FEB from thermal shutdown until FPGA Tj = 100 degC (max. operating temp)  
-                    self.Fpga[i].BoardTemp.RemoteTcritSetpoint.set(95)
-                     
-                # Load the PLL configurations
-                self.Fpga[i].Pll.CsvFilePath.set(self.pllConfig[i])
-                self.Fpga[i].Pll.LoadCsvFile()
-                self.Fpga[i].Pll.Locked.get()
-                
-            # Wait for the SiLab PLL to lock
+            # Bring up the FPGAs (version checks + PLL configuration and locking)
             print ('Waiting for SiLab PLLs to lock')
-            time.sleep(10.0)
-            
-            # Loop through the devices
-            for i in range(self.numEthDev):             
-                retry = 0
-                while (retry<2):
-                    if (self.Fpga[i].Pll.Locked.get()):
-                        break
-                    else:
-                        retry = retry + 1
-                        self.Fpga[i].Pll.LoadCsvFile() 
-                        time.sleep(10.0)          
-                        
-                # Print the results
-                if (retry<2):
+            if self.parallelStart and (self.numEthDev > 1):
+                # Each FPGA has its own SRP link, so the boards are configured concurrently
+                with concurrent.futures.ThreadPoolExecutor(max_workers=self.numEthDev) as executor:
+                    timing = list(executor.map(self._bringUpFpga, range(self.numEthDev)))
+            else:
+                timing = [self._bringUpFpga(i) for i in range(self.numEthDev)]
+                
+            # Print the results
+            for i in range(self.numEthDev):
+                print (f'Fpga[{i}] bring-up: check = {timing[i]["check"]:.2f} s, '
+                       f'PLL load = {timing[i]["load"]:.2f} s, PLL lock = {timing[i]["lock"]:.2f} s '
+                       f'(reloads = {timing[i]["retry"]})')
+                if timing[i]['locked']:
                     print (f'PLL[{i}] locks established')
                 else:
                     click.secho(
                         "\n\n\
                         ***************************************************\n\
                         ***************************************************\n\
-                        Failed to establish PLL[%i] locking after 10 seconds\n\
+                        Failed to establish PLL[%i] locking after %i seconds\n\
                         ***************************************************\n\
                         ***************************************************\n\n"\
-                        % i, bg='red',
+                        % (i, timing[i]['lock']), bg='red',
                     )    
         
             # Loop through FPGA devices
@@ -349,15 +343,22 @@ class Top(pr.Root):
             # Check if we are loading YAML files
             if self.usrLoadYaml:
                 
-                # Load the Default YAML file
-                print(f'Loading path={self.defaultFile} Default Configuration File...')
-                self.LoadConfig(self.defaultFile)                
+                if self.configSnapshot:
+                    # Load the Default + User YAML files from their compiled snapshot (compiled on first use)
+                    configFiles = [self.defaultFile] + [path for path in self.userYaml if path != '']
+                    print(f'Loading path={configFiles} Configuration Snapshot...')
+                    common.ConfigSnapshot.get(self, configFiles).load(self)
                 
-                # Load the User YAML file(s)
-                if (self.userYaml[i] != ''): 
+                else:
+                    # Load the Default YAML file
+                    print(f'Loading path={self.defaultFile} Default Configuration File...')
+                    self.LoadConfig(self.defaultFile)                
+                    
+                    # Load the User YAML file(s)
                     for i in range(len(self.userYaml)):
-                        print(f'Loading path={self.userYaml[i]} User Configuration File...')
-                        self.LoadConfig(self.userYaml[i])
+                        if (self.userYaml[i] != ''): 
+                            print(f'Loading path={self.userYaml[i]} User Configuration File...')
+                            self.LoadConfig(self.userYaml[i])
                 
         else:
             # Hide all the "enable" variables
@@ -366,8 +367,88 @@ class Top(pr.Root):
                 enableList.hidden = True  
                 
         if (self._initRead):               
+            self.readAll()
+            self.readAll()
+            
+    # ReadAll(), with the planned devices read in block transactions when blockReads is set
+    def readAll(self):
+        if self.readPlanner is not None:
+            self.readPlanner.readAll(self)
+        else:
             self.ReadAll()
-            self.ReadAll()
+            
+    # Number of transactions of a ReadAll (and of the polling) before/after block read planning
+    def blockReadReport(self):
+        planner = self.readPlanner if self.readPlanner is not None else common.BlockReadPlanner(
+            [self.Fpga[i].Asic for i in range(self.numEthDev)])
+        planner.report()
+        if self.blockPoller is not None:
+            self.blockPoller.report()
+     
+    # Checks one FPGA and configures/locks its PLL, returns the timing of each step
+    def _bringUpFpga(self, i):
+        fpga   = self.Fpga[i]
+        timing = {}
+        t0     = time.monotonic()
+        
+        # Disable auto-polling during PLL config
+        fpga.Asic.enable.set(False)
+        
+        # Check for min. FW version
+        fwVersion = fpga.AxiVersion.FpgaVersion.get()
+        if (fwVersion < self.minFpgaVersion):
+            errMsg = f"""
+                Fpga[{i}].AxiVersion.FpgaVersion = {fwVersion:#04x} < {self.minFpgaVersion:#04x}
+                Please update Fpga[{i}] at IP={self.ip[i]} firmware using software/scripts/ReprogramFpga.py
+                """
+            click.secho(errMsg, bg='red')
+            raise ValueError(errMsg)
+        
+        # Check for an incompatible V1 FPGA eFUSE value
+        if (fpga.AxiVersion.Efuse.get() < 0x00004EA9):
+            errMsg = f'incompatible Version1 FPGA board Detected at IP={self.ip[i]}'
+            click.secho(errMsg, bg='red')
+            raise ValueError(errMsg)
+        
+        if (self.advanceUser):
+            # Prevent FEB from thermal shutdown until FPGA Tj = 100 degC (max. operating temp)  
+            fpga.BoardTemp.RemoteTcritSetpoint.set(95)
+            
+        t1 = time.monotonic()
+        timing['check'] = t1 - t0
+             
+        # Load the PLL configurations
+        fpga.Pll.CsvFilePath.set(self.pllConfig[i])
+        fpga.Pll.LoadCsvFile()
+        
+        t2 = time.monotonic()
+        timing['load'] = t2 - t1
+        
+        # Wait for the SiLab PLL to lock, reloading the configuration if it does not
+        retry  = 0
+        locked = self._waitPllLocked(fpga)
+        while (not locked) and (retry<2):
+            retry = retry + 1
+            fpga.Pll.LoadCsvFile() 
+            locked = self._waitPllLocked(fpga)
+            
+        timing['lock']   = time.monotonic() - t2
+        timing['retry']  = retry
+        timing['locked'] = locked
+        return timing
+        
+    # Polls Pll.Locked with an increasing interval until it is set or the deadline passes
+    def _waitPllLocked(self, fpga):
+        deadline = time.monotonic() + self.pllLockTimeout
+        interval = 0.1
+        while True:
+            if fpga.Pll.Locked.get():
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(interval, remaining))
+            interval = min(2*interval, 1.0)
      
     # Function calls after loading YAML configuration
     def initialize(self):
@@ -387,6 +468,11 @@ class Top(pr.Root):
             self.Fpga[i].Asic.Readout.SeqCntRst()
 
     def stop(self):
-        self.semDataWriter.close()
+        if self.blockPoller is not None:
+            self.blockPoller.stop()
+        for monitor in self.liveMonitor:
+            if monitor is not None:
+                monitor.close()
+        self.semMonitor.close()
         super().stop()
         
\ No newline at end of file
@@ -8,6 +8,7 @@
 ## may be copied, modified, propagated, or distributed except according to 
 ## the terms contained in the LICENSE.txt file.
 ##############################################################################
+from common._ShiftRegisterDevice import *
 from common._Altiroc            import *
 from common._AltirocGpio        import *
 from common._AltirocCalPulse    import *
@@ -18,15 +19,46 @@ from common._AltirocTdcClk      import *
 from common._AltirocTrig        import *
 from common._Dac                import *
 from common._DataStreamReader   import *
+from common._DataFileReader     import *
+from common._DataExport         import *
+from common._PixelHistogram     import *
+from common._CalPulseSweep      import *
+from common._SweepPipeline      import *
+from common._SweepAnalyzer      import *
+from common._CalibrationSearch  import *
 from common._Fpga               import *
+from common._FpgaEmulator       import *
+from common._ConfigSnapshot     import *
+from common._BlockReadPlanner   import *
 from common._Top                import *
 from common._Sem                import *
-from common._LiveDisplay        import *
+from common._SemMonitor         import *
 
 def getNsValue(var):
     return ( var.dependencies[0].value() + 1 )*6.25 
     
 def getMhzValue(var):
     value = var.dependencies[0].value() + var.dependencies[1].value() + 2
-    return 1/(value*0.00625)      
-    
+    return 1/(value*0.00625)
+
+# GUI/plotting modules (matplotlib + Qt) are only imported on first use, so
+# headless tools (file dumps, FPGA reprogramming, ...) never load them.
+# The live monitor needs multiprocessing.shared_memory (Python >= 3.8).
+_lazyAttrs = {
+    'onlineEventDisplay' : 'common._LiveDisplay',
+    'LiveHistograms'     : 'common._LiveMonitor',
+    'LiveMonitorHeader'  : 'common._LiveMonitor',
+    'LiveMonitorMagic'   : 'common._LiveMonitor',
+    'LiveMonitorName'    : 'common._LiveMonitor',
+    'LiveSnapshot'       : 'common._LiveMonitor',
+    'LiveMonitor'        : 'common._LiveMonitor',
+    'LiveMonitorReader'  : 'common._LiveMonitor',
+}
+
+def __getattr__(name):
+    if name in _lazyAttrs:
+        import importlib
+        value = getattr(importlib.import_module(_lazyAttrs[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module 'common' has no attribute '{name}'")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the 
+## top-level directory of this distribution and at: 
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html. 
+## No part of 'ATLAS ALTIROC DEV', including this file, 
+## may be copied, modified, propagated, or distributed except according to 
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+
+import sys
+import argparse
+import subprocess
+
+#################################################################
+
+# Modules that must never be loaded by a plain "import common" (GUI, and the live monitor
+# that needs Python >= 3.8)
+LazyModules = ['matplotlib', 'PyQt5', 'PyQt4', 'PySide2', 'pyrogue.gui', 'common._LiveDisplay',
+               'common._LiveMonitor', 'multiprocessing.shared_memory']
+
+# Executed in a fresh interpreter so nothing is already cached in sys.modules
+ImportProbe = f'''
+import sys, time
+t0 = time.perf_counter()
+import common
+dt = time.perf_counter() - t0
+loaded = [m for m in {LazyModules!r} if m in sys.modules]
+print(dt)
+print(','.join(loaded))
+'''
+
+#################################################################
+
+# Set the argument parser
+parser = argparse.ArgumentParser(description='Checks that "import common" stays fast and free of GUI and live monitor dependencies')
+
+# Add arguments
+parser.add_argument(
+    "--budget", 
+    type     = float,
+    required = False,
+    default  = 3.0,
+    help     = "maximum allowed import time of the common package (seconds)",
+) 
+
+# Get the arguments
+args = parser.parse_args()
+
+#################################################################
+
+result = subprocess.run([sys.executable, '-c', ImportProbe], stdout=subprocess.PIPE, universal_newlines=True)
+if result.returncode != 0:
+    print('FAILED: "import common" raised an exception')
+    sys.exit(1)
+
+lines  = result.stdout.splitlines()
+dt     = float(lines[-2])
+loaded = [m for m in lines[-1].split(',') if m]
+
+print(f'import common: {dt:.3f} s (budget = {args.budget:.3f} s)')
+if loaded:
+    print(f'FAILED: lazy modules loaded at import time: {loaded}')
+if dt > args.budget:
+    print('FAILED: import time over budget')
+
+sys.exit(1 if (loaded or (dt > args.budget)) else 0)
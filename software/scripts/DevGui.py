@@ -15,20 +15,13 @@ import pyrogue as pr
 import pyrogue.gui
 import argparse
 import common as feb
-import time
-import threading
 
 #################################################################
 
-Keep_display_alive = True
-Live_display_interval = 1
+# Max. refresh rate of the live displays (Hz), lower when rendering gets expensive
+Live_display_rate = 10
 
 #################################################################
-def runLiveDisplay(event_display,fpga_index):
-    while(Keep_display_alive):
-        event_display.refreshDisplay()
-        time.sleep(Live_display_interval)
-#################################################################
 
 # Set the argument parser
 parser = argparse.ArgumentParser()
@@ -101,6 +94,30 @@ parser.add_argument(
     help     = "prints the stream data event frames",
 )  
 
+parser.add_argument(
+    "--configSnapshot", 
+    type     = argBool,
+    required = False,
+    default  = False,
+    help     = "Loads the YAML files from a compiled (cached) configuration snapshot",
+)  
+
+parser.add_argument(
+    "--dataIndex", 
+    type     = argBool,
+    required = False,
+    default  = False,
+    help     = "Keeps the sidecar frame index (<file>.idx) of the data file up to date while it is written",
+)  
+
+parser.add_argument(
+    "--liveMonitor", 
+    type     = argBool,
+    required = False,
+    default  = False,
+    help     = "Publishes the live histograms to shared memory for scripts/LiveMonitorViewer.py",
+)  
+
 parser.add_argument(
     "--liveDisplay", 
     type     = argBool,
@@ -124,6 +141,9 @@ top = feb.Top(
     defaultFile = args.defaultFile,       
     userYaml    = args.userYaml,       
     refClkSel   = args.refClkSel,       
+    liveMonitor = args.liveMonitor,
+    configSnapshot = args.configSnapshot,
+    dataIndex   = args.dataIndex,
 )    
 
 # Create the Event reader streaming interface
@@ -135,6 +155,7 @@ if (args.printEvents):
 
 # Create Live Display
 live_display_resets = []
+live_displays = []
 if args.liveDisplay:
     for fpga_index in range( top.numEthDev ):
         # Create the fifo to ensure there is no back-pressure
@@ -151,9 +172,9 @@ if args.liveDisplay:
         live_display_resets.append( event_display.reset )
         # Connect the fifo ---> stream reader
         pr.streamConnect(fifo, event_display) 
-        # Retrieve pixel data streaming object
-        display_thread = threading.Thread( target=runLiveDisplay, args=(event_display,fpga_index,) )
-        display_thread.start()
+        # Refresh the display from the GUI event loop
+        event_display.startRefresh(maxRate=Live_display_rate)
+        live_displays.append( event_display )
 top.add_live_display_resets(live_display_resets)
 
 
@@ -171,6 +192,7 @@ print("Starting GUI...\n");
 appTop.exec_()    
 
 # Close
-Keep_display_alive = False
+for event_display in live_displays:
+    event_display.stopRefresh()
 top.stop()
 exit()   
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the 
+## top-level directory of this distribution and at: 
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html. 
+## No part of 'ATLAS ALTIROC DEV', including this file, 
+## may be copied, modified, propagated, or distributed except according to 
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+#
+# Software FPGA emulator for the "--ip simulation" mode of the other scripts:
+#
+#   python scripts/FpgaEmulator.py --rate 1000 --occupancy 0.1 &
+#   python scripts/DevGui.py --ip simulation --liveDisplay 1
+#
+##############################################################################
+
+import sys
+import time
+import argparse
+import common as feb
+
+#################################################################
+
+# Set the argument parser
+parser = argparse.ArgumentParser()
+
+# Add arguments
+parser.add_argument(
+    "--port", 
+    type     = int,
+    required = False,
+    default  = 9000,
+    help     = "SRPv3 TCP port (the event stream is served on port+2)",
+)  
+
+parser.add_argument(
+    "--rate", 
+    type     = float,
+    required = False,
+    default  = 0.0,
+    help     = "Rate of the free running triggers (Hz), 0 = only CalPulse.Start/Readout.ForceStart",
+)  
+
+parser.add_argument(
+    "--occupancy", 
+    type     = float,
+    required = False,
+    default  = 1.0,
+    help     = "Probability for a readout pixel to be hit",
+)  
+
+parser.add_argument(
+    "--iterations", 
+    type     = int,
+    required = False,
+    default  = 1,
+    help     = "Pixel read iterations per event",
+)  
+
+parser.add_argument(
+    "--toa", 
+    nargs    = 2,
+    type     = float,
+    required = False,
+    default  = [64.0, 2.0],
+    help     = "Mean and sigma of the TOA code",
+)  
+
+parser.add_argument(
+    "--tot", 
+    nargs    = 2,
+    type     = float,
+    required = False,
+    default  = [100.0, 5.0],
+    help     = "Mean and sigma of the TOT code",
+)  
+
+parser.add_argument(
+    "--seed", 
+    type     = int,
+    required = False,
+    default  = None,
+    help     = "Random generator seed",
+)  
+
+# Get the arguments
+args = parser.parse_args()
+
+#################################################################
+
+emulator = feb.FpgaEmulator(
+    port       = args.port,
+    rate       = args.rate,
+    occupancy  = args.occupancy,
+    iterations = args.iterations,
+    toaMean    = args.toa[0],
+    toaSigma   = args.toa[1],
+    totMean    = args.tot[0],
+    totSigma   = args.tot[1],
+    seed       = args.seed,
+)
+emulator.start()
+print(f'FPGA emulator: SRPv3 on port {args.port}, event stream on port {args.port+2}')
+
+try:
+    while True:
+        time.sleep(10)
+        print(emulator.status())
+except KeyboardInterrupt:
+    pass
+
+emulator.stop()
+sys.exit()
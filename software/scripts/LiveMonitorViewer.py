@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the 
+## top-level directory of this distribution and at: 
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html. 
+## No part of 'ATLAS ALTIROC DEV', including this file, 
+## may be copied, modified, propagated, or distributed except according to 
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+#
+# Viewer of the live histograms published by Top(liveMonitor=True), e.g.
+#
+#   python scripts/DevGui.py --ip 10.0.0.1 --liveMonitor 1
+#   python scripts/LiveMonitorViewer.py --ip 10.0.0.1 --fpga 0
+#
+# Any number of viewers can attach to (and detach from) a running acquisition
+##############################################################################
+
+import time
+import argparse
+import common as feb
+import matplotlib.pyplot as plt
+
+#################################################################
+
+# Set the argument parser
+parser = argparse.ArgumentParser()
+
+# Add arguments
+parser.add_argument(
+    "--ip", 
+    type     = str,
+    required = False,
+    default  = '10.0.0.1',
+    help     = "IP address of the board of the live monitor",
+)  
+
+parser.add_argument(
+    "--fpga", 
+    type     = int,
+    required = False,
+    default  = 0,
+    help     = "FPGA index of the live monitor",
+)  
+
+parser.add_argument(
+    "--name", 
+    type     = str,
+    required = False,
+    default  = None,
+    help     = "Shared memory segment name (default = altiroc_live_<ip>_<fpga>)",
+)  
+
+parser.add_argument(
+    "--rate", 
+    type     = float,
+    required = False,
+    default  = 10.0,
+    help     = "Max. refresh rate (Hz)",
+)  
+
+# Get the arguments
+args = parser.parse_args()
+
+name = args.name if args.name is not None else feb.LiveMonitorName(args.ip, args.fpga)
+
+#################################################################
+
+# Wait for the monitor to be published
+reader = None
+while reader is None:
+    try:
+        reader = feb.LiveMonitorReader(name)
+    except FileNotFoundError:
+        print(f'Waiting for the live monitor {name}...')
+        time.sleep(1.0)
+
+# The display is only used for drawing, it is not connected to a stream
+event_display = feb.onlineEventDisplay(
+        plot_title = name,
+        window     = reader.header['Window'],
+        submitDir  = 'display_snapshots',
+        font_size  = 4,
+        fig_size   = (10,6),
+        overwrite  = True  )
+
+def update():
+    global reader
+    snap = reader.read()
+    if snap is not None:
+        event_display.makeDisplay(snap.toa, snap.tot, snap.hits,
+                                  window_data=(snap.toa_window, snap.tot_window, snap.hits_window))
+    # Attach to the segment of a restarted acquisition
+    elif (time.time() - reader.header['Time']) > 10.0:
+        try:
+            newReader = feb.LiveMonitorReader(name)
+            reader.close()
+            reader = newReader
+        except FileNotFoundError:
+            pass
+
+timer = event_display.fig.canvas.new_timer(interval=int(1000/args.rate))
+timer.add_callback(update)
+timer.start()
+
+plt.show()
+reader.close()
@@ -24,6 +24,9 @@ import os
 # Set the argument parser
 parser = argparse.ArgumentParser()
 
+# Convert str to bool
+argBool = lambda s: s.lower() in ['true', 't', 'yes', '1']
+
 # Add arguments
 parser.add_argument(
     "--dataFile", 
@@ -32,22 +35,74 @@ parser.add_argument(
     help     = "path to data file",
 ) 
 
+parser.add_argument(
+    "--rogueReader", 
+    type     = argBool,
+    required = False,
+    default  = False,
+    help     = "Replay the file through rogue's StreamReader instead of the memory-mapped reader",
+) 
+
+parser.add_argument(
+    "--printEvents", 
+    type     = argBool,
+    required = False,
+    default  = True,
+    help     = "prints the event frames",
+) 
+
+parser.add_argument(
+    "--dumpFormat", 
+    type     = str,
+    required = False,
+    default  = 'npz',
+    choices  = ['npz', 'csv', 'none'],
+    help     = "npz: columnar <dataFile>_fpga<N>_<block>.npz files, csv: (slow) fpga<N>.csv files, none: no dump",
+) 
+
 # Get the arguments
 args = parser.parse_args()
 
 #################################################################
 
-# Create the File reader streaming interface
-dataReader = rogue.utilities.fileio.StreamReader()
-
 # Create the Event reader streaming interface
-dataStream = feb.PrintEventReader(cvsDump=True)
+dataStream = feb.PrintEventReader(cvsDump=(args.dumpFormat == 'csv'), printEvents=args.printEvents)
+
+if args.rogueReader:
+    # Create the File reader streaming interface
+    dataReader = rogue.utilities.fileio.StreamReader()
+
+    # Connect the file reader ---> event reader
+    pr.streamConnect(dataReader, dataStream) 
+
+    # Connect the file reader ---> columnar export
+    if (args.dumpFormat == 'npz'):
+        exportStream = feb.ColumnarStreamWriter(feb.ColumnarEventWriter(os.path.splitext(args.dataFile)[0]))
+        pr.streamTap(dataReader, exportStream)
 
-# Connect the file reader ---> event reader
-pr.streamConnect(dataReader, dataStream) 
+    # Open the file
+    dataReader.open(args.dataFile)
 
-# Open the file
-dataReader.open(args.dataFile)
+    # Close file once everything processed
+    dataReader.closeWait()
+    if (args.dumpFormat == 'npz'):
+        exportStream.close()
+    
+else:
+    # Walk the memory-mapped file directly
+    with feb.DataFileReader(args.dataFile) as dataFile:
+    
+        if args.printEvents or (args.dumpFormat == 'csv'):
+            for record in dataFile.records():
+                # Channels >= 128 are the SEM monitor streams
+                if record.channel < 128:
+                    dataStream.processFrame(record.payload, record.channel)
+            
+        # Batch decode the frames into the columnar files
+        if (args.dumpFormat == 'npz'):
+            prefix = os.path.splitext(args.dataFile)[0]
+            with feb.ColumnarEventWriter(prefix) as writer:
+                for batch in dataFile.batches(channel=None):
+                    writer.write(batch)
 
-# Close file once everything processed
-dataReader.closeWait()
+dataStream.close()
@@ -11,7 +11,6 @@
 
 import sys
 import pyrogue as pr
-import pyrogue.gui
 import argparse
 import time
 import common as feb
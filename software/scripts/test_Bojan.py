@@ -16,6 +16,9 @@ asicVersion = 2 # <= Select either V1 or V2 of the ASIC
 
 DebugPrint = True
 
+PipelinedSweep = 1 # <= Decode/analyze each sweep step in memory while the next step is acquired
+WriteRawData = 0   # <= Also write the raw data of each sweep step to TestData/TOA%d.dat or TestData/TOT%d.dat
+
 if (asicVersion == 1):
     Configuration_LOAD_file = 'config/testBojanV1.yml' # <= Path to the Configuration File to be Loaded
 else:
@@ -85,32 +88,49 @@ import matplotlib.pyplot as plt
 ##############################################################################
 
 def acquire_data(range_low, range_high, range_step, top, 
-        asic_pulser, file_prefix, n_iterations, dataStream): 
+        asic_pulser, file_prefix, n_iterations, sweep, pipeline=None): 
 
     # # dump the configuration (for debugging purposes)
     # top.SaveConfig('test_Bojan_dump.yml')
 
+    writeRaw = WriteRawData or (pipeline is None)
+
     for i in range(range_low, range_high, range_step):
         print(file_prefix+'step = %d' %i)
         asic_pulser.set(i)
 
-        filename = 'TestData/'+file_prefix+'%d.dat' %i
-        try: os.remove(filename)
-        except OSError: pass
+        # The previous step is analyzed by the pipeline worker while this one is acquired
+        if pipeline is not None:
+            pipeline.step(i)
 
-        top.dataWriter._writer.open(filename)
+        if writeRaw:
+            filename = 'TestData/'+file_prefix+'%d.dat' %i
+            try: os.remove(filename)
+            except OSError: pass
 
-        for j in range(n_iterations):
-            if (asicVersion == 1):
-                top.Fpga[0].Asic.LegacyV1AsicCalPulseStart()
-                time.sleep(0.001)
-            else:
-                top.Fpga[0].Asic.CalPulse.Start()
-                time.sleep(0.001)
+            top.dataWriter._writer.open(filename)
+
+        # One cal pulse train per step, returns once all the events have arrived
+        sweep.burst(n_iterations)
+
+        if writeRaw:
+            top.dataWriter._writer.close()
+
+    # Per-step results of the pipelined sweep, {sweep value: result}
+    if pipeline is not None:
+        return dict(pipeline.finish())
+    return None
+
+# Completes the per-step results of a sweep, {sweep value: result}: the steps that were not
+# accumulated by the pipelined sweep are read back from their .dat files on a process pool
+def analyze_sweep(results, file_prefix, values, outputs, analyze=None):
+    results = dict(results) if results is not None else {}
+    missing = [value for value in values if value not in results]
+    if missing:
+        analyzer = feb.SweepAnalyzer(outputs=outputs, analyze=analyze)
+        results.update(analyzer.run(feb.SweepFiles('TestData/'+file_prefix+'%d.dat', missing)))
+    return results
 
-        while dataStream.count < n_iterations: pass
-        top.dataWriter._writer.close()
-        dataStream.count = 0
 #################################################################
 
 def get_sweep_index(sweep_value, sweep_low, sweep_high, sweep_step):
@@ -121,429 +141,395 @@ def get_sweep_index(sweep_value, sweep_low, sweep_high, sweep_step):
     return int ( (sweep_value - sweep_low) / sweep_step )
 
 #################################################################
-# Set the argument parser
-parser = argparse.ArgumentParser()
-
-HistDelayTOA1_index  = get_sweep_index(HistDelayTOA1 , DelayRange_low, DelayRange_high, DelayRange_step)
-HistDelayTOA2_index  = get_sweep_index(HistDelayTOA2 , DelayRange_low, DelayRange_high, DelayRange_step)
-HistPulserTOT1_index = get_sweep_index(HistPulserTOT1, PulserRangeL, PulserRangeH, PulserRangeStep)
-HistPulserTOT2_index = get_sweep_index(HistPulserTOT2, PulserRangeL, PulserRangeH, PulserRangeStep)
-
-
-# Convert str to bool
-argBool = lambda s: s.lower() in ['true', 't', 'yes', '1']
-
-# Add arguments
-parser.add_argument(
-    "--ip", 
-    nargs    ='+',
-    required = True,
-    help     = "List of IP addresses",
-)  
-# Get the arguments
-args = parser.parse_args()
-
-#################################################################
-# Setup root class
-top = feb.Top(
-    ip       = args.ip,
-    userYaml = [Configuration_LOAD_file],
-    )    
-
-if DebugPrint:
-    top.Fpga[0].AxiVersion.printStatus()
-    # Tap the streaming data interface (same interface that writes to file)
-    dataStream = feb.PrintEventReader()    
+# The acquisition only runs in the main process: the SweepAnalyzer pool workers import this script
+if __name__ == '__main__':
+    # Set the argument parser
+    parser = argparse.ArgumentParser()
+
+    HistDelayTOA1_index  = get_sweep_index(HistDelayTOA1 , DelayRange_low, DelayRange_high, DelayRange_step)
+    HistDelayTOA2_index  = get_sweep_index(HistDelayTOA2 , DelayRange_low, DelayRange_high, DelayRange_step)
+    HistPulserTOT1_index = get_sweep_index(HistPulserTOT1, PulserRangeL, PulserRangeH, PulserRangeStep)
+    HistPulserTOT2_index = get_sweep_index(HistPulserTOT2, PulserRangeL, PulserRangeH, PulserRangeStep)
+
+
+    # Convert str to bool
+    argBool = lambda s: s.lower() in ['true', 't', 'yes', '1']
+
+    # Add arguments
+    parser.add_argument(
+        "--ip", 
+        nargs    ='+',
+        required = True,
+        help     = "List of IP addresses",
+    )  
+    # Get the arguments
+    args = parser.parse_args()
+
+    #################################################################
+    # Setup root class
+    top = feb.Top(
+        ip       = args.ip,
+        userYaml = [Configuration_LOAD_file],
+        )    
+
+    if DebugPrint:
+        top.Fpga[0].AxiVersion.printStatus()
+
+    # Tap the streaming data interface (same interface that writes to file), only counts the events unless DebugPrint
+    dataStream = feb.PrintEventReader() if DebugPrint else feb.EventReader()
     pyrogue.streamTap(top.dataStream[0], dataStream) # Assuming only 1 FPGA
 
-# Data Acquisition for TOA and TOT
-if DataAcqusitionTOA == 1:
-    acquire_data(DelayRange_low, DelayRange_high, DelayRange_step, top,
-            top.Fpga[0].Asic.Gpio.DlyCalPulseSet, 'TOA', NofIterationsTOA, dataStream)
-
-top.Fpga[0].Asic.Gpio.DlyCalPulseSet.set(DelayValueTOT)
-
-if DataAcqusitionTOT == 1:
-    acquire_data(PulserRangeL, PulserRangeH, PulserStep, top, 
-            top.Fpga[0].Asic.SlowControl.dac_pulser, 'TOT', NofIterationsTOT, dataStream)
-
-#######################
-# Data Processing TOA #
-#######################
-
-if nTOA_TOT_Processing == 0:
-
-    Delay = []
-    HitCnt = []
-    DataMean = []
-    DataStdev = []
-
-    for delay_value in range(DelayRange_low, DelayRange_high, DelayRange_step):
-        # Create the File reader streaming interface
-        dataReader = rogue.utilities.fileio.StreamReader()
-
-        # Create the Event reader streaming interface
-        dataStream = feb.MyFileReader()
-
-        # Connect the file reader ---> event reader
-        pr.streamConnect(dataReader, dataStream) 
-
-        # Open the file
-        dataReader.open('TestData/TOA%d.dat' %delay_value)
-
-        # Close file once everything processed
-        dataReader.closeWait()
-
-    
-        try:
-            print('Processing Data for Delay = %d...' % delay_value)
-        except OSError:
-            pass  
-
-        HitData = dataStream.HitData
-
-        exec("%s = %r" % ('HitData%d' %delay_value, HitData))
-
-        Delay.append(delay_value)
-
-        HitCnt.append(len(HitData))
-        if len(HitData) > 0:
-            DataMean.append(np.mean(HitData, dtype=np.float64))
-            DataStdev.append(math.sqrt(math.pow(np.std(HitData, dtype=np.float64),2)+1/12))
-
-        else:
-            DataMean.append(0)
-            DataStdev.append(0)
+    # Cal pulse bursts, completed when the events have been received by dataStream
+    sweep = feb.CalPulseSweep(top.Fpga[0].Asic, dataStream, asicVersion=asicVersion)
+
+    # Per-step accumulators of the pipelined sweeps (TOA statistics are computed on the worker thread)
+    toaPipeline = None
+    totPipeline = None
+    toaResults  = None
+    totResults  = None
+    if PipelinedSweep:
+        toaPipeline = feb.SweepPipeline(outputs=('toa',), analyze=feb.ToaStepStats)
+        totPipeline = feb.SweepPipeline(outputs=(('tz',) if nVPA_TZ else ('vpa',)))
+
+    # Data Acquisition for TOA and TOT
+    # A pipelined sweep counts its events on the pipeline itself: it is tapped after dataStream, so a
+    # burst only returns once the last frames of the step have reached the pipeline
+    if DataAcqusitionTOA == 1:
+        toaSweep = sweep
+        if toaPipeline is not None:
+            pyrogue.streamTap(top.dataStream[0], toaPipeline)
+            toaSweep = feb.CalPulseSweep(top.Fpga[0].Asic, toaPipeline, asicVersion=asicVersion, pulseDelay=None)
+        toaResults = acquire_data(DelayRange_low, DelayRange_high, DelayRange_step, top,
+                top.Fpga[0].Asic.Gpio.DlyCalPulseSet, 'TOA', NofIterationsTOA, toaSweep, toaPipeline)
+
+    top.Fpga[0].Asic.Gpio.DlyCalPulseSet.set(DelayValueTOT)
+
+    if DataAcqusitionTOT == 1:
+        totSweep = sweep
+        if totPipeline is not None:
+            pyrogue.streamTap(top.dataStream[0], totPipeline)
+            totSweep = feb.CalPulseSweep(top.Fpga[0].Asic, totPipeline, asicVersion=asicVersion, pulseDelay=None)
+        totResults = acquire_data(PulserRangeL, PulserRangeH, PulserStep, top, 
+                top.Fpga[0].Asic.SlowControl.dac_pulser, 'TOT', NofIterationsTOT, totSweep, totPipeline)
+
+    #######################
+    # Data Processing TOA #
+    #######################
+
+    if nTOA_TOT_Processing == 0:
+
+        Delay = []
+        HitCnt = []
+        DataMean = []
+        DataStdev = []
+        ToaBins = {}   # Hits per TOA code of each delay value
+
+        # Per-step TOA statistics (pipelined sweep or TestData/TOA%d.dat files)
+        toaResults = analyze_sweep(toaResults, 'TOA', range(DelayRange_low, DelayRange_high, DelayRange_step), ('toa',), feb.ToaStepStats)
+
+        for delay_value in range(DelayRange_low, DelayRange_high, DelayRange_step):
+            try:
+                print('Processing Data for Delay = %d...' % delay_value)
+            except OSError:
+                pass  
+
+            ToaBins[delay_value], hitCnt, dataMean, dataStdev = toaResults[delay_value]
+
+            Delay.append(delay_value)
+            HitCnt.append(hitCnt)
+            DataMean.append(dataMean)
+            DataStdev.append(dataStdev)
   
-    if len(DataMean) == 0:
-        raise ValueError('No hits were detected during delay sweep. Aborting!')
+        if len(DataMean) == 0:
+            raise ValueError('No hits were detected during delay sweep. Aborting!')
 
-    # Average Std. Dev. Calculation; Points with no data (i.e. Std.Dev.= 0) are ignored
-    index = np.where(np.sort(DataStdev))
-    MeanDataStdev = np.mean(np.sort(DataStdev)[index[0][0]:len(np.sort(DataStdev))])
+        # Average Std. Dev. Calculation; Points with no data (i.e. Std.Dev.= 0) are ignored
+        index = np.where(np.sort(DataStdev))
+        MeanDataStdev = np.mean(np.sort(DataStdev)[index[0][0]:len(np.sort(DataStdev))])
 
-    # LSB estimation based on "DelayStep" value
-    index=np.where(DataMean)
-    fit = np.polyfit(Delay[index[0][5]:index[0][-5]], DataMean[index[0][5]:index[0][-5]], 1)
-    LSBest = DelayStep/abs(fit[0])
+        # LSB estimation based on "DelayStep" value
+        index=np.where(DataMean)
+        fit = np.polyfit(Delay[index[0][5]:index[0][-5]], DataMean[index[0][5]:index[0][-5]], 1)
+        LSBest = DelayStep/abs(fit[0])
 
-#################################################################
-# TOT Fine Interpolator Calibration
+    #################################################################
+    # Per-step TOT hits (pipelined sweep or TestData/TOT%d.dat files)
 
-if nTOA_TOT_Processing == 1 and TOT_f_Calibration_En == 1:
-    # Create the File reader streaming interface
-    dataReader = rogue.utilities.fileio.StreamReader()
+    if nTOA_TOT_Processing == 1:
+        totResults = analyze_sweep(totResults, 'TOT', range(PulserRangeL, PulserRangeH), (('tz',) if nVPA_TZ else ('vpa',)))
 
-    # Create the Event reader streaming interface
-    dataStream = feb.MyFileReader()
+    #################################################################
+    # TOT Fine Interpolator Calibration
 
-    # Connect the file reader ---> event reader
-    pr.streamConnect(dataReader, dataStream) 
+    if nTOA_TOT_Processing == 1 and TOT_f_Calibration_En == 1:
+        # Hits per TOT fine code, summed over the pulser sweep
+        TOTf_cumulative = np.zeros(16)
 
-    for i in range(PulserRangeL, PulserRangeH):
-        # Open the file
-        dataReader.open('TestData/TOT%d.dat' %i)
-        time.sleep(0.01)
-        # Close file once everything processed
-        dataReader.closeWait()
-        time.sleep(0.01)
+        for i in range(PulserRangeL, PulserRangeH):
+            fields = feb.TotHistFields(totResults[i].totHist.bins(), ('tz' if nVPA_TZ else 'vpa'))
+            TOTf_cumulative += np.bincount(fields['TOTf'], weights=fields['Counts'], minlength=16)[:16]
     
-    if not nVPA_TZ:    
-        HitDataTOTf_cumulative = dataStream.HitDataTOTf_vpa
-    else:
-        HitDataTOTf_cumulative = dataStream.HitDataTOTf_tz
-    
-    TOTf_bin_width = np.zeros(16)
-    for i in range(16):
-        TOTf_bin_width[i]=len(list(np.where(np.asarray(HitDataTOTf_cumulative)==i))[0])
-    TOTf_bin_width = TOTf_bin_width/sum(TOTf_bin_width)
-
-    TOTf_bin = np.zeros(18)
-    for i in range(1,17):
-        TOTf_bin[i]=len(list(np.where(np.asarray(HitDataTOTf_cumulative)==i-1))[0])
-
-    index = np.where(np.sort(TOTf_bin))
-    LSB_TOTf_mean = np.mean(np.sort(TOTf_bin)[index[0][0]:len(np.sort(TOTf_bin))])/sum(TOTf_bin)
-
-    TOTf_bin = (TOTf_bin[1:18]/2 + np.cumsum(TOTf_bin)[0:17])/sum(TOTf_bin)
-    TOTf_bin[16] = LSB_TOTf_mean
-
-    try:
-        print('TOT Fine Interpolator Bin-Widths:')
-        print(TOTf_bin_width*2*LSB_TOTc)
-        print('Average TOT LSB = %f ps' % (LSB_TOTf_mean*2*LSB_TOTc))
-    except OSError:
-        pass   
-
-    np.savetxt(TOT_f_Calibration_SAVE_file,TOTf_bin)
-
-#################################################################
-# Data Processing TOT
-
-if nTOA_TOT_Processing == 1:
-
-    Pulser = []
-    ValidTOTCnt = []
-    DataMeanTOT = []
-    DataStdevTOT = []
-    HitDataTOTf_cumulative = []
-
-    for i in range(PulserRangeL, PulserRangeH):
-        # Create the File reader streaming interface
-        dataReader = rogue.utilities.fileio.StreamReader()
+        TOTf_bin_width = TOTf_cumulative/sum(TOTf_cumulative)
 
-        # Create the Event reader streaming interface
-        dataStream = MyFileReader()
+        TOTf_bin = np.zeros(18)
+        TOTf_bin[1:17] = TOTf_cumulative
 
-        # Connect the file reader ---> event reader
-        pr.streamConnect(dataReader, dataStream) 
+        index = np.where(np.sort(TOTf_bin))
+        LSB_TOTf_mean = np.mean(np.sort(TOTf_bin)[index[0][0]:len(np.sort(TOTf_bin))])/sum(TOTf_bin)
 
-        # Open the file
-        dataReader.open('TestData/TOT%d.dat' %i)
+        TOTf_bin = (TOTf_bin[1:18]/2 + np.cumsum(TOTf_bin)[0:17])/sum(TOTf_bin)
+        TOTf_bin[16] = LSB_TOTf_mean
 
-        # Close file once everything processed
-        dataReader.closeWait()
-
-    
         try:
-            print('Processing Data for Pulser = %d...' % i)
+            print('TOT Fine Interpolator Bin-Widths:')
+            print(TOTf_bin_width*2*LSB_TOTc)
+            print('Average TOT LSB = %f ps' % (LSB_TOTf_mean*2*LSB_TOTc))
         except OSError:
-            pass  
+            pass   
 
-        if not nVPA_TZ:    
-            HitDataTOTf = dataStream.HitDataTOTf_vpa
-            HitDataTOTc = dataStream.HitDataTOTc_vpa
-            HitDataTOTc_int1 = dataStream.HitDataTOTc_int1_vpa
-            HitDataTOTf_cumulative = HitDataTOTf_cumulative + dataStream.HitDataTOTf_vpa
-        else:
-            HitDataTOTf = dataStream.HitDataTOTf_tz
-            HitDataTOTc = dataStream.HitDataTOTc_tz
-            HitDataTOTc_int1 = dataStream.HitDataTOTc_int1_tz
-            HitDataTOTf_cumulative = HitDataTOTf_cumulative + dataStream.HitDataTOTf_tz
+        np.savetxt(TOT_f_Calibration_SAVE_file,TOTf_bin)
+
+    #################################################################
+    # Data Processing TOT
+
+    if nTOA_TOT_Processing == 1:
+
+        Pulser = []
+        ValidTOTCnt = []
+        DataMeanTOT = []
+        DataStdevTOT = []
+        TOTf_cumulative = np.zeros(16)
+        TotSteps = {}   # TOT histogram of each pulser value: (TOT [ps], TOT fine, TOT coarse, hits) per TOT code
+
+        for i in range(PulserRangeL, PulserRangeH):
+            try:
+                print('Processing Data for Pulser = %d...' % i)
+            except OSError:
+                pass  
+
+            # TOT codes of the step histogram (constant size), weighted by their number of hits
+            fields = feb.TotHistFields(totResults[i].totHist.bins(), ('tz' if nVPA_TZ else 'vpa'))
+            TOTf      = fields['TOTf'].astype(np.int64)
+            TOTc      = fields['TOTc'].astype(np.int64)
+            TOTc_int1 = fields['TOTc_int1'].astype(np.int64)
+            counts    = fields['Counts']
+            TOTf_cumulative += np.bincount(TOTf, weights=counts, minlength=16)[:16]
     
-        Pulser.append(i)
+            Pulser.append(i)
     
-        TOTf_bin = np.loadtxt(TOT_f_Calibration_LOAD_file) 
-        LSB_TOTf_mean = TOTf_bin[16]*2*LSB_TOTc
+            TOTf_bin = np.loadtxt(TOT_f_Calibration_LOAD_file) 
+            LSB_TOTf_mean = TOTf_bin[16]*2*LSB_TOTc
 
-        def calibration_correction(f,c):
-            if f > 3 and c == 0:
-                return 2
-            else:
-                if f == 0 and c == 1:
-                    return -TOTf_bin[0]*2
+            def calibration_correction(f,c):
+                if f > 3 and c == 0:
+                    return 2
                 else:
-                    return 0
-        IntFVa = 1
-        if IntFVa == 1:
-            if len(HitDataTOTf) > 0:
-                HitDataTOT = list((np.asarray(HitDataTOTc_int1)*2 + 1 - np.asarray(list(map(lambda x: TOTf_bin[x], np.asarray(HitDataTOTf, dtype=np.int))))*2)*LSB_TOTc)
-            
-                HitDataTOT = list(HitDataTOT + np.asarray(list(map(calibration_correction, HitDataTOTf, list(map(lambda x: x&1, np.asarray(HitDataTOTc))))))*LSB_TOTc)
-            else:
-                HitDataTOT = []    
-        else:
-            if len(HitDataTOTf) > 0:
-                HitDataTOT = list((np.asarray(HitDataTOTc) + 1 - np.asarray(HitDataTOTf)/4)*LSB_TOTc)
+                    if f == 0 and c == 1:
+                        return -TOTf_bin[0]*2
+                    else:
+                        return 0
+            IntFVa = 1
+            if IntFVa == 1:
+                TOT = (TOTc_int1*2 + 1 - TOTf_bin[TOTf]*2)*LSB_TOTc
+                TOT = TOT + np.asarray(list(map(calibration_correction, TOTf, TOTc & 1)))*LSB_TOTc
             else:
-                HitDataTOT = []  
-
-        #HitDataTOT = HitDataTOTc
-
-        exec("%s = %r" % ('HitDataTOT%d' %i, HitDataTOT))
-        exec("%s = %r" % ('HitDataTOTf%d' %i, HitDataTOTf))
-        exec("%s = %r" % ('HitDataTOTc%d' %i, HitDataTOTc))
+                TOT = (TOTc + 1 - TOTf/4)*LSB_TOTc
 
-        ValidTOTCnt.append(len(HitDataTOT))
-        if len(HitDataTOT) > 0:        
-            DataMeanTOT.append(np.mean(HitDataTOT, dtype=np.float64))
-            DataStdevTOT.append(math.sqrt(math.pow(np.std(HitDataTOT, dtype=np.float64),2) + math.pow(LSB_TOTf_mean,2)/12))
+            TotSteps[i] = (TOT, TOTf, TOTc, counts)
 
-        else:
-            DataMeanTOT.append(0)
-            DataStdevTOT.append(0)
-
-    # Average Std. Dev. Calculation; Points with no data (i.e. Std.Dev.= 0) are ignored
-    index = np.where(np.sort(DataStdevTOT))
-    MeanDataStdevTOT = np.mean(np.sort(DataStdevTOT)[index[0][0]:len(np.sort(DataStdevTOT))])
+            ValidTOTCnt.append(int(counts.sum()))
+            if counts.sum() > 0:        
+                meanTOT = np.average(TOT, weights=counts)
+                DataMeanTOT.append(meanTOT)
+                DataStdevTOT.append(math.sqrt(np.average((TOT-meanTOT)**2, weights=counts) + math.pow(LSB_TOTf_mean,2)/12))
 
-#################################################################
-# Print Data
-if nTOA_TOT_Processing == 0:
-    for delay_index, delay_value in enumerate(Delay):
+            else:
+                DataMeanTOT.append(0)
+                DataStdevTOT.append(0)
+
+        # Average Std. Dev. Calculation; Points with no data (i.e. Std.Dev.= 0) are ignored
+        index = np.where(np.sort(DataStdevTOT))
+        MeanDataStdevTOT = np.mean(np.sort(DataStdevTOT)[index[0][0]:len(np.sort(DataStdevTOT))])
+
+    #################################################################
+    # Print Data
+    if nTOA_TOT_Processing == 0:
+        for delay_index, delay_value in enumerate(Delay):
+            try:
+                print('Delay = %d, HitCnt = %d, DataMean = %f LSB, DataStDev = %f LSB' % (delay_value, HitCnt[delay_index], DataMean[delay_index], DataStdev[delay_index]))
+            except OSError:
+                pass   
         try:
-            print('Delay = %d, HitCnt = %d, DataMean = %f LSB, DataStDev = %f LSB' % (delay_value, HitCnt[delay_index], DataMean[delay_index], DataStdev[delay_index]))
+            print('Maximum Measured TOA = %f LSB' % np.max(DataMean))
+            print('Mean Std Dev = %f LSB' % MeanDataStdev)
         except OSError:
-            pass   
-    try:
-        print('Maximum Measured TOA = %f LSB' % np.max(DataMean))
-        print('Mean Std Dev = %f LSB' % MeanDataStdev)
-    except OSError:
-        pass
-    for delay_index, delay_value in enumerate(Delay):
+            pass
+        for delay_index, delay_value in enumerate(Delay):
+            try:
+                print('Delay = %d, HitCnt = %d, DataMean = %f ps, DataStDev = %f ps' % (delay_value, HitCnt[delay_index], DataMean[delay_index]*LSBest, DataStdev[delay_index]*LSBest))
+            except OSError:
+                pass
         try:
-            print('Delay = %d, HitCnt = %d, DataMean = %f ps, DataStDev = %f ps' % (delay_value, HitCnt[delay_index], DataMean[delay_index]*LSBest, DataStdev[delay_index]*LSBest))
+            print('Maximum Measured TOA = %f ps' % (np.max(DataMean)*LSBest))
+            print('Mean Std Dev = %f ps' % (MeanDataStdev*LSBest))
+            print('Average LSB estimate: %f ps' % LSBest)
         except OSError:
             pass
-    try:
-        print('Maximum Measured TOA = %f ps' % (np.max(DataMean)*LSBest))
-        print('Mean Std Dev = %f ps' % (MeanDataStdev*LSBest))
-        print('Average LSB estimate: %f ps' % LSBest)
-    except OSError:
-        pass
-#################################################################
+    #################################################################
 
-#################################################################
-# Plot Data
-
-fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(nrows = 2, ncols = 2, figsize=(16,7))
-
-# LSBest = 1
-
-if nTOA_TOT_Processing == 0:
-    # Plot (0,0) ; top left
-    ax1.plot(Delay, np.multiply(DataMean,LSBest))
-    ax1.grid(True)
-    ax1.set_title('TOA Measurment VS Programmable Delay Value', fontsize = 11)
-    ax1.set_xlabel('Programmable Delay Value [step estimate = %f ps]' % DelayStep, fontsize = 10)
-    ax1.set_ylabel('Mean Value [ps]', fontsize = 10)
-    ax1.legend(['LSB estimate: %f ps' % LSBest],loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
-    ax1.set_xlim(left = np.min(Delay), right = np.max(Delay))
-    ax1.set_ylim(bottom = 0, top = np.max(np.multiply(DataMean,LSBest))+100)
-else:
-    # Plot (0,0) ; top left
-    ax1.plot(Pulser, DataMeanTOT)
-    ax1.grid(True)
-    ax1.set_title('TOT Measurment VS Injected Charge', fontsize = 11)
-    ax1.set_xlabel('Pulser DAC Value', fontsize = 10)
-    ax1.set_ylabel('Mean Value [ps]', fontsize = 10)
-    ax1.set_xlim(left = np.min(Pulser), right = np.max(Pulser))
-    ax1.set_ylim(bottom = 0, top = np.max(DataMeanTOT)*1.1)
-
-if nTOA_TOT_Processing == 0:
-    # Plot (0,1) ; top right
-    ax2.scatter(Delay, np.multiply(DataStdev,LSBest))
-    ax2.grid(True)
-    ax2.set_title('TOA Jitter VS Programmable Delay Value', fontsize = 11)
-    ax2.set_xlabel('Programmable Delay Value', fontsize = 10)
-    ax2.set_ylabel('Std. Dev. [ps]', fontsize = 10)
-    ax2.legend(['Average Std. Dev. = %f ps' % (MeanDataStdev*LSBest)], loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
-    ax2.set_xlim(left = np.min(Delay), right = np.max(Delay))
-    ax2.set_ylim(bottom = 0, top = np.max(np.multiply(DataStdev,LSBest))+20)
-else:
-    # Plot (0,1) ; top right
-    if PlotValidCnt == 0:
-        ax2.scatter(Pulser, DataStdevTOT)
+    #################################################################
+    # Plot Data
+
+    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(nrows = 2, ncols = 2, figsize=(16,7))
+
+    # LSBest = 1
+
+    if nTOA_TOT_Processing == 0:
+        # Plot (0,0) ; top left
+        ax1.plot(Delay, np.multiply(DataMean,LSBest))
+        ax1.grid(True)
+        ax1.set_title('TOA Measurment VS Programmable Delay Value', fontsize = 11)
+        ax1.set_xlabel('Programmable Delay Value [step estimate = %f ps]' % DelayStep, fontsize = 10)
+        ax1.set_ylabel('Mean Value [ps]', fontsize = 10)
+        ax1.legend(['LSB estimate: %f ps' % LSBest],loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
+        ax1.set_xlim(left = np.min(Delay), right = np.max(Delay))
+        ax1.set_ylim(bottom = 0, top = np.max(np.multiply(DataMean,LSBest))+100)
+    else:
+        # Plot (0,0) ; top left
+        ax1.plot(Pulser, DataMeanTOT)
+        ax1.grid(True)
+        ax1.set_title('TOT Measurment VS Injected Charge', fontsize = 11)
+        ax1.set_xlabel('Pulser DAC Value', fontsize = 10)
+        ax1.set_ylabel('Mean Value [ps]', fontsize = 10)
+        ax1.set_xlim(left = np.min(Pulser), right = np.max(Pulser))
+        ax1.set_ylim(bottom = 0, top = np.max(DataMeanTOT)*1.1)
+
+    if nTOA_TOT_Processing == 0:
+        # Plot (0,1) ; top right
+        ax2.scatter(Delay, np.multiply(DataStdev,LSBest))
         ax2.grid(True)
-        ax2.set_title('TOT Jitter VS Injected Charge', fontsize = 11)
-        ax2.set_xlabel('Pulser DAC Value', fontsize = 10)
+        ax2.set_title('TOA Jitter VS Programmable Delay Value', fontsize = 11)
+        ax2.set_xlabel('Programmable Delay Value', fontsize = 10)
         ax2.set_ylabel('Std. Dev. [ps]', fontsize = 10)
-        ax2.legend(['Average Std. Dev. = %f ps' % MeanDataStdevTOT], loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
-        ax2.set_xlim(left = np.min(Pulser), right = np.max(Pulser))
-        ax2.set_ylim(bottom = 0, top = np.max(DataStdevTOT)*1.1)
+        ax2.legend(['Average Std. Dev. = %f ps' % (MeanDataStdev*LSBest)], loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
+        ax2.set_xlim(left = np.min(Delay), right = np.max(Delay))
+        ax2.set_ylim(bottom = 0, top = np.max(np.multiply(DataStdev,LSBest))+20)
     else:
-        ax2.plot(Pulser, ValidTOTCnt)
-        ax2.grid(True)
-        ax2.set_title('TOT Valid Counts VS Injected Charge', fontsize = 11)
-        ax2.set_xlabel('Pulser DAC Value', fontsize = 10)
-        ax2.set_ylabel('Valid Measurements', fontsize = 10)
-        ax2.set_xlim(left = np.min(Pulser), right = np.max(Pulser))
-        ax2.set_ylim(bottom = 0, top = np.max(ValidTOTCnt)*1.1)
-
-if nTOA_TOT_Processing == 0:
-    # Plot (1,0) ; bottom left
-    exec("DataL = len(HitData%d)" % HistDelayTOA1)
-    if DataL:
-        #exec("ax3.hist(np.multiply(HitData%d,LSBest), bins = LSBest, align = 'left', edgecolor = 'k', color = 'royalblue')" % HistDelayTOA1)
-        hist_range = 10
-        binlow = ( int(DataMean[HistDelayTOA1_index])-hist_range ) * LSBest
-        binhigh = ( int(DataMean[HistDelayTOA1_index])+hist_range ) * LSBest
-        hist_bin_list = np.arange(binlow, binhigh, LSBest)
-        exec("ax3.hist(np.multiply(HitData%d,LSBest), bins = hist_bin_list, align = 'left', edgecolor = 'k', color = 'royalblue')" % HistDelayTOA1)
-        #exec("ax3.set_xlim(left = np.min(np.multiply(HitData%d,LSBest))-4*LSBest, right = np.max(np.multiply(HitData%d,LSBest))+4*LSBest)" % (HistDelayTOA1, HistDelayTOA1))
-        ax3.set_title('TOA Measurment for Programmable Delay = %d' % HistDelayTOA1, fontsize = 11)
-        ax3.set_xlabel('TOA Measurement [ps]', fontsize = 10)
-        ax3.set_ylabel('N of Measrements', fontsize = 10)
-        ax3.legend(['Mean = %f ps \nStd. Dev. = %f ps \nN of Events = %d' % (DataMean[HistDelayTOA1_index]*LSBest, DataStdev[HistDelayTOA1_index]*LSBest, HitCnt[HistDelayTOA1_index])], loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
-else:
-    # Plot (1,0)
-    #exec("print(HitDataTOT%d)" % HistPulserTOT1)
-    #exec("print(HitDataTOTf%d)" % HistPulserTOT1)
-    #exec("print(HitDataTOTc%d)" % HistPulserTOT1)
-    #exec("print(np.asarray(list(map(lambda x: TOTf_bin[x], np.asarray(HitDataTOTf%d, dtype=np.int))))*2)" % HistPulserTOT1)
-    #exec("print(list(map(lambda x: x&1, np.asarray(HitDataTOTc%d))))" % HistPulserTOT1)
-    if TOTf_hist == 0 and TOTc_hist == 0:
-        exec("DataL = len(HitDataTOT%d)" % HistPulserTOT1)
+        # Plot (0,1) ; top right
+        if PlotValidCnt == 0:
+            ax2.scatter(Pulser, DataStdevTOT)
+            ax2.grid(True)
+            ax2.set_title('TOT Jitter VS Injected Charge', fontsize = 11)
+            ax2.set_xlabel('Pulser DAC Value', fontsize = 10)
+            ax2.set_ylabel('Std. Dev. [ps]', fontsize = 10)
+            ax2.legend(['Average Std. Dev. = %f ps' % MeanDataStdevTOT], loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
+            ax2.set_xlim(left = np.min(Pulser), right = np.max(Pulser))
+            ax2.set_ylim(bottom = 0, top = np.max(DataStdevTOT)*1.1)
+        else:
+            ax2.plot(Pulser, ValidTOTCnt)
+            ax2.grid(True)
+            ax2.set_title('TOT Valid Counts VS Injected Charge', fontsize = 11)
+            ax2.set_xlabel('Pulser DAC Value', fontsize = 10)
+            ax2.set_ylabel('Valid Measurements', fontsize = 10)
+            ax2.set_xlim(left = np.min(Pulser), right = np.max(Pulser))
+            ax2.set_ylim(bottom = 0, top = np.max(ValidTOTCnt)*1.1)
+
+    if nTOA_TOT_Processing == 0:
+        # Plot (1,0) ; bottom left
+        DataL = HitCnt[HistDelayTOA1_index]
         if DataL:
-            exec("ax3.hist(HitDataTOT%d, bins = np.multiply(np.arange(512),LSB_TOTf_mean), align = 'left', edgecolor = 'k', color = 'royalblue')" % HistPulserTOT1)
-            exec("ax3.set_xlim(left = np.min(HitDataTOT%d)-10*LSB_TOTf_mean, right = np.max(HitDataTOT%d)+10*LSB_TOTf_mean)" % (HistPulserTOT1, HistPulserTOT1))
-            ax3.set_title('TOT Measurment for Pulser = %d' % HistPulserTOT1, fontsize = 11)
-            ax3.set_xlabel('TOT Measurement [ps]', fontsize = 10)
+            #exec("ax3.hist(np.multiply(HitData%d,LSBest), bins = LSBest, align = 'left', edgecolor = 'k', color = 'royalblue')" % HistDelayTOA1)
+            hist_range = 10
+            binlow = ( int(DataMean[HistDelayTOA1_index])-hist_range ) * LSBest
+            binhigh = ( int(DataMean[HistDelayTOA1_index])+hist_range ) * LSBest
+            hist_bin_list = np.arange(binlow, binhigh, LSBest)
+            ax3.hist(np.arange(feb.ToaCodes)*LSBest, weights = ToaBins[HistDelayTOA1], bins = hist_bin_list, align = 'left', edgecolor = 'k', color = 'royalblue')
+            #exec("ax3.set_xlim(left = np.min(np.multiply(HitData%d,LSBest))-4*LSBest, right = np.max(np.multiply(HitData%d,LSBest))+4*LSBest)" % (HistDelayTOA1, HistDelayTOA1))
+            ax3.set_title('TOA Measurment for Programmable Delay = %d' % HistDelayTOA1, fontsize = 11)
+            ax3.set_xlabel('TOA Measurement [ps]', fontsize = 10)
             ax3.set_ylabel('N of Measrements', fontsize = 10)
-            ax3.legend(['Mean = %f ps \nStd. Dev. = %f ps \nN of Events = %d' % (DataMeanTOT[HistPulserTOT1_index], DataStdevTOT[HistPulserTOT1_index], ValidTOTCnt[HistPulserTOT1_index])], loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
+            ax3.legend(['Mean = %f ps \nStd. Dev. = %f ps \nN of Events = %d' % (DataMean[HistDelayTOA1_index]*LSBest, DataStdev[HistDelayTOA1_index]*LSBest, HitCnt[HistDelayTOA1_index])], loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
     else:
-        if TOTf_hist == 1:
-            exec("ax3.hist(HitDataTOTf%d, bins = np.arange(9), align = 'left', edgecolor = 'k', color = 'royalblue')" % HistPulserTOT1)
-            ax3.set_xlim(left = -1, right = 8)
-            ax3.set_title('TOT Measurment for Pulser = %d' % HistPulserTOT1, fontsize = 11)
-            ax3.set_xlabel('TOT Measurement [ps]', fontsize = 10)
-            ax3.set_ylabel('N of Measrements', fontsize = 10)
-            ax3.legend(['Mean = %f ps \nStd. Dev. = %f ps \nN of Events = %d' % (DataMeanTOT[HistPulserTOT1_index], DataStdevTOT[HistPulserTOT1_index], ValidTOTCnt[HistPulserTOT1_index])], loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
-        else: 
-            if TOTc_hist == 1:
-                exec("ax3.hist(HitDataTOTc%d, bins = np.arange(129), align = 'left', edgecolor = 'k', color = 'royalblue')" % HistPulserTOT1)
-                ax3.set_xlim(left = -1, right = 128)
+        # Plot (1,0)
+        #exec("print(HitDataTOT%d)" % HistPulserTOT1)
+        #exec("print(HitDataTOTf%d)" % HistPulserTOT1)
+        #exec("print(HitDataTOTc%d)" % HistPulserTOT1)
+        #exec("print(np.asarray(list(map(lambda x: TOTf_bin[x], np.asarray(HitDataTOTf%d, dtype=np.int))))*2)" % HistPulserTOT1)
+        #exec("print(list(map(lambda x: x&1, np.asarray(HitDataTOTc%d))))" % HistPulserTOT1)
+        if TOTf_hist == 0 and TOTc_hist == 0:
+            TOT, TOTf, TOTc, counts = TotSteps[HistPulserTOT1]
+            if counts.sum():
+                ax3.hist(TOT, weights = counts, bins = np.multiply(np.arange(512),LSB_TOTf_mean), align = 'left', edgecolor = 'k', color = 'royalblue')
+                ax3.set_xlim(left = np.min(TOT[counts > 0])-10*LSB_TOTf_mean, right = np.max(TOT[counts > 0])+10*LSB_TOTf_mean)
                 ax3.set_title('TOT Measurment for Pulser = %d' % HistPulserTOT1, fontsize = 11)
                 ax3.set_xlabel('TOT Measurement [ps]', fontsize = 10)
                 ax3.set_ylabel('N of Measrements', fontsize = 10)
                 ax3.legend(['Mean = %f ps \nStd. Dev. = %f ps \nN of Events = %d' % (DataMeanTOT[HistPulserTOT1_index], DataStdevTOT[HistPulserTOT1_index], ValidTOTCnt[HistPulserTOT1_index])], loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
-
-if nTOA_TOT_Processing == 0:
-    # Plot (1,1)
-    if PlotValidCnt == 0:
-        exec("DataL = len(HitData%d)" % HistDelayTOA2)
-        if DataL:
-            hist_range = 10
-            binlow = ( int(DataMean[HistDelayTOA2_index])-hist_range ) * LSBest
-            binhigh = ( int(DataMean[HistDelayTOA2_index])+hist_range ) * LSBest
-            hist_bin_list = np.arange(binlow, binhigh, LSBest)
-            exec("ax4.hist(np.multiply(HitData%d,LSBest), bins = hist_bin_list, align = 'left', edgecolor = 'k', color = 'royalblue')" % HistDelayTOA2)
-            #exec("ax4.set_xlim(left = np.min(np.multiply(HitData%d,LSBest))-10*LSBest, right = np.max(np.multiply(HitData%d,LSBest))+10*LSBest)" % (HistDelayTOA2, HistDelayTOA2))
-            ax4.set_title('TOA Measurment for Programmable Delay = %d' % HistDelayTOA2, fontsize = 11)
-            ax4.set_xlabel('TOA Measurement [ps]', fontsize = 10)
-            ax4.set_ylabel('N of Measrements', fontsize = 10)
-            ax4.legend(['Mean = %f ps \nStd. Dev. = %f ps \nN of Events = %d' % (DataMean[HistDelayTOA2_index]*LSBest, DataStdev[HistDelayTOA2_index]*LSBest, HitCnt[HistDelayTOA2_index])], loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
+        else:
+            if TOTf_hist == 1:
+                TOT, TOTf, TOTc, counts = TotSteps[HistPulserTOT1]
+                ax3.hist(TOTf, weights = counts, bins = np.arange(9), align = 'left', edgecolor = 'k', color = 'royalblue')
+                ax3.set_xlim(left = -1, right = 8)
+                ax3.set_title('TOT Measurment for Pulser = %d' % HistPulserTOT1, fontsize = 11)
+                ax3.set_xlabel('TOT Measurement [ps]', fontsize = 10)
+                ax3.set_ylabel('N of Measrements', fontsize = 10)
+                ax3.legend(['Mean = %f ps \nStd. Dev. = %f ps \nN of Events = %d' % (DataMeanTOT[HistPulserTOT1_index], DataStdevTOT[HistPulserTOT1_index], ValidTOTCnt[HistPulserTOT1_index])], loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
+            else: 
+                if TOTc_hist == 1:
+                    TOT, TOTf, TOTc, counts = TotSteps[HistPulserTOT1]
+                    ax3.hist(TOTc, weights = counts, bins = np.arange(129), align = 'left', edgecolor = 'k', color = 'royalblue')
+                    ax3.set_xlim(left = -1, right = 128)
+                    ax3.set_title('TOT Measurment for Pulser = %d' % HistPulserTOT1, fontsize = 11)
+                    ax3.set_xlabel('TOT Measurement [ps]', fontsize = 10)
+                    ax3.set_ylabel('N of Measrements', fontsize = 10)
+                    ax3.legend(['Mean = %f ps \nStd. Dev. = %f ps \nN of Events = %d' % (DataMeanTOT[HistPulserTOT1_index], DataStdevTOT[HistPulserTOT1_index], ValidTOTCnt[HistPulserTOT1_index])], loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
+
+    if nTOA_TOT_Processing == 0:
+        # Plot (1,1)
+        if PlotValidCnt == 0:
+            DataL = HitCnt[HistDelayTOA2_index]
+            if DataL:
+                hist_range = 10
+                binlow = ( int(DataMean[HistDelayTOA2_index])-hist_range ) * LSBest
+                binhigh = ( int(DataMean[HistDelayTOA2_index])+hist_range ) * LSBest
+                hist_bin_list = np.arange(binlow, binhigh, LSBest)
+                ax4.hist(np.arange(feb.ToaCodes)*LSBest, weights = ToaBins[HistDelayTOA2], bins = hist_bin_list, align = 'left', edgecolor = 'k', color = 'royalblue')
+                #exec("ax4.set_xlim(left = np.min(np.multiply(HitData%d,LSBest))-10*LSBest, right = np.max(np.multiply(HitData%d,LSBest))+10*LSBest)" % (HistDelayTOA2, HistDelayTOA2))
+                ax4.set_title('TOA Measurment for Programmable Delay = %d' % HistDelayTOA2, fontsize = 11)
+                ax4.set_xlabel('TOA Measurement [ps]', fontsize = 10)
+                ax4.set_ylabel('N of Measrements', fontsize = 10)
+                ax4.legend(['Mean = %f ps \nStd. Dev. = %f ps \nN of Events = %d' % (DataMean[HistDelayTOA2_index]*LSBest, DataStdev[HistDelayTOA2_index]*LSBest, HitCnt[HistDelayTOA2_index])], loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
+        else:
+            ax4.plot(Delay, HitCnt)
+            ax4.grid(True)
+            ax4.set_title('TOA Valid Counts VS Programmable Delay Value', fontsize = 11)
+            ax4.set_xlabel('Programmable Delay Value', fontsize = 10)
+            ax4.set_ylabel('Valid Measurements', fontsize = 10)
+            ax4.set_xlim(left = np.min(Delay), right = np.max(Delay))
+            ax4.set_ylim(bottom = 0, top = np.max(HitCnt)*1.1)
     else:
-        ax4.plot(Delay, HitCnt)
-        ax4.grid(True)
-        ax4.set_title('TOA Valid Counts VS Programmable Delay Value', fontsize = 11)
-        ax4.set_xlabel('Programmable Delay Value', fontsize = 10)
-        ax4.set_ylabel('Valid Measurements', fontsize = 10)
-        ax4.set_xlim(left = np.min(Delay), right = np.max(Delay))
-        ax4.set_ylim(bottom = 0, top = np.max(HitCnt)*1.1)
-else:
-    # Plot (1,1)
-    if Plot_TOTf_lin == 0:
-        exec("DataL = len(HitDataTOT%d)" % HistPulserTOT2)
-        if DataL:
-            exec("ax4.hist(HitDataTOT%d, bins = np.multiply(np.arange(512),LSB_TOTf_mean), align = 'left', edgecolor = 'k', color = 'royalblue')" % HistPulserTOT2)
-            exec("ax4.set_xlim(left = np.min(HitDataTOT%d)-4*LSB_TOTf_mean, right = np.max(HitDataTOT%d)+4*LSB_TOTf_mean)" % (HistPulserTOT2, HistPulserTOT2))
-            ax4.set_title('TOT Measurment for Pulser = %d' % HistPulserTOT2, fontsize = 11)
-            ax4.set_xlabel('TOT Measurement [ps]', fontsize = 10)
+        # Plot (1,1)
+        if Plot_TOTf_lin == 0:
+            TOT, TOTf, TOTc, counts = TotSteps[HistPulserTOT2]
+            if counts.sum():
+                ax4.hist(TOT, weights = counts, bins = np.multiply(np.arange(512),LSB_TOTf_mean), align = 'left', edgecolor = 'k', color = 'royalblue')
+                ax4.set_xlim(left = np.min(TOT[counts > 0])-4*LSB_TOTf_mean, right = np.max(TOT[counts > 0])+4*LSB_TOTf_mean)
+                ax4.set_title('TOT Measurment for Pulser = %d' % HistPulserTOT2, fontsize = 11)
+                ax4.set_xlabel('TOT Measurement [ps]', fontsize = 10)
+                ax4.set_ylabel('N of Measrements', fontsize = 10)
+                ax4.legend(['Mean = %f ps \nStd. Dev. = %f ps \nN of Events = %d' % (DataMeanTOT[HistPulserTOT2_index], DataStdevTOT[HistPulserTOT2_index], ValidTOTCnt[HistPulserTOT2_index])], loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
+        else:
+            ax4.hist(np.arange(16), weights = TOTf_cumulative, bins = np.arange(9), edgecolor = 'k', color = 'royalblue')
+            ax4.set_xlim(left = -1, right = 8)
+            ax4.grid(True)
+            ax4.set_title('TOT Fine Interpolation Linearity', fontsize = 11)
+            ax4.set_xlabel('TOT Fine Code', fontsize = 10)
             ax4.set_ylabel('N of Measrements', fontsize = 10)
-            ax4.legend(['Mean = %f ps \nStd. Dev. = %f ps \nN of Events = %d' % (DataMeanTOT[HistPulserTOT2_index], DataStdevTOT[HistPulserTOT2_index], ValidTOTCnt[HistPulserTOT2_index])], loc = 'upper right', fontsize = 9, markerfirst = False, markerscale = 0, handlelength = 0)
-    else:
-        ax4.hist(HitDataTOTf_cumulative, bins = np.arange(9), edgecolor = 'k', color = 'royalblue')
-        ax4.set_xlim(left = -1, right = 8)
-        ax4.grid(True)
-        ax4.set_title('TOT Fine Interpolation Linearity', fontsize = 11)
-        ax4.set_xlabel('TOT Fine Code', fontsize = 10)
-        ax4.set_ylabel('N of Measrements', fontsize = 10)
-
-plt.subplots_adjust(hspace = 0.35, wspace = 0.2)
-plt.show()
-#################################################################
 
-input("Press Enter to continue...")
-top.stop()
-exit()  
+    plt.subplots_adjust(hspace = 0.35, wspace = 0.2)
+    plt.show()
+    #################################################################
+
+    input("Press Enter to continue...")
+    top.stop()
+    exit()  